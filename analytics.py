@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+"""
+Statistiques de production du banc
+Calcule en SQL le débit (cartes/heure), les percentiles de durée par étape, le rendement
+au premier passage, les taux de reprise et les statistiques des mesures, puis les affiche
+ou les exporte en CSV / Parquet.
+
+Exemples :
+    python analytics.py summary --start 2026-01-01 --group-by version
+    python analytics.py steps --of 12345 --output export --format parquet
+"""
+
+import argparse
+import csv
+import os
+import sys
+from datetime import date, datetime, timedelta
+from modules.capsys_mysql_command.capsys_mysql_command import (GenericDatabaseManager, DatabaseConfig) # Custom
+
+# Operator retries logged by s04 at the end of a log line, "Tentative 2/3" (self-test) or "Tentative de mesure AT 2/3"
+# (the first attempt is not a retry). The automatic ping attempts of s05 ("Tentative 2/3...") are not counted.
+RETRY_PATTERN = "(?m)Tentative (de mesure AT )?[2-9][0-9]*/[0-9]+$"
+RETRY_MARKER = "§"
+
+# Boards separated by more than this gap are not counted in the cycle time (breaks, shift changes)
+DEFAULT_MAX_GAP_MIN = 15
+
+GROUP_EXPRESSIONS = {
+    "day": "DATE(d.date)",
+    "week": "YEARWEEK(d.date, 3)",
+    "of": "d.of",
+    "version": (
+        "(SELECT c.val_char FROM step_name s JOIN skvp_char c ON c.step_name_id = s.id "
+        "WHERE s.device_under_test_id = d.id AND c.`key` = 'VERSION' LIMIT 1)"
+    ),
+}
+
+PERCENTILES = (0.5, 0.9, 0.95)
+
+
+def build_filters(args):
+    """Retourne la clause WHERE sur device_under_test (alias d) et ses paramètres"""
+    end = args.end or date.today()
+    start = args.start or end - timedelta(days=args.days)
+    clauses = ["d.date >= %s", "d.date < %s"]
+    params = [start, end + timedelta(days=1)]
+    if args.of:
+        clauses.append("d.of = %s")
+        params.append(args.of)
+    if args.product_id:
+        clauses.append("d.product_id = %s")
+        params.append(args.product_id)
+    return " AND ".join(clauses), params
+
+
+def summary_query(args):
+    """Débit, rendement au premier passage et taux de reprise par groupe"""
+    where, params = build_filters(args)
+    query = f"""
+        WITH boards AS (
+            SELECT d.id, d.date, d.result, {GROUP_EXPRESSIONS[args.group_by]} AS grp,
+                TIMESTAMPDIFF(SECOND, LAG(d.date) OVER (ORDER BY d.date, d.id), d.date) AS gap_s,
+                (SELECT c.val_char FROM step_name s JOIN skvp_char c ON c.step_name_id = s.id
+                    WHERE s.device_under_test_id = d.id AND c.`key` = 'mac_address' LIMIT 1) AS mac,
+                COALESCE((SELECT CHAR_LENGTH(REGEXP_REPLACE(l.value, %s, %s))
+                    - CHAR_LENGTH(REPLACE(REGEXP_REPLACE(l.value, %s, %s), %s, ''))
+                    FROM log l WHERE l.device_under_test_id = d.id LIMIT 1), 0) AS retries
+            FROM device_under_test d
+            WHERE {where}
+        ), ranked AS (
+            SELECT b.*, CASE WHEN b.mac IS NULL THEN 1
+                ELSE ROW_NUMBER() OVER (PARTITION BY b.mac ORDER BY b.date, b.id) END AS attempt
+            FROM boards b
+        )
+        SELECT grp AS `group`,
+            COUNT(*) AS boards,
+            SUM(result = 1) AS ok,
+            ROUND(SUM(result = 1) / COUNT(*), 4) AS yield,
+            ROUND(SUM(result = 1 AND retries = 0 AND attempt = 1) / COUNT(*), 4) AS first_pass_yield,
+            ROUND(SUM(retries > 0) / COUNT(*), 4) AS retry_rate,
+            ROUND(AVG(retries), 3) AS retries_per_board,
+            ROUND(SUM(attempt > 1) / COUNT(*), 4) AS retest_rate,
+            ROUND(AVG(CASE WHEN gap_s <= %s THEN gap_s END), 1) AS mean_cycle_s,
+            ROUND(SUM(gap_s <= %s) / NULLIF(SUM(CASE WHEN gap_s <= %s THEN gap_s END) / 3600, 0), 2) AS boards_per_hour,
+            MIN(date) AS first_board,
+            MAX(date) AS last_board
+        FROM ranked
+        GROUP BY grp
+        ORDER BY MIN(date)
+    """
+    max_gap_s = args.max_gap * 60
+    # Each retry is replaced by one marker character, the number of markers is the number of retries
+    retry_params = [RETRY_PATTERN, RETRY_MARKER, RETRY_PATTERN, RETRY_MARKER, RETRY_MARKER]
+    return query, retry_params + params + [max_gap_s, max_gap_s, max_gap_s]
+
+
+def hourly_query(args):
+    """Nombre de cartes testées par heure"""
+    where, params = build_filters(args)
+    query = f"""
+        SELECT DATE_FORMAT(d.date, '%%Y-%%m-%%d %%H:00') AS hour,
+            COUNT(*) AS boards,
+            SUM(d.result = 1) AS ok,
+            SUM(d.result <> 1) AS nok
+        FROM device_under_test d
+        WHERE {where}
+        GROUP BY hour
+        ORDER BY hour
+    """
+    return query, params
+
+
+def steps_query(args):
+    """
+    Percentiles de durée par étape, lus dans la valeur cycle_timing (étape s01) de chaque carte.
+    La ligne (cycle) reprend steps_s, temps des étapes où les étapes parallèles ne comptent qu'une fois
+    """
+    where, params = build_filters(args)
+    percentile_columns = ",\n            ".join(
+        f"MIN(CASE WHEN rn >= CEIL({p} * n) THEN duration_s END) AS p{int(p * 100)}_s" for p in PERCENTILES
+    )
+    query = f"""
+        WITH timings AS (
+            SELECT j.name, j.duration_s, j.machine_s, j.operator_s
+            FROM device_under_test d
+            JOIN step_name s ON s.device_under_test_id = d.id
+            JOIN skvp_json k ON k.step_name_id = s.id AND k.`key` = 'cycle_timing'
+            CROSS JOIN JSON_TABLE(k.val_json, '$.steps[*]' COLUMNS (
+                name VARCHAR(64) PATH '$.name',
+                duration_s DOUBLE PATH '$.duration_s',
+                machine_s DOUBLE PATH '$.machine_s',
+                operator_s DOUBLE PATH '$.operator_s'
+            )) AS j
+            WHERE {where}
+            UNION ALL
+            SELECT '(cycle)', JSON_EXTRACT(k.val_json, '$.steps_s') + 0,
+                JSON_EXTRACT(k.val_json, '$.machine_s') + 0, JSON_EXTRACT(k.val_json, '$.operator_s') + 0
+            FROM device_under_test d
+            JOIN step_name s ON s.device_under_test_id = d.id
+            JOIN skvp_json k ON k.step_name_id = s.id AND k.`key` = 'cycle_timing'
+            WHERE {where}
+        ), ranked AS (
+            SELECT t.*,
+                ROW_NUMBER() OVER (PARTITION BY name ORDER BY duration_s) AS rn,
+                COUNT(*) OVER (PARTITION BY name) AS n
+            FROM timings t
+        )
+        SELECT name AS step,
+            n AS boards,
+            ROUND(AVG(duration_s), 3) AS mean_s,
+            ROUND(AVG(machine_s), 3) AS machine_mean_s,
+            ROUND(AVG(operator_s), 3) AS operator_mean_s,
+            {percentile_columns},
+            MAX(duration_s) AS max_s
+        FROM ranked
+        GROUP BY name, n
+        ORDER BY name
+    """
+    return query, params + params
+
+
+def measurements_query(args):
+    """Statistiques et taux d'échec de chaque mesure de skvp_float"""
+    where, params = build_filters(args)
+    query = f"""
+        SELECT f.`key`, f.unit,
+            COUNT(*) AS n,
+            ROUND(AVG(f.val_float), 4) AS mean,
+            ROUND(STDDEV_SAMP(f.val_float), 4) AS std,
+            MIN(f.val_float) AS min,
+            MAX(f.val_float) AS max,
+            ROUND(SUM(f.valid = 0 AND (f.min_configured IS NOT NULL OR f.max_configured IS NOT NULL)) / COUNT(*), 4) AS fail_rate
+        FROM device_under_test d
+        JOIN step_name s ON s.device_under_test_id = d.id
+        JOIN skvp_float f ON f.step_name_id = s.id
+        WHERE {where}
+        GROUP BY f.`key`, f.unit
+        ORDER BY f.`key`
+    """
+    return query, params
+
+
+REPORTS = {
+    "summary": summary_query,
+    "hourly": hourly_query,
+    "steps": steps_query,
+    "measurements": measurements_query,
+}
+
+
+def run_query(connection, query, params):
+    """Exécute une requête d'agrégation et retourne (colonnes, lignes)"""
+    cursor = connection.cursor()
+    try:
+        cursor.execute(query, tuple(params))
+        columns = [d[0] for d in cursor.description]
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    return columns, rows
+
+
+def print_table(title, columns, rows):
+    """Affiche un rapport sous forme de tableau aligné"""
+    print(f"\n=== {title} ===")
+    if not rows:
+        print("Aucune donnée sur la période.")
+        return
+    cells = [[("" if v is None else str(v)) for v in row] for row in rows]
+    widths = [max(len(c), *(len(row[i]) for row in cells)) for i, c in enumerate(columns)]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    print("  ".join("-" * w for w in widths))
+    for row in cells:
+        print("  ".join(v.ljust(w) for v, w in zip(row, widths)))
+
+
+def export_report(name, columns, rows, output_dir, fmt):
+    """Exporte un rapport en CSV ou en Parquet (pyarrow requis pour le Parquet)"""
+    os.makedirs(output_dir, exist_ok=True)
+    if fmt == "csv":
+        path = os.path.join(output_dir, f"{name}.csv")
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f, delimiter=";")
+            writer.writerow(columns)
+            writer.writerows(rows)
+    else:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("Le format parquet nécessite le paquet pyarrow (pip install pyarrow).")
+        data = {c: [row[i] for row in rows] for i, c in enumerate(columns)}
+        # Decimal values returned by MySQL aggregates are stored as float columns
+        for c, values in data.items():
+            if any(v is not None and type(v).__name__ == "Decimal" for v in values):
+                data[c] = [None if v is None else float(v) for v in values]
+        path = os.path.join(output_dir, f"{name}.parquet")
+        pq.write_table(pa.table(data), path)
+    print(f"✓ {name} exporté dans {path}")
+
+
+def parse_date(value):
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def main():
+    """Fonction principale avec gestion des arguments"""
+    parser = argparse.ArgumentParser(
+        description="Statistiques de production du banc de test CAPSYS (calculs faits en SQL)"
+    )
+    parser.add_argument(
+        "reports",
+        nargs="*",
+        help="Rapports à calculer : " + ", ".join(REPORTS) + " (tous par défaut)"
+    )
+    parser.add_argument("--start", type=parse_date, help="Date de début incluse (AAAA-MM-JJ)")
+    parser.add_argument("--end", type=parse_date, help="Date de fin incluse (AAAA-MM-JJ), aujourd'hui par défaut")
+    parser.add_argument("--days", type=int, default=7, help="Nombre de jours analysés si --start est absent (7 par défaut)")
+    parser.add_argument("--of", help="Limiter à un OF")
+    parser.add_argument("--product-id", help="Limiter à un product_list_id")
+    parser.add_argument("--group-by", choices=list(GROUP_EXPRESSIONS), default="day", help="Regroupement du rapport summary (day par défaut)")
+    parser.add_argument("--max-gap", type=float, default=DEFAULT_MAX_GAP_MIN, help=f"Écart max entre deux cartes compté dans le temps de cycle, en minutes ({DEFAULT_MAX_GAP_MIN} par défaut)")
+    parser.add_argument("--output", help="Dossier d'export des rapports (affichage seul si absent)")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv", help="Format d'export (csv par défaut)")
+    parser.add_argument("--user", default="root")
+    parser.add_argument("--password", default="root")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", default="3306")
+    parser.add_argument("--database", default="capsys_db_bdt")
+
+    args = parser.parse_args()
+    reports = args.reports or list(REPORTS)
+    unknown = [name for name in reports if name not in REPORTS]
+    if unknown:
+        parser.error(f"Rapport(s) inconnu(s) : {', '.join(unknown)}")
+
+    db = GenericDatabaseManager(
+        DatabaseConfig(user=args.user, password=args.password, host=args.host, port=int(args.port), database=args.database),
+        debug=False
+    )
+    db.connect()
+    try:
+        connection = getattr(db, "connection", None)
+        if connection is None:
+            print("Erreur: Connexion MySQL indisponible")
+            sys.exit(1)
+        for name in reports:
+            query, params = REPORTS[name](args)
+            columns, rows = run_query(connection, query, params)
+            print_table(name, columns, rows)
+            if args.output:
+                export_report(name, columns, rows, args.output, args.format)
+    except ValueError as e:
+        print(f"Erreur: {e}")
+        sys.exit(1)
+    finally:
+        db.disconnect()
+
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+Chargement du contexte du banc (opérateur, produit, composition du banc, périphériques externes,
+scripts et paramètres) en trois requêtes au lieu d'une requête par ligne. Les scripts ont leur
+propre requête : jointe aux paramètres, chaque ligne de script renverrait tous les fichiers de paramètres.
+"""
+
+import json
+from dataclasses import dataclass, field
+from typing import Any, Optional
+import configuration  # Custom
+from drivers import Operator  # Custom
+
+# Columns used to split a joined row back into one dict per table
+_SPLIT_MARKER = "#"
+
+_QUERY_PRODUCT = (
+    "SELECT pl.*, NULL AS `#operator`, op.*, NULL AS `#bench_composition`, bc.*, NULL AS `#external_device`, ed.* "
+    "FROM product_list pl "
+    "LEFT JOIN operator op ON op.name = %s "
+    "LEFT JOIN bench_composition bc ON bc.bench_composition_id = pl.bench_composition_id "
+    "LEFT JOIN external_device ed ON ed.id = bc.external_device_id "
+    "WHERE pl.id = %s"
+)
+
+_QUERY_PARAMETERS = (
+    "SELECT pg.*, NULL AS `#parameters`, p.* "
+    "FROM product_list pl "
+    "LEFT JOIN parameters_group pg ON pg.parameters_group_id = pl.parameters_group_id "
+    "LEFT JOIN parameters p ON p.id = pg.parameters_id "
+    "WHERE pl.id = %s"
+)
+
+# A script without valid flag (NULL) is valid, as in _load_by_row
+_QUERY_SCRIPT = "SELECT s.* FROM script s WHERE s.product_list_id = %s AND COALESCE(s.valid, 1) <> 0"
+
+# Tables whose rows are covered by the fingerprint, their columns are read once from information_schema
+_FINGERPRINT_TABLES = ("product_list", "operator", "bench_composition", "external_device", "script", "parameters_group", "parameters")
+
+_QUERY_COLUMNS = (
+    "SELECT TABLE_NAME, COLUMN_NAME FROM information_schema.COLUMNS "
+    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN (" + ", ".join(["%s"] * len(_FINGERPRINT_TABLES)) + ") "
+    "ORDER BY TABLE_NAME, ORDINAL_POSITION"
+)
+
+# Fingerprint query built by _fingerprint_query() from the columns of the tables
+_query_fingerprint: Optional[str] = None
+
+@dataclass
+class BenchContext:
+    """Static data of the bench for a product_list, as stored in the database."""
+    operator: Any
+    product_list: dict
+    bench_composition: list[dict] = field(default_factory=list)
+    external_devices: list[dict] = field(default_factory=list)
+    script: list[dict] = field(default_factory=list)
+    parameters_group: list[dict] = field(default_factory=list)
+    parameters: list[dict] = field(default_factory=list)
+    operator_name: str = ""
+    fingerprint: Optional[tuple] = None
+    config_json: Optional[dict] = None
+
+    @property
+    def operator_id(self) -> int:
+        return self.operator.id
+
+    def config_parameter(self) -> Optional[dict]:
+        """Return the parameters row holding the config JSON of the product, or None if absent."""
+        for parameter in self.parameters:
+            if parameter.get("name") == configuration.CONFIG_JSON_NAME:
+                return parameter
+        return None
+
+    def load_config_json(self) -> dict:
+        """Parse the config JSON stored in the parameters table (only once per context)."""
+        if self.config_json is None:
+            parameter = self.config_parameter()
+            if parameter is None or parameter.get("file") is None:
+                raise ValueError("Le fichier config n'est pas présent dans la ddb.")
+            self.config_json = json.loads(parameter["file"])
+        return self.config_json
+
+    def to_dict(self) -> dict:
+        """Return the context as saved in skvp_json (data_used_for_test)."""
+        return {
+            "operator": self.operator.to_dict() if hasattr(self.operator, 'to_dict') else vars(self.operator),
+            "product_list": self.product_list,
+            "bench_composition": self.bench_composition,
+            "external_devices": self.external_devices,
+            "script": self.script,
+            "parameters_group": self.parameters_group,
+            "parameters": self.parameters,
+        }
+
+def _split_rows(cursor, tables: list[str]) -> dict[str, list[dict]]:
+    """Split the rows of a joined query on the marker columns and return the distinct rows of each table."""
+    columns = [d[0] for d in cursor.description]
+    result: dict[str, list[dict]] = {table: [] for table in tables}
+    seen: dict[str, set] = {table: set() for table in tables}
+    for row in cursor.fetchall():
+        current: dict = {}
+        segments = []
+        for column, value in zip(columns, row):
+            if column.startswith(_SPLIT_MARKER):
+                segments.append(current)
+                current = {}
+                continue
+            current[column] = value
+        segments.append(current)
+        for table, segment in zip(tables, segments):
+            if all(v is None for v in segment.values()):
+                continue  # No match for this LEFT JOIN
+            key = segment.get("id", tuple(sorted(segment.items(), key=lambda kv: kv[0])))
+            if key in seen[table]:
+                continue
+            seen[table].add(key)
+            result[table].append(segment)
+    return result
+
+def _load_joined(connection, operator_name: str, product_list_id) -> dict[str, list[dict]]:
+    """Fetch the whole context with two joined queries and the script query (the caller holds the database lock)."""
+    cursor = connection.cursor()
+    try:
+        cursor.execute(_QUERY_PRODUCT, (operator_name, product_list_id))
+        rows = _split_rows(cursor, ["product_list", "operator", "bench_composition", "external_device"])
+        cursor.execute(_QUERY_PARAMETERS, (product_list_id,))
+        rows.update(_split_rows(cursor, ["parameters_group", "parameters"]))
+        cursor.execute(_QUERY_SCRIPT, (product_list_id,))
+        rows.update(_split_rows(cursor, ["script"]))
+    finally:
+        cursor.close()
+    return rows
+
+def _load_by_row(db, operator_name: str, product_list_id) -> dict[str, list[dict]]:
+    """Fetch the context with the GenericDatabaseManager helpers, used when no raw connection is available."""
+    rows: dict[str, list[dict]] = {}
+    rows["operator"] = db.get_by_column("operator", "name", operator_name) or []
+    product_list = db.get_by_id("product_list", product_list_id)
+    rows["product_list"] = [product_list] if product_list else []
+    if not product_list:
+        return rows
+    rows["bench_composition"] = db.get_by_column("bench_composition", "bench_composition_id", product_list.get("bench_composition_id")) or []
+    rows["external_device"] = [d for d in (db.get_by_id("external_device", bc["external_device_id"]) for bc in rows["bench_composition"]) if d]
+    rows["script"] = [s for s in (db.get_by_column("script", "product_list_id", product_list_id) or []) if s.get("valid") != 0]
+    rows["parameters_group"] = db.get_by_column("parameters_group", "parameters_group_id", product_list.get("parameters_group_id")) or []
+    rows["parameters"] = [p for p in (db.get_by_id("parameters", g["parameters_id"]) for g in rows["parameters_group"]) if p]
+    return rows
+
+def load_bench_context(db, operator_name: str, product_list_id) -> BenchContext:
+    """
+    Load the bench context of a product_list.
+
+    Raises:
+        ValueError: if a mandatory part of the context is missing in the database.
+    """
+    connection = configuration.db_connection(db)
+    if connection is not None:
+        with configuration.db_lock(db):
+            rows = _load_joined(connection, operator_name, product_list_id)
+    else:
+        rows = _load_by_row(db, operator_name, product_list_id)
+
+    # The joined query starts from product_list: an unknown product returns no row at all, operator included
+    if not rows.get("product_list"):
+        raise ValueError("Aucun produit trouvé dans la base de données.")
+    if not rows.get("operator"):
+        raise ValueError(f"Aucun opérateur {operator_name} trouvé dans la base de données.")
+    if not rows.get("bench_composition"):
+        raise ValueError("Problème lors de la récupération de la composition du banc dans la base de données.")
+    if not rows.get("external_device"):
+        raise ValueError("Problème lors de la récupération des périphériques externes dans la base de données.")
+    if not rows.get("script"):
+        raise ValueError("Problème lors de la récupération du script dans la base de données.")
+    if not rows.get("parameters_group"):
+        raise ValueError("Problème lors de la récupération des groupes de paramètres dans la base de données.")
+    if not rows.get("parameters"):
+        raise ValueError("Problème lors de la récupération des paramètres dans la base de données.")
+
+    # Remove the "file" key because it's too large to store in the database
+    script = [{k: v for k, v in s.items() if k != "file"} for s in rows["script"]]
+
+    return BenchContext(
+        operator_name=operator_name,
+        operator=Operator(**rows["operator"][0]),
+        product_list=rows["product_list"][0],
+        bench_composition=rows["bench_composition"],
+        external_devices=rows["external_device"],
+        script=script,
+        parameters_group=rows["parameters_group"],
+        parameters=rows["parameters"],
+    )
+
+def _row_crc(alias: str, columns: list[str]) -> str:
+    """SQL expression of the CRC32 of a whole row (NULL columns are marked so that they differ from empty strings)."""
+    values = ", ".join(f"COALESCE({alias}.`{column}`, '#NULL')" for column in columns)
+    return f"CRC32(CONCAT_WS('|', {values}))"
+
+def _fingerprint_query(cursor) -> Optional[str]:
+    """
+    Build the query returning a cheap fingerprint of everything loaded by load_bench_context, or None
+    if the columns of a table can't be read.
+    Each row (product, operator, bench composition, external devices, valid scripts, parameters) is reduced to
+    the CRC32 of all its columns, so new, deleted and edited rows all change the fingerprint. Two contexts
+    giving the same sums of CRC32 are taken as identical.
+    """
+    global _query_fingerprint
+    if _query_fingerprint is None:
+        cursor.execute(_QUERY_COLUMNS, _FINGERPRINT_TABLES)
+        columns: dict[str, list[str]] = {table: [] for table in _FINGERPRINT_TABLES}
+        for table, column in cursor.fetchall():
+            table, column = (str(v, "utf-8") if isinstance(v, (bytes, bytearray)) else v for v in (table, column))
+            columns[table].append(column)
+        if not all(columns.values()):
+            return None
+        crc = {table: _row_crc(alias, columns[table]) for table, alias in (
+            ("product_list", "pl"), ("operator", "op"), ("bench_composition", "bc"), ("external_device", "ed"),
+            ("script", "s"), ("parameters_group", "pg"), ("parameters", "p"),
+        )}
+        _query_fingerprint = (
+            f"SELECT {crc['product_list']}, "
+            f"(SELECT COUNT(*) FROM operator op WHERE op.name = %s), "
+            f"(SELECT SUM({crc['operator']}) FROM operator op WHERE op.name = %s), "
+            f"(SELECT COUNT(*) FROM bench_composition bc WHERE bc.bench_composition_id = pl.bench_composition_id), "
+            f"(SELECT SUM({crc['bench_composition']}) FROM bench_composition bc WHERE bc.bench_composition_id = pl.bench_composition_id), "
+            f"(SELECT SUM({crc['external_device']}) FROM bench_composition bc JOIN external_device ed ON ed.id = bc.external_device_id "
+            f"WHERE bc.bench_composition_id = pl.bench_composition_id), "
+            f"(SELECT COUNT(*) FROM script s WHERE s.product_list_id = pl.id AND COALESCE(s.valid, 1) <> 0), "
+            f"(SELECT SUM({crc['script']}) FROM script s WHERE s.product_list_id = pl.id AND COALESCE(s.valid, 1) <> 0), "
+            f"(SELECT COUNT(*) FROM parameters_group pg WHERE pg.parameters_group_id = pl.parameters_group_id), "
+            f"(SELECT SUM({crc['parameters_group']} + {crc['parameters']}) FROM parameters_group pg JOIN parameters p ON p.id = pg.parameters_id "
+            f"WHERE pg.parameters_group_id = pl.parameters_group_id) "
+            f"FROM product_list pl WHERE pl.id = %s"
+        )
+    return _query_fingerprint
+
+def fetch_fingerprint(db, product_list_id, operator_name: str) -> Optional[tuple]:
+    """Return the fingerprint of the bench context of the operator, or None if it can't be computed."""
+    connection = configuration.db_connection(db)
+    if connection is None:
+        return None
+    with configuration.db_lock(db):
+        cursor = connection.cursor()
+        try:
+            query = _fingerprint_query(cursor)
+            if query is None:
+                return None
+            cursor.execute(query, (operator_name, operator_name, product_list_id))
+            row = cursor.fetchone()
+        finally:
+            cursor.close()
+    return tuple(row) if row else None
+
+def get_bench_context(config: configuration.AppConfig, operator_name: str) -> tuple[BenchContext, bool]:
+    """
+    Return the bench context of config.arg.product_list_id from the session cache (config.bench_context_cache),
+    reloading it only if its fingerprint changed in the database.
+
+    Returns:
+        (context, reused) where reused is True if the cached context was still valid.
+
+    Raises:
+        ValueError: if the context can't be loaded or its config JSON is invalid.
+    """
+    product_list_id = str(config.arg.product_list_id)
+    fingerprint = fetch_fingerprint(config.db, product_list_id, operator_name)
+    cached = config.bench_context_cache.get(product_list_id)
+    if (
+        cached is not None
+        and fingerprint is not None
+        and cached.fingerprint == fingerprint
+        and cached.operator_name == operator_name
+    ):
+        return cached, True
+    context = load_bench_context(config.db, operator_name, product_list_id)
+    context.load_config_json()  # Parsed before caching so that an invalid config is never reused
+    context.fingerprint = fingerprint
+    config.bench_context_cache[product_list_id] = context
+    return context, False
@@ -1,12 +1,13 @@
-import os, atexit
+import os, atexit, json, base64, tempfile, threading, functools
+from contextlib import nullcontext
 from enum import Enum
 from typing import Optional, Any
-from modules.capsys_mysql_command.capsys_mysql_command import (GenericDatabaseManager, DatabaseConfig) # Custom
-from modules.capsys_wrapper_tm_t20iii.capsys_wrapper_tm_t20III import PrinterDC  # Custom
-from modules.capsys_daq_manager.capsys_daq_manager import DAQManager  # Custom
-from modules.capsys_mcp23017.capsys_mcp23017 import MCP23017, MCP23017Manager  # Custom
-from modules.capsys_serial_instrument_manager.capsys_serial_instrument_manager import SerialInstrumentManager  # Custom
-from modules.capsys_brady_manager.capsys_brady_manager import BradyBP12Printer  # Custom
+from modules.capsys_serial_instrument_manager.capsys_serial_instrument_manager import SerialInstrumentManager  # Custom (base class, imported at startup)
+from drivers import GenericDatabaseManager, DatabaseConfig, PrinterDC, DAQManager, MCP23017, MCP23017Manager, BradyBP12Printer  # Custom (imported on first use)
+from step_timing import CycleTimer, PHASE_DB, PHASE_OPERATOR, PHASE_SERIAL, timed  # Custom
+from serial_protocol import SerialProtocol  # Custom
+from serial_ports import port_pool, port_key  # Custom
+from simulators import simulation, SimulatedSerialUsbDut  # Custom
 
 # Initialize global variables
 CURRENT_PATH = os.path.dirname(__file__)
@@ -17,12 +18,45 @@ VERSION = "V1.0.0"
 HASH_GIT = "DEBUG" # Will be replaced by the Git hash when compiled with command .\build.bat
 AUTHOR = "Thomas GERARDIN"
 PRINTER_NAME = "EPSON TM-T20III Receipt"
+LOG_DIR = os.path.join(tempfile.gettempdir(), "log_banc_de_test_capsys")
+SKVP_JOURNAL_PATH = os.path.join(LOG_DIR, "skvp_journal.jsonl")
+PROGRAMMER_PORT_DEFAULT = "usb1"  # Port of the ST-LINK given to STM32_Programmer_CLI
 
 def get_project_path(*paths):
     """Return the absolute path from the project root, regardless of current working directory."""
     return os.path.abspath(os.path.join(os.path.dirname(__file__), *paths))
 
-def request_user_input(config, title: str, message: str, font_size: int = 14) -> Optional[str]:
+def slot_path(path: str, slot=None) -> str:
+    """Local file of a slot, e.g. skvp_journal.jsonl -> skvp_journal_slot2.jsonl. The first slot keeps the path of the single board bench."""
+    if slot is None or slot.index == 0:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}_slot{slot.index + 1}{ext}"
+
+class UserInputRequest:
+    """Blocking handoff between the test thread waiting for an answer and the GUI dialog."""
+    def __init__(self):
+        self._event = threading.Event()
+        self.text: Optional[str] = None
+        self.cancelled = False
+
+    def set_result(self, text: Optional[str]):
+        """Called by the GUI thread with the text entered, or None if the dialog was cancelled."""
+        if not self._event.is_set():
+            self.text = text
+            self._event.set()
+
+    def cancel(self):
+        """Release the waiting thread with no answer (test stopped)."""
+        if not self._event.is_set():
+            self.cancelled = True
+            self._event.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until an answer or a cancellation, returns False on timeout."""
+        return self._event.wait(timeout)
+
+def request_user_input(config, title: str, message: str, font_size: int = 14, timeout: Optional[float] = None) -> Optional[str]:
     """
     Request text input from the user.
     
@@ -34,44 +68,61 @@ def request_user_input(config, title: str, message: str, font_size: int = 14) ->
         title: Title of the dialog box (GUI mode only)
         message: Message to display to the user
         font_size: Font size for the message (default: 14)
+        timeout: Maximum time to wait in seconds, None to wait without limit (GUI mode only)
     
     Returns:
-        The text entered by the user, or None if cancelled
+        The text entered by the user, or None if cancelled, timed out or if the test was stopped
     """
-    import time
-    
-    user_input_result = {"text": None, "received": False}
-    
-    def handle_user_input(text):
-        user_input_result["text"] = text
-        user_input_result["received"] = True
-    
     if config.test_thread is not None:
-        # GUI mode with dialog box
-        config.test_thread.request_user_text_input(title, message, handle_user_input, font_size)
-        
-        # Wait for user input (without timeout)
-        while not user_input_result["received"]:
-            time.sleep(0.1)
-        
-        return user_input_result["text"]
+        # GUI mode with dialog box, the test thread blocks on an event set by the dialog callback.
+        # Steps running at the same time ask their questions one after the other.
+        with config.cycle_timer.phase(PHASE_OPERATOR), config.user_input_lock:
+            request = UserInputRequest()
+            config.pending_user_input = request
+            if not getattr(config.test_thread, "running", True):
+                request.cancel()  # Stop requested before the request was registered
+            try:
+                config.test_thread.request_user_text_input(title, message, request.set_result, font_size)
+                answered = request.wait(timeout)
+                if not answered or request.cancelled:
+                    # Timeout or test stopped: close the dialog if it is still open
+                    request.cancel()
+                    config.test_thread.close_user_text_input()
+                    return None
+            finally:
+                config.pending_user_input = None
+            return request.text
     else:
         # Debug mode with console input
-        user_text = input(message + " ")
+        with config.cycle_timer.phase(PHASE_OPERATOR):
+            user_text = input(message + " ")
         return user_text if user_text else None
 
 class SerialUsbDut(SerialInstrumentManager):
-    def __init__(self, port=None, baudrate=115200, timeout=1, debug=False):
+    def __init__(self, port=None, baudrate=115200, timeout=1, debug=False, timer: Optional[CycleTimer] = None):
         SerialInstrumentManager.__init__(self, port, baudrate, timeout, debug)
+        self.timer = timer  # Time spent in the commands is added to the serial phase of the current step
         self._debug_log("DUT initialized")
 
     def get_valid(self, sn=None) -> bool:
         # TODO
         return True
     
+    def send_command(self, command: str, expected_response: str = "", exact_match: bool = False, timeout: float = 0, read_until: str = "") -> str:
+        with timed(self.timer, PHASE_SERIAL):
+            return super().send_command(command, expected_response, exact_match, timeout, read_until)
+
     def send_command_Cr(self, command: str, expected_response: str = "", exact_match: bool = False, timeout: float = 0, read_until: str = "") -> str:
-        return super().send_command(command + "\n", expected_response, exact_match, timeout, read_until)
-    
+        return self.send_command(command + "\n", expected_response, exact_match, timeout, read_until)
+
+    @property
+    def protocol(self) -> SerialProtocol:
+        """Streaming line protocol over the pyserial port opened by SerialInstrumentManager."""
+        return SerialProtocol(self.ser, self.timer)
+
+if simulation is not None:
+    SerialUsbDut = SimulatedSerialUsbDut  # type: ignore[misc]  # Scripted DUT, see simulators.py
+
 class DAQPin(Enum):
     """
     Enumerates DAQ USB 6000 pin assignments for various signals and measurements.
@@ -80,6 +131,7 @@ class DAQPin(Enum):
     I2C_SCL = "port0/line0"  # SCL (clock) – yellow wire
     I2C_SDA_OUT = "port0/line1"  # SDA output – blue wire
     I2C_SDA_IN = "port0/line2"  # SDA input – blue wire - read for ACK
+    I2C_SCL_SDA_OUT = "port0/line0:1"  # SCL + SDA output of i2c_waveform.DaqmxI2CBackend (bit 0 = SCL, bit 1 = SDA), not used by the bench yet
     P03 = "port0/line3"  # Not used
     AI0 = "ai0"  # Not used
     AI1 = "ai1"  # Not used
@@ -97,20 +149,25 @@ class MCP23017Pin(Enum):
     Used with RL40004-24 Numato Lab.
     https://numato.com/product/8-channel-relay-controller-board/
     """
-    EN_AUTOMATIC_24V = (0x20, MCP23017.Pin.B0, 'out')  # Pin A0 Relay 0
-    EN_24V = (0x20, MCP23017.Pin.B1, 'out')  # Pin A1 Relay 1
-    EN_AUTOMATIC_BTL = (0x20, MCP23017.Pin.B2, 'out')  # Pin A2 Relay 2
-    EN_BTL = (0x20, MCP23017.Pin.B3, 'out')  # Pin A3 Relay 3
-    B4 = (0x20, MCP23017.Pin.B4, 'out')  # Pin B4 Relay 4 not used
-    EN_VCC_USB = (0x20, MCP23017.Pin.B5, 'out')  # Pin B5 Relay 5 Vcc USB
-    EN_GND_IVE1_IVE2_IVF_2 = (0x20, MCP23017.Pin.B6, 'out')  # Pin B6 Relay 6
-    EN_AUTOMATIC_GND_IVE1_IVE2_IVF = (0x20, MCP23017.Pin.B7, 'out')  # Pin B7 Relay 7
-
-    def __init__(self, mcp_addr, pin, mode):
+    EN_AUTOMATIC_24V = (0x20, "B0", 'out')  # Pin A0 Relay 0
+    EN_24V = (0x20, "B1", 'out')  # Pin A1 Relay 1
+    EN_AUTOMATIC_BTL = (0x20, "B2", 'out')  # Pin A2 Relay 2
+    EN_BTL = (0x20, "B3", 'out')  # Pin A3 Relay 3
+    B4 = (0x20, "B4", 'out')  # Pin B4 Relay 4 not used
+    EN_VCC_USB = (0x20, "B5", 'out')  # Pin B5 Relay 5 Vcc USB
+    EN_GND_IVE1_IVE2_IVF_2 = (0x20, "B6", 'out')  # Pin B6 Relay 6
+    EN_AUTOMATIC_GND_IVE1_IVE2_IVF = (0x20, "B7", 'out')  # Pin B7 Relay 7
+
+    def __init__(self, mcp_addr, pin_name, mode):
         self.mcp_addr = mcp_addr
-        self.pin = pin
+        self.pin_name = pin_name  # Name of the MCP23017.Pin member, e.g. "B6"
         self.mode = mode
 
+    @property
+    def pin(self):
+        """MCP23017.Pin member, the MCP23017 module is only imported when it is needed."""
+        return getattr(MCP23017.Pin, self.pin_name)
+
 class ConfigItems:
     """Container for all configuration items used in the test sequence."""
     key_map = {
@@ -133,7 +190,10 @@ class ConfigItems:
                     key=json_key,
                     path=item.get("path", ""),
                     port=item.get("port", ""),
-                    name=item.get("name", "")
+                    name=item.get("name", ""),
+                    vid=item.get("vid", ""),
+                    pid=item.get("pid", ""),
+                    serial_number=item.get("serial_number", "")
                 )
             )
 
@@ -144,13 +204,19 @@ class ConfigItems:
             key = "",
             path = "",
             port = "",
-            name = ""
+            name = "",
+            vid = "",
+            pid = "",
+            serial_number = ""
         ):
             """Initialize a ConfigItem with optional parameters for test configuration."""
             self.key = key
             self.path = path
             self.port = port
             self.name = name
+            self.vid = vid  # USB identity of a serial port (hexadecimal), see serial_ports.py
+            self.pid = pid
+            self.serial_number = serial_number
     
     def __init__(self):
         """Initialize all ConfigItem attributes for different test parameters."""
@@ -158,6 +224,170 @@ class ConfigItems:
         self.mac_adress_file = self.ConfigItem()
         self.dut = self.ConfigItem()
 
+class LockedDatabase:
+    """
+    GenericDatabaseManager shared by the steps running at the same time: every method call is made under one lock.
+    The raw connection returned by db_connection() must be used under the same lock (db_lock()).
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.lock = threading.RLock()
+
+    def __getattr__(self, name: str):
+        value = getattr(self.db, name)
+        if not callable(value):
+            return value
+
+        @functools.wraps(value)
+        def locked(*args, **kwargs):
+            with self.lock:
+                return value(*args, **kwargs)
+        return locked
+
+def db_connection(db):
+    """Return the raw MySQL connection held by a GenericDatabaseManager, or None if not available."""
+    return getattr(db, "connection", None)
+
+def db_lock(db):
+    """Lock of a LockedDatabase, or a no-op context for a manager used by a single thread (scripts run directly)."""
+    return db.lock if isinstance(db, LockedDatabase) else nullcontext()
+
+class MeasurementSink:
+    """
+    Write-behind queue for the skvp_float / skvp_char / skvp_json / skvp_file rows.
+
+    Rows are kept in memory and written as one multi-row INSERT per table when flush() is called
+    (step boundaries and fin_du_test). Every queued row is also appended to a local journal so
+    that nothing is lost if the process dies before the flush: the journal is replayed on the next start.
+    """
+    TABLES = ("skvp_float", "skvp_char", "skvp_json", "skvp_file")
+
+    def __init__(self, journal_path: str = SKVP_JOURNAL_PATH):
+        self.journal_path = journal_path
+        self.pending: list[tuple[str, dict]] = []
+        self._lock = threading.Lock()
+        self._journal = None
+        self._recover_journal()
+
+    def queue(self, table: str, data: dict):
+        """Queue a row for the given skvp table and append it to the journal."""
+        if table not in MeasurementSink.TABLES:
+            raise ValueError(f"Table {table} non gérée par le MeasurementSink.")
+        with self._lock:
+            self.pending.append((table, data))
+            try:
+                if self._journal is None:
+                    os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+                    self._journal = open(self.journal_path, "a", encoding="utf-8")
+                self._journal.write(json.dumps({"table": table, "data": data}, default=MeasurementSink._encode) + "\n")
+                self._journal.flush()
+            except OSError as e:
+                print(f"Erreur lors de l'écriture du journal skvp : {e}")
+
+    def flush(self, db) -> int:
+        """Insert all queued rows in the database and return the number of rows written."""
+        with self._lock:
+            if not self.pending:
+                return 0
+            # Group rows sharing the same table and columns so they fit in one INSERT
+            groups: dict[tuple, list[dict]] = {}
+            for table, data in self.pending:
+                groups.setdefault((table, tuple(data.keys())), []).append(data)
+            written = 0
+            try:
+                for (table, columns), rows in groups.items():
+                    MeasurementSink._insert_rows(db, table, list(columns), rows)
+                    written += len(rows)
+                    self.pending = [(t, d) for t, d in self.pending if not (t == table and tuple(d.keys()) == columns)]
+            finally:
+                self._rewrite_journal()
+            return written
+
+    def close(self):
+        """Close the journal file handle, pending rows stay in the journal."""
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    @staticmethod
+    def _insert_rows(db, table: str, columns: list[str], rows: list[dict]):
+        """Insert rows with a single multi-row INSERT, falling back to db.create() if no raw connection is available."""
+        connection = db_connection(db)
+        if connection is None:
+            for row in rows:
+                db.create(table, row)
+            return
+        placeholders = "(" + ", ".join(["%s"] * len(columns)) + ")"
+        query = (
+            f"INSERT INTO `{table}` (" + ", ".join(f"`{c}`" for c in columns) + ") VALUES "
+            + ", ".join([placeholders] * len(rows))
+        )
+        params = []
+        for row in rows:
+            for column in columns:
+                value = row[column]
+                params.append(json.dumps(value, ensure_ascii=False, default=str) if isinstance(value, (dict, list)) else value)
+        with db_lock(db):
+            cursor = connection.cursor()
+            try:
+                cursor.execute(query, params)
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    @staticmethod
+    def _encode(value):
+        """JSON encoder for the journal (bytes are stored in base64)."""
+        if isinstance(value, bytes):
+            return {"__bytes__": base64.b64encode(value).decode("ascii")}
+        return str(value)
+
+    @staticmethod
+    def _decode(obj):
+        """JSON decoder hook for the journal."""
+        if "__bytes__" in obj and len(obj) == 1:
+            return base64.b64decode(obj["__bytes__"])
+        return obj
+
+    def _recover_journal(self):
+        """Reload the rows left in the journal by a previous process."""
+        if not os.path.exists(self.journal_path):
+            return
+        try:
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line, object_hook=MeasurementSink._decode)
+                    except json.JSONDecodeError:
+                        continue  # Truncated last line if the process died while writing
+                    self.pending.append((entry["table"], entry["data"]))
+        except OSError as e:
+            print(f"Erreur lors de la lecture du journal skvp : {e}")
+
+    def _rewrite_journal(self):
+        """Rewrite the journal so that it only contains the rows not yet written to the database."""
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        try:
+            if not self.pending:
+                if os.path.exists(self.journal_path):
+                    os.remove(self.journal_path)
+                return
+            with open(self.journal_path, "w", encoding="utf-8") as f:
+                for table, data in self.pending:
+                    f.write(json.dumps({"table": table, "data": data}, default=MeasurementSink._encode) + "\n")
+        except OSError as e:
+            print(f"Erreur lors de la réécriture du journal skvp : {e}")
+
 class Arg:
     name = NAME_GUI
     version = VERSION
@@ -181,27 +411,52 @@ class Arg:
     script: Optional[str] = None
 
 class AppConfig:
-    def __init__(self):
+    def __init__(self, slot=None):
         self.arg = Arg()
+        self.slot = slot  # slots.SlotSettings in multi-slot mode, None for the single board bench
         self.test_thread: Any = None  # Reference to TestThread for user input requests
+        self.pending_user_input: Optional[UserInputRequest] = None  # Request waiting for the operator, cancelled by TestThread.stop()
+        self.user_input_lock = threading.Lock()  # One question to the operator at a time
         self.db_config: Optional[DatabaseConfig] = None
         self.db: Optional[GenericDatabaseManager] = None
         self.device_under_test_id: Optional[int] = None
+        self.initialisation_step_name_id: Optional[int] = None  # step_name row of s01, the cycle timing of the board is saved on it
         self.configItems = ConfigItems()
         self.first_test = True
+        self.measurement_specs: list = []  # measurement_specs.MeasurementSpec, loaded from the config JSON by s01
+        self.self_tests: list[str] = []  # Result lines of the DUT self-test (SELF_TESTS of the config JSON), loaded by s01
+        self.image_digests: dict[tuple, Any] = {}  # (path, size, mtime) -> stm32_programmer.ImageDigest, hashed once per session
+        self.bench_context_cache: dict[str, Any] = {}  # product_list_id -> bench_context.BenchContext, kept for the whole session
         self.µc_path: Optional[str] = None
+        self.hardware: Any = None  # hardware_session.HardwareSession, owns the DAQ and MCP23017 across test cycles
+        self.prepared_cycle: Any = None  # cycle_prefetch.PreparedCycle of the next board, taken by s01
         self.daq_port: Optional[str] = None
         self.daq_manager: Optional[DAQManager] = None
         self.mcp_manager: Optional[MCP23017Manager] = None
         self.serDut: Optional[SerialUsbDut] = None
         self.printer: Optional[PrinterDC] = None
         self.brady_printer: Optional[BradyBP12Printer] = None
+        self.measurement_sink = MeasurementSink(slot_path(SKVP_JOURNAL_PATH, slot))
+        self.cycle_timer = CycleTimer()  # Step and phase durations of the current test cycle
         atexit.register(self.cleanup) # Register cleanup function to be called on exit
 
     def cleanup(self):
         if self.db:
+            try:
+                self.flush_values()
+            except Exception as e:
+                print(f"Erreur lors de l'écriture des mesures en attente : {e}")
             self.db.disconnect()
             self.db = None
+        if self.hardware:
+            if self.slot is None or self.slot.index == 0:
+                self.hardware.close()
+            elif self.mcp_manager is not None:
+                # The session is shared with the other slots, only the relays of this slot are released
+                self.mcp_manager.write_pins({pin: False for pin in MCP23017Pin})
+            self.hardware = None
+            self.mcp_manager = None
+            self.daq_manager = None
         if self.mcp_manager:
             for pin in MCP23017Pin:
                 self.mcp_manager.digital_write(pin, False)
@@ -209,16 +464,27 @@ class AppConfig:
         if self.daq_manager:
             self.daq_manager.close_all()
             self.daq_manager = None
-        if self.serDut and self.serDut.is_connected():
-            self.serDut.close()
-            self.serDut = None
+        # The DUT port is kept open by the pool across boards, it is closed at the end of the session
+        port_pool.close(port_key(self.slot))
+        self.serDut = None
         self.device_under_test_id = None
         
-    def save_value(self, step_name_id: int, key: str, value, unit: str = "", min_value: Optional[float] = None, max_value: Optional[float] = None, valid: int = 0):
-        """Save a key-value pair in the database."""
+    def save_value(self, step_name_id: int, key: str, value, unit: str = "", min_value: Optional[float] = None, max_value: Optional[float] = None, valid: Optional[int] = None):
+        """
+        Queue a key-value pair for the database, it is written by the next flush_values().
+
+        For numeric values, the verdict is computed here from min_value/max_value when valid is not given,
+        so the row is inserted with its final "valid" column and no follow-up UPDATE is needed.
+        Returns the verdict stored with the row (None for non-numeric values).
+        """
         if not self.db or not self.device_under_test_id:
             raise ValueError("Database or device under test ID is not initialized.")
         if isinstance(value, float) or isinstance(value, int):
+            if valid is None:
+                if min_value is None and max_value is None:
+                    valid = 0
+                else:
+                    valid = int((min_value is None or value >= min_value) and (max_value is None or value <= max_value))
             table = "skvp_float"
             col = "val_float"
             data = {"step_name_id": step_name_id, "key": key, col: value, "unit": unit, "min_configured": min_value, "max_configured": max_value, "valid": valid}
@@ -236,5 +502,12 @@ class AppConfig:
             data = {"step_name_id": step_name_id, "key": key, col: value}
         else:
             raise ValueError("Type de valeur non supporté.")
-        id = self.db.create(table, data)
-        return id
\ No newline at end of file
+        self.measurement_sink.queue(table, data)
+        return valid
+
+    def flush_values(self) -> int:
+        """Write the queued skvp_* rows to the database and return the number of rows written."""
+        if not self.db:
+            return 0
+        with self.cycle_timer.phase(PHASE_DB):
+            return self.measurement_sink.flush(self.db)
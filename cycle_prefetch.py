@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Préparation de la carte suivante pendant que l'opérateur change de carte.
+
+Dès la fin d'un test, le contexte du banc est revalidé et le DAQ est vérifié. Au démarrage suivant,
+l'initialisation reprend le contexte au lieu de le relire. Une préparation non utilisée (produit ou
+opérateur différent, trop ancienne, contexte modifié en base) est abandonnée.
+Aucune ligne n'est écrite en base avant le démarrage : device_under_test et step_name sont créées
+par l'initialisation, les lecteurs de la base ne voient donc jamais de carte préparée.
+"""
+
+import time
+from dataclasses import dataclass
+from typing import Optional
+import configuration  # Custom
+from bench_context import BenchContext, get_bench_context, fetch_fingerprint  # Custom
+
+PREFETCH_MAX_AGE_S = 600  # A preparation older than this is dropped and s01 runs normally
+
+@dataclass
+class PreparedCycle:
+    """Bench context and DAQ status prepared for the next board."""
+    product_list_id: str
+    operator_name: str
+    context: BenchContext
+    reused: bool
+    step_name: str
+    daq_status: Optional[tuple] = None
+    prepared_at: float = 0.0
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.prepared_at
+
+def prepare_next_cycle(config: configuration.AppConfig, step_name: str) -> PreparedCycle:
+    """
+    Prepare the next board: bench context and DAQ health check, nothing is written in the database.
+    Must not run while a TestThread uses config.db.
+
+    Raises:
+        ValueError: if the bench context can't be loaded.
+    """
+    rollback_prepared_cycle(config)
+    operator_name = config.arg.operator.split()[1]
+    context, reused = get_bench_context(config, operator_name)
+    prepared = PreparedCycle(
+        product_list_id=str(config.arg.product_list_id),
+        operator_name=operator_name,
+        context=context,
+        reused=reused,
+        step_name=step_name,
+        prepared_at=time.monotonic(),
+    )
+    config.prepared_cycle = prepared
+
+    # Warm the hardware session: the DAQ is checked (or enumerated again), the relays are not switched while the board is swapped
+    if config.hardware is not None:
+        prepared.daq_status = config.hardware.connect_daq()
+        config.hardware.attach(config)
+    return prepared
+
+def take_prepared_cycle(config: configuration.AppConfig, operator_name: str, step_name: str) -> Optional[PreparedCycle]:
+    """
+    Return the preparation of this board if it is still valid.
+    An unusable preparation is dropped and None is returned.
+    """
+    prepared: Optional[PreparedCycle] = config.prepared_cycle
+    if prepared is None:
+        return None
+    if (
+        prepared.product_list_id != str(config.arg.product_list_id)
+        or prepared.operator_name != operator_name
+        or prepared.step_name != step_name
+        or prepared.age > PREFETCH_MAX_AGE_S
+        or fetch_fingerprint(config.db, prepared.product_list_id, prepared.operator_name) != prepared.context.fingerprint
+    ):
+        # Different board setup, too old, or the bench context changed in the database since the preparation
+        rollback_prepared_cycle(config)
+        return None
+    config.prepared_cycle = None
+    return prepared
+
+def rollback_prepared_cycle(config: configuration.AppConfig) -> bool:
+    """Drop an unused preparation, returns True if there was one."""
+    prepared: Optional[PreparedCycle] = config.prepared_cycle
+    config.prepared_cycle = None
+    return prepared is not None
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""
+Pilotes du banc importés au premier usage : la fenêtre s'affiche sans attendre nidaqmx,
+reportlab, les imprimantes ou le connecteur MySQL.
+Avec CAPSYS_SIMULATION, les instruments sont remplacés par les simulateurs de simulators.py.
+
+Les noms s'utilisent comme les classes d'origine (appel, attributs de classe), mais ne
+conviennent pas pour isinstance() ou comme classe de base.
+"""
+
+from lazy_import import lazy  # Custom
+from simulators import simulation  # Custom
+
+_MYSQL = "modules.capsys_mysql_command.capsys_mysql_command"
+
+GenericDatabaseManager = lazy(_MYSQL, "GenericDatabaseManager")
+DatabaseConfig = lazy(_MYSQL, "DatabaseConfig")
+Operator = lazy(_MYSQL, "Operator")
+PrinterDC = lazy("modules.capsys_wrapper_tm_t20iii.capsys_wrapper_tm_t20III", "PrinterDC")
+DAQManager = lazy("modules.capsys_daq_manager.capsys_daq_manager", "DAQManager")
+MCP23017 = lazy("modules.capsys_mcp23017.capsys_mcp23017", "MCP23017")
+MCP23017Manager = lazy("modules.capsys_mcp23017.capsys_mcp23017", "MCP23017Manager")
+BitBangI2C = lazy("modules.capsys_mcp23017.capsys_mcp23017", "BitBangI2C")
+BradyBP12Printer = lazy("modules.capsys_brady_manager.capsys_brady_manager", "BradyBP12Printer")
+MACManager = lazy("modules.capsys_mac_manager.capsys_mac_manager", "MACManager")
+DeviceReport = lazy("modules.capsys_pdf_report.capsys_pdf_report", "DeviceReport")
+
+if simulation is not None:
+    # Bench without its instruments, the database is still the MySQL one
+    from simulators import (SimulatedDAQManager as DAQManager, SimulatedPrinterDC as PrinterDC,  # Custom
+                            SimulatedBradyBP12Printer as BradyBP12Printer, SimulatedMACManager as MACManager)
@@ -0,0 +1,468 @@
+# -*- coding: utf-8 -*-
+"""
+Session matérielle persistante : le DAQ USB-6000, le bus I2C et les MCP23017 restent ouverts
+d'une carte à l'autre. Entre deux cartes on ne fait qu'un contrôle rapide et une remise à zéro des relais,
+l'énumération complète n'est refaite qu'en cas d'échec.
+"""
+
+import threading, time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Optional
+import configuration  # Custom
+from drivers import DAQManager, BitBangI2C  # Custom
+from lazy_import import lazy  # Custom
+from i2c_waveform import BufferedI2C  # Custom
+from resource_arbiter import arbiter, RESOURCE_DAQ  # Custom
+from step_timing import PHASE_DAQ, PHASE_RELAY, current_timer, timed  # Custom
+from simulators import simulation, SimulatedAcquisition, SimulatedI2CBus  # Custom
+
+np = lazy("numpy")  # Imported by the first acquisition
+
+DAQ_PRODUCT_TYPE = "USB-6000"
+CALIBRATION_VALIDITY = timedelta(days=1095)
+SETTLE_MIN_WAIT_S = 0.05  # Operate and bounce time of the relays before the analog inputs are sampled
+
+# Relays enabled when a board is inserted (state after init_mcp23017)
+IDLE_RELAYS = (
+    configuration.MCP23017Pin.EN_AUTOMATIC_BTL,
+    configuration.MCP23017Pin.EN_AUTOMATIC_24V,
+    configuration.MCP23017Pin.EN_AUTOMATIC_GND_IVE1_IVE2_IVF,
+)
+
+# MCP23017 registers (IOCON.BANK = 0, power-on default)
+MCP_IODIR = {"A": 0x00, "B": 0x01}
+MCP_OLAT = {"A": 0x14, "B": 0x15}
+
+class RelayBank:
+    """
+    MCP23017 outputs driven from a shadow copy of the OLAT registers.
+
+    digital_write() keeps the MCP23017Manager call signature used by the steps. write_pins() and batch()
+    coalesce several pin changes into a single register write per port, and a write is skipped when
+    the shadow register already holds the requested value. The registers can't be read back, resync()
+    writes every port again once per cycle in case the MCP23017 was reset (brown-out).
+    mcp_addr replaces the address of every pin (relay bank of another slot), the I2C bus is used under lock.
+    """
+
+    def __init__(self, i2c, pins=configuration.MCP23017Pin, debug: bool = False, mcp_addr: Optional[int] = None, lock=None):
+        self.i2c = i2c
+        self.pins = pins
+        self.debug = debug
+        self.mcp_addr = mcp_addr
+        self.lock = lock if lock is not None else threading.RLock()
+        self.shadow: dict[tuple[int, str], int] = {}  # (mcp_addr, port) -> last OLAT value written
+        self._pending: dict[tuple[int, str], int] = {}
+        self._batch_depth = 0
+        self.nb_writes = 0
+        self.nb_skipped = 0
+        self.timer = None  # step_timing.CycleTimer, set by HardwareSession.attach()
+
+    def pin_location(self, pin) -> tuple[int, str, int]:
+        """Return (mcp_addr, port, bit) of a MCP23017Pin member, e.g. MCP23017.Pin.B6 -> (0x20, "B", 6)."""
+        name = pin.pin_name
+        mcp_addr = self.mcp_addr if self.mcp_addr is not None else pin.mcp_addr
+        return mcp_addr, name[0], int(name[1:])
+
+    def iodir(self) -> dict[tuple[int, str], int]:
+        """IODIR value of every used port, the 'out' pins are outputs."""
+        iodir: dict[tuple[int, str], int] = {}
+        for pin in self.pins:
+            addr, port, bit = self.pin_location(pin)
+            value = iodir.setdefault((addr, port), 0xFF)
+            if pin.mode == 'out':
+                iodir[(addr, port)] = value & ~(1 << bit)
+        return iodir
+
+    def configure(self):
+        """Set the direction of every used port and force all outputs low, the shadow registers are then known."""
+        with self.lock:
+            self.shadow.clear()
+            self._pending.clear()
+            for (addr, port), value in self.iodir().items():
+                self.i2c.write_register(addr, MCP_OLAT[port], 0x00)
+                self.i2c.write_register(addr, MCP_IODIR[port], value)
+                self.shadow[(addr, port)] = 0x00
+
+    def resync(self, values: Optional[dict] = None) -> int:
+        """
+        Write the direction and the outputs of every port whatever the shadow registers hold, with values applied.
+        A MCP23017 reset by a brown-out has its outputs back to inputs, a write skipped by the shadow copy would never reach it.
+        Returns the number of ports whose outputs differ from the shadow copy.
+        """
+        with self.lock:
+            # The pending writes of a batch open in the slot thread are kept, they are committed against the new shadow
+            previous = dict(self.shadow)
+            registers = dict(previous)
+            for (addr, port), value in self.iodir().items():
+                self.i2c.write_register(addr, MCP_IODIR[port], value)
+                registers.setdefault((addr, port), 0x00)
+            self._apply(registers, values or {}, registers)
+            for (addr, port), value in registers.items():
+                self.i2c.write_register(addr, MCP_OLAT[port], value)
+                self.shadow[(addr, port)] = value
+            self.nb_writes += len(registers)
+            return sum(1 for key, value in registers.items() if previous.get(key) != value)
+
+    def digital_write(self, pin, value: bool):
+        """Drive a single output (MCP23017Manager compatible)."""
+        self.write_pins({pin: value})
+
+    def _apply(self, registers: dict, values: dict, base: dict):
+        """Set the bits of values in registers, starting from base for the ports not in registers yet."""
+        for pin, value in values.items():
+            addr, port, bit = self.pin_location(pin)
+            key = (addr, port)
+            current = registers.get(key, base.get(key, 0x00))
+            registers[key] = (current | (1 << bit)) if value else (current & ~(1 << bit))
+
+    def write_pins(self, values: dict) -> int:
+        """Drive several outputs at once, with one register write per port that actually changes. Returns the number of register writes."""
+        with self.lock:
+            self._apply(self._pending, values, self.shadow)
+            if self._batch_depth == 0:
+                return self._commit()
+            return 0
+
+    @contextmanager
+    def batch(self):
+        """Group all the writes of the block in one register write per port, committed when the block exits without error."""
+        with self.lock:
+            self._batch_depth += 1
+        try:
+            yield self
+        except BaseException:
+            with self.lock:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    self._pending.clear()
+            raise
+        with self.lock:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self._commit()
+
+    def _commit(self) -> int:
+        """Write the pending registers that differ from the shadow copy."""
+        nb_writes = 0
+        with timed(self.timer, PHASE_RELAY), self.lock:
+            pending, self._pending = self._pending, {}
+            for (addr, port), value in pending.items():
+                if self.shadow.get((addr, port)) == value:
+                    self.nb_skipped += 1
+                    continue
+                self.i2c.write_register(addr, MCP_OLAT[port], value)
+                self.shadow[(addr, port)] = value
+                nb_writes += 1
+        self.nb_writes += nb_writes
+        return nb_writes
+
+# Analog inputs acquired together by AnalogAcquisition (ai4 to ai7)
+ANALOG_CHANNELS = (
+    configuration.DAQPin.M_V_AT,
+    configuration.DAQPin.M_V_IVE2,
+    configuration.DAQPin.M_V_IVF,
+    configuration.DAQPin.M_V_IVE1,
+)
+
+@dataclass
+class ChannelStats:
+    """Statistics of the samples of one analog channel."""
+    mean: float
+    std: float
+    min: float
+    max: float
+    nb_samples: int
+
+@dataclass
+class SettleResult:
+    """Result of HardwareSession.wait_settled()."""
+    settled: bool
+    elapsed: float
+    stats: dict
+
+class AnalogAcquisition:
+    """One hardware-timed multi-channel AI task: all channels are sampled together and read in one USB transaction."""
+
+    def __init__(self, device: str, channels=ANALOG_CHANNELS, rate: float = 2000.0):
+        import nidaqmx
+        from nidaqmx.constants import AcquisitionType
+
+        self._acquisition_type = AcquisitionType.FINITE
+        self.channels = tuple(channels)
+        self.rate = rate
+        self.task = nidaqmx.Task()
+        self.task.ai_channels.add_ai_voltage_chan(",".join(f"{device}/{pin.value}" for pin in self.channels))
+        self._nb_samples = 0
+
+    def read_raw(self, nb_samples: int) -> "np.ndarray":
+        """Acquire nb_samples per channel and return an array of shape (nb_channels, nb_samples)."""
+        if nb_samples != self._nb_samples:
+            self.task.timing.cfg_samp_clk_timing(self.rate, sample_mode=self._acquisition_type, samps_per_chan=nb_samples)
+            self._nb_samples = nb_samples
+        data = self.task.read(number_of_samples_per_channel=nb_samples, timeout=nb_samples / self.rate + 1.0)
+        return np.asarray(data, dtype=float).reshape(len(self.channels), nb_samples)
+
+    def acquire(self, nb_samples: int = 50) -> dict:
+        """Acquire nb_samples per channel and return a ChannelStats per DAQPin."""
+        data = self.read_raw(nb_samples)
+        means, stds, mins, maxs = data.mean(axis=1), data.std(axis=1), data.min(axis=1), data.max(axis=1)
+        return {
+            pin: ChannelStats(float(means[i]), float(stds[i]), float(mins[i]), float(maxs[i]), nb_samples)
+            for i, pin in enumerate(self.channels)
+        }
+
+    def close(self):
+        try:
+            self.task.close()
+        except Exception:
+            pass
+
+def slot_mcp_addr(config: configuration.AppConfig) -> Optional[int]:
+    """MCP23017 address of the relay bank of a config, None for the addresses of MCP23017Pin."""
+    return config.slot.mcp_addr if config.slot is not None else None
+
+class HardwareSession:
+    """
+    Owns the DAQManager, the I2C bus and the MCP23017 relay banks across test cycles.
+    The session is shared by the slots of the bench, the DAQ and the I2C bus are used under the DAQ lock of the arbiter.
+    """
+
+    def __init__(self, debug: bool = False):
+        self.debug = debug
+        self.lock = arbiter.lock(RESOURCE_DAQ)
+        self.daq_manager: Optional[DAQManager] = None
+        self.daq_port: Optional[str] = None
+        self.device_info: Optional[dict] = None
+        self.i2c: Any = None  # BitBangI2C, BufferedI2C on the simulated bus
+        self.relay_banks: dict[Optional[int], RelayBank] = {}  # slot MCP23017 address -> relay bank
+        self.acquisition: Optional[AnalogAcquisition] = None  # SimulatedAcquisition with CAPSYS_SIMULATION
+        self.configs: dict[Optional[int], configuration.AppConfig] = {}  # slot MCP23017 address -> config attached to the session
+        self.nb_cycles = 0
+
+    @property
+    def timer(self):
+        """step_timing.CycleTimer of the step running in the current thread (the session is shared by the slots)."""
+        return current_timer()
+
+    @property
+    def mcp_manager(self) -> Optional[RelayBank]:
+        """Relay bank at the addresses of MCP23017Pin (single board bench)."""
+        return self.relay_banks.get(None)
+
+    def attach(self, config: configuration.AppConfig):
+        """Expose the session objects, and the relay bank of the slot, through the usual AppConfig attributes used by the steps."""
+        config.hardware = self
+        self.configs[slot_mcp_addr(config)] = config
+        relay_bank = self.relay_banks.get(slot_mcp_addr(config))
+        if relay_bank is not None:
+            relay_bank.timer = config.cycle_timer
+        config.daq_manager = self.daq_manager
+        config.daq_port = self.daq_port
+        config.mcp_manager = relay_bank
+
+    def connect_daq(self) -> tuple[int, str]:
+        """
+        Reuse the DAQ if it still answers, otherwise enumerate the NI devices and create the tasks.
+
+        The other slots may be in the middle of a cycle: their relay banks are kept, moved to the new I2C bus
+        with their outputs written again, and every attached config is given the new DAQ objects.
+        """
+        with self.lock:
+            if self.daq_manager is not None and self.health_check():
+                return self._daq_status(reused=True)
+            self._close_daq()
+            status = self._open_daq()
+            if status[0] != 1 and self.relay_banks:
+                self._open_i2c()
+                for relay_bank in self.relay_banks.values():
+                    try:
+                        relay_bank.resync()
+                    except Exception:
+                        pass  # Configured again by init_mcp23017 on the next cycle of its slot
+            for config in self.configs.values():
+                self.attach(config)
+            return status
+
+    def init_mcp23017(self, mcp_addr: Optional[int] = None) -> tuple[int, str]:
+        """Reuse the relay bank at mcp_addr if the relay reset succeeds, otherwise recreate the I2C bus and configure the bank."""
+        with self.lock:
+            if self.daq_manager is None or self.daq_port is None:
+                return 1, "Le DAQ n'est pas initialisé."
+            return_msg = f"Config MCP23017 : SDA out sur {configuration.DAQPin.I2C_SDA_OUT.value}, SDA in sur {configuration.DAQPin.I2C_SDA_IN.value}, SCL sur {configuration.DAQPin.I2C_SCL.value}."
+            if mcp_addr is not None:
+                return_msg += f" Adresse 0x{mcp_addr:02X}."
+            relay_bank = self.relay_banks.get(mcp_addr)
+            if relay_bank is not None:
+                try:
+                    self.reset_relays(relay_bank)
+                    return 0, return_msg + " (session conservée)"
+                except Exception:
+                    self._close_i2c()
+            if self.i2c is None:
+                self._open_i2c()
+            if relay_bank is None:
+                relay_bank = RelayBank(self.i2c, configuration.MCP23017Pin, debug=self.debug, mcp_addr=mcp_addr, lock=self.lock)
+                self.relay_banks[mcp_addr] = relay_bank
+            relay_bank.configure()
+            self.reset_relays(relay_bank)
+            return 0, return_msg
+
+    def acquire(self, nb_samples: int = 50) -> dict:
+        """Acquire ai4 to ai7 together and return a ChannelStats per DAQPin."""
+        with self.lock:
+            if self.acquisition is None:
+                raise RuntimeError("L'acquisition analogique n'est pas initialisée.")
+            with timed(self.timer, PHASE_DAQ):
+                return self.acquisition.acquire(nb_samples)
+
+    def wait_settled(self, channels=ANALOG_CHANNELS, max_wait: float = 0.5, tolerance: float = 0.02, nb_stable: int = 3, nb_samples: int = 20,
+                     min_wait: float = SETTLE_MIN_WAIT_S) -> SettleResult:
+        """
+        Sample the channels in a tight loop until their readings are stable, instead of a fixed sleep.
+
+        The channels are settled when the means of the last nb_stable blocks of each channel stay within
+        tolerance (volts at the DAQ input). Sampling starts min_wait after the call (relay just switched),
+        so blocks read before the contacts close or while they bounce are never taken as stable.
+        max_wait is the former fixed sleep and stays the upper bound. No channel is never settled.
+        """
+        start = time.perf_counter()
+        if not channels:
+            return SettleResult(False, 0.0, {})
+        time.sleep(min_wait)
+        history: list[dict] = []
+        while True:
+            stats = self.acquire(nb_samples)
+            elapsed = time.perf_counter() - start
+            history = (history + [stats])[-nb_stable:]
+            if len(history) == nb_stable and all(
+                max(h[pin].mean for h in history) - min(h[pin].mean for h in history) <= tolerance
+                for pin in channels
+            ):
+                return SettleResult(True, elapsed, stats)
+            if elapsed >= max_wait:
+                return SettleResult(False, elapsed, stats)
+
+    def health_check(self) -> bool:
+        """Fast check that the DAQ still answers (one DI read on the existing SDA input task)."""
+        if self.daq_manager is None or self.daq_port is None:
+            return False
+        try:
+            self.daq_manager.read_a_line(self.daq_port, configuration.DAQPin.I2C_SDA_IN.value)
+            return True
+        except Exception:
+            return False
+
+    def reset_relays(self, relay_bank: Optional[RelayBank] = None):
+        """Put the relays of a bank (default: the bank of MCP23017Pin) in the state expected when a new board is inserted."""
+        relay_bank = relay_bank if relay_bank is not None else self.mcp_manager
+        if relay_bank is None:
+            return
+        with timed(self.timer, PHASE_RELAY):
+            # Once per cycle every register is written again, in case the MCP23017 was reset since the last board
+            if relay_bank.resync({pin: pin in IDLE_RELAYS for pin in configuration.MCP23017Pin}):
+                time.sleep(1)  # Only wait for the relays if one of them actually switched
+        self.nb_cycles += 1
+
+    def release_relays(self):
+        """Open every relay of every slot, the session stays open."""
+        for relay_bank in self.relay_banks.values():
+            relay_bank.write_pins({pin: False for pin in configuration.MCP23017Pin})
+
+    def close(self):
+        """Release the relays and close every DAQ task."""
+        with self.lock:
+            if self.relay_banks:
+                try:
+                    self.release_relays()
+                except Exception:
+                    pass
+            self.relay_banks.clear()
+            self.configs.clear()
+            self._close_daq()
+
+    def _close_daq(self):
+        """Close the I2C bus and every DAQ task, the relay banks are kept."""
+        self._close_i2c()
+        if self.acquisition is not None:
+            self.acquisition.close()
+            self.acquisition = None
+        if self.daq_manager is not None:
+            try:
+                self.daq_manager.close_all()
+            except Exception:
+                pass
+        self.daq_manager = None
+        self.daq_port = None
+        self.device_info = None
+
+    def _open_i2c(self):
+        """Create the I2C bus, the relay banks keep their objects and move to the new bus."""
+        if simulation is not None:
+            self.i2c = BufferedI2C(SimulatedI2CBus(), debug=self.debug)
+        else:
+            # i2c_waveform.DaqmxI2CBackend stays off the bench until it is benchmarked on the USB-6000
+            self.i2c = BitBangI2C(
+                sda_out_device=self.daq_port,
+                sda_out_line=configuration.DAQPin.I2C_SDA_OUT.value,
+                sda_in_device=self.daq_port,
+                sda_in_line=configuration.DAQPin.I2C_SDA_IN.value,
+                scl_device=self.daq_port,
+                scl_line=configuration.DAQPin.I2C_SCL.value,
+                daq_manager=self.daq_manager,
+                debug=self.debug,
+            )
+        for relay_bank in self.relay_banks.values():
+            relay_bank.i2c = self.i2c
+
+    def _close_i2c(self):
+        """Release the I2C bus, the relay banks are configured again on the next bus."""
+        if self.i2c is not None:
+            if isinstance(self.i2c, BufferedI2C):
+                self.i2c.close()  # BitBangI2C uses the DAQManager tasks, closed with the DAQ
+            self.i2c = None
+
+    def _open_daq(self) -> tuple[int, str]:
+        """Enumerate the NI devices, keep the USB-6000 and create the tasks for the whole session."""
+        daq_manager_local = DAQManager(debug=self.debug)
+
+        # List all available DAQ devices
+        available_devices = daq_manager_local.list_available_devices()
+        if not available_devices:
+            return 1, "Aucun appareil NI détecté."
+
+        # Check if USB-6000 is present
+        for device_name in available_devices:
+            daq_manager_local.add_device(device_name)
+            device_info = daq_manager_local.show_device_info(device_name)
+            if device_info and device_info.get("product_type") == DAQ_PRODUCT_TYPE:
+                self.daq_port = device_name
+                self.device_info = device_info
+                break
+            else:
+                daq_manager_local.remove_device(device_name)
+        if self.daq_port is None:
+            return 1, f"Aucun appareil {DAQ_PRODUCT_TYPE} détecté."
+
+        self.daq_manager = daq_manager_local
+        self.daq_manager.close_all()  # If any task are left in the daq, we remove them
+
+        # Create tasks for the whole session
+        self.daq_manager.create_do_task(self.daq_port, configuration.DAQPin.I2C_SDA_OUT.value)
+        self.daq_manager.create_di_task(self.daq_port, configuration.DAQPin.I2C_SDA_IN.value)
+        self.daq_manager.create_do_task(self.daq_port, configuration.DAQPin.I2C_SCL.value)
+        self.acquisition = SimulatedAcquisition(ANALOG_CHANNELS) if simulation is not None else AnalogAcquisition(self.daq_port)
+        return self._daq_status(reused=False)
+
+    def _daq_status(self, reused: bool) -> tuple[int, str]:
+        """Return the status of the DAQ from the device info read at enumeration (calibration check)."""
+        device_info = self.device_info or {}
+        calibration_date = device_info.get("calibration_date")
+        status_code = 0  # Default status: OK
+        if calibration_date is not None and datetime.now() > calibration_date + CALIBRATION_VALIDITY:
+            status_code = 2  # Calibration expired
+        return_msg = f"Config DAQ : Port : {self.daq_port} ; Model : {device_info.get('product_type')} ; SN : {device_info.get('serial_number')} ; Calibration : {calibration_date}"
+        if reused:
+            return_msg += " (session conservée)"
+        return status_code, return_msg
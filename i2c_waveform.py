@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+Bus I2C du banc généré sous forme de buffer d'échantillons numériques.
+
+Une transaction complète (start, adresse, données, slots d'ACK, stop) est précalculée en une liste
+d'échantillons (bit 0 = SCL, bit 1 = SDA) puis envoyée au backend en un seul appel :
+- DaqmxI2CBackend écrit le buffer échantillon par échantillon sur une tâche DO port0/line0:1 du USB-6000
+  (sorties numériques cadencées par logiciel, une écriture par échantillon) et lit SDA à chaque slot d'ACK.
+  Il n'est pas encore utilisé par le banc, qui garde BitBangI2C tant qu'il n'est pas mesuré sur le USB-6000 :
+      python i2c_waveform.py Dev1 [nb_transactions]
+- SimulatedI2CBackend décode le même buffer en Python, lit l'ACK sur SDA et simule les MCP23017 (utilisable sous Linux).
+"""
+
+import sys, time
+from dataclasses import dataclass, field
+from typing import Optional
+
+SCL = 0x01  # port0/line0
+SDA = 0x02  # port0/line1
+IDLE = SCL | SDA
+
+@dataclass
+class I2CFrame:
+    """Samples of one I2C transaction and the index of the sample where the last ACK must be read."""
+    samples: list[int] = field(default_factory=list)
+    ack_slots: list[int] = field(default_factory=list)
+
+    def _add(self, scl: int, sda: int):
+        sample = (SCL if scl else 0) | (SDA if sda else 0)
+        if not self.samples or self.samples[-1] != sample:
+            self.samples.append(sample)
+
+    @property
+    def last_ack(self) -> int:
+        return self.ack_slots[-1]
+
+def build_write_frame(address: int, payload: bytes) -> I2CFrame:
+    """Build the samples of a write transaction: START, address + W, payload bytes, STOP."""
+    frame = I2CFrame()
+    frame._add(1, 1)  # Idle
+    frame._add(1, 0)  # START: SDA falls while SCL is high
+    frame._add(0, 0)
+    for byte in bytes([(address << 1) & 0xFE]) + bytes(payload):
+        for bit in range(7, -1, -1):
+            value = (byte >> bit) & 1
+            frame._add(0, value)  # Data changes while SCL is low
+            frame._add(1, value)  # Sampled by the slave on the rising edge
+            frame._add(0, value)
+        frame._add(0, 1)  # Release SDA for the ACK
+        frame._add(1, 1)
+        frame.ack_slots.append(len(frame.samples) - 1)
+        frame._add(0, 1)
+    frame._add(0, 0)  # STOP: SDA rises while SCL is high
+    frame._add(1, 0)
+    frame._add(1, 1)
+    return frame
+
+class DaqmxI2CBackend:
+    """
+    Write the I2C samples on the USB-6000 with one port-wide DO task (SCL + SDA out) and read SDA in at every ACK slot.
+
+    The digital outputs of the USB-6000 are software-timed only: an on-demand task accepts one sample per write,
+    so the frame is written sample by sample. SCL and SDA change together in one write instead of one task per line;
+    the gain on the real device is measured by benchmark(), the bench keeps BitBangI2C until then.
+    """
+
+    def __init__(self, device: str, do_lines: str = "port0/line0:1", di_line: str = "port0/line2"):
+        import nidaqmx
+        from nidaqmx.constants import LineGrouping
+
+        self.do_task = nidaqmx.Task()
+        self.do_task.do_channels.add_do_chan(f"{device}/{do_lines}", line_grouping=LineGrouping.CHAN_FOR_ALL_LINES)
+        self.di_task = nidaqmx.Task()
+        self.di_task.di_channels.add_di_chan(f"{device}/{di_line}", line_grouping=LineGrouping.CHAN_FOR_ALL_LINES)
+
+    def write_samples(self, samples: list[int]):
+        """Write the samples one by one on the DO task (on-demand timing)."""
+        for sample in samples:
+            self.do_task.write(sample, auto_start=True)
+
+    def transfer(self, frame: I2CFrame) -> bool:
+        """Play the frame and return True if every ACK slot (address, register, data) was acknowledged (SDA pulled low)."""
+        acked = bool(frame.ack_slots)
+        begin = 0
+        for slot in frame.ack_slots:
+            self.write_samples(frame.samples[begin:slot + 1])
+            acked = acked and not bool(self.di_task.read())
+            begin = slot + 1
+        self.write_samples(frame.samples[begin:])
+        return acked
+
+    def close(self):
+        for task in (self.do_task, self.di_task):
+            try:
+                task.close()
+            except Exception:
+                pass
+
+class SimulatedMCP23017:
+    """Register file of a MCP23017 (IOCON.BANK = 0) with the address pointer auto-increment."""
+
+    def __init__(self):
+        self.registers = [0x00] * 0x16
+        self.registers[0x00] = 0xFF  # IODIRA
+        self.registers[0x01] = 0xFF  # IODIRB
+
+    def write(self, data: bytes):
+        if not data:
+            return
+        pointer = data[0]
+        for value in data[1:]:
+            if pointer < len(self.registers):
+                self.registers[pointer] = value
+            pointer += 1
+
+class SimulatedI2CBackend:
+    """Decode the same sample buffers as DaqmxI2CBackend and forward the bytes to simulated devices."""
+
+    def __init__(self, devices: Optional[dict] = None):
+        self.devices: dict[int, SimulatedMCP23017] = devices if devices is not None else {0x20: SimulatedMCP23017()}
+        self.nb_transfers = 0
+        self.nb_samples = 0
+
+    def transfer(self, frame: I2CFrame) -> bool:
+        """
+        Decode the frame and return True if every byte was acknowledged. As on the bus, a byte is acknowledged
+        when SDA reads low in its ACK slot: the master must release SDA there and the addressed device pulls it low.
+        The ACK slots must also be the samples where DaqmxI2CBackend reads SDA in (frame.ack_slots).
+        """
+        self.nb_transfers += 1
+        self.nb_samples += len(frame.samples)
+        received: list[int] = []
+        acks: list[bool] = []
+        slots: list[int] = []
+        current = 0
+        nb_bits = 0
+        previous = IDLE
+        started = False
+        for index, sample in enumerate(frame.samples):
+            scl_rise = not (previous & SCL) and (sample & SCL)
+            if (previous & SCL) and (sample & SCL):
+                if (previous & SDA) and not (sample & SDA):
+                    started, received, acks, slots, current, nb_bits = True, [], [], [], 0, 0  # START
+                elif not (previous & SDA) and (sample & SDA) and started:
+                    started = False  # STOP
+            elif scl_rise and started:
+                if nb_bits < 8:
+                    current = (current << 1) | (1 if sample & SDA else 0)
+                    nb_bits += 1
+                else:
+                    # ACK slot: SDA released by the master, pulled low by the addressed device
+                    received.append(current)
+                    device_ack = received[0] >> 1 in self.devices and not (received[0] & 1)
+                    acks.append(bool(sample & SDA) and device_ack)
+                    slots.append(index)
+                    current, nb_bits = 0, 0
+            previous = sample
+        ok = bool(acks) and all(acks) and slots == frame.ack_slots
+        if ok:
+            self.devices[received[0] >> 1].write(bytes(received[1:]))
+        return ok
+
+    def close(self):
+        pass
+
+class BufferedI2C:
+    """I2C master for the MCP23017: each transaction is built as one buffer and sent to the backend in one call."""
+
+    def __init__(self, backend, debug: bool = False):
+        self.backend = backend
+        self.debug = debug
+
+    def write(self, address: int, data: bytes):
+        """Write bytes to a device, raises OSError if the device does not acknowledge."""
+        if not self.backend.transfer(build_write_frame(address, data)):
+            raise OSError(f"Pas d'ACK du périphérique I2C 0x{address:02X}.")
+
+    def write_register(self, address: int, register: int, value: int):
+        """Write one register of a device (register pointer then value)."""
+        self.write(address, bytes([register & 0xFF, value & 0xFF]))
+
+    def probe(self, address: int) -> bool:
+        """Return True if a device acknowledges its address."""
+        return self.backend.transfer(build_write_frame(address, b""))
+
+    def close(self):
+        self.backend.close()
+
+def benchmark(device: str, nb_transactions: int = 100, address: int = 0x20):
+    """Time OLATB writes of DaqmxI2CBackend on a USB-6000 (relays of the bank off), to compare with BitBangI2C."""
+    i2c = BufferedI2C(DaqmxI2CBackend(device))
+    try:
+        start = time.perf_counter()
+        for _ in range(nb_transactions):
+            i2c.write_register(address, 0x15, 0x00)
+        elapsed = time.perf_counter() - start
+    finally:
+        i2c.close()
+    print(f"{nb_transactions} transactions en {elapsed:.2f} s, {elapsed / nb_transactions * 1000:.1f} ms par écriture de registre")
+
+if __name__ == "__main__":
+    """Run a few transactions on the simulator (no NI hardware needed), or the benchmark on the device given in argument."""
+    if len(sys.argv) > 1:
+        benchmark(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 100)
+        sys.exit(0)
+    backend = SimulatedI2CBackend()
+    i2c = BufferedI2C(backend)
+    i2c.write_register(0x20, 0x01, 0x00)  # IODIRB: all outputs
+    i2c.write_register(0x20, 0x15, 0b01000101)  # OLATB
+    print(f"IODIRB=0x{backend.devices[0x20].registers[0x01]:02X} OLATB=0x{backend.devices[0x20].registers[0x15]:02X}")
+    print(f"Probe 0x20 : {i2c.probe(0x20)} ; probe 0x21 : {i2c.probe(0x21)}")
+    frame = build_write_frame(0x20, bytes([0x15, 0x00]))
+    frame.samples[frame.last_ack] &= ~SDA  # SDA held low by the master in the ACK slot: not an ACK of the device
+    assert not backend.transfer(frame)
+    print(f"{backend.nb_transfers} transactions, {backend.nb_samples} échantillons")
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Import différé des modules lourds et profil des imports au démarrage.
+
+lazy() retourne un objet qui n'importe son module qu'au premier appel ou au premier accès
+à un attribut. ImportProfiler mesure, pendant l'exécution, le temps passé à importer chaque
+module (temps propre et cumulé, comme python -X importtime), y compris dans l'exe PyInstaller.
+Il est activé en lançant le banc avec la variable d'environnement CAPSYS_IMPORT_PROFILE=1.
+"""
+
+import os, sys, time, threading, importlib
+from importlib.abc import MetaPathFinder
+from typing import Any, Optional
+
+IMPORT_PROFILE_ENV = "CAPSYS_IMPORT_PROFILE"
+
+_UNRESOLVED = object()
+
+class LazyObject:
+    """Proxy of a module, or of an attribute of a module, imported on first use."""
+    __slots__ = ("_module_name", "_attr", "_target")
+
+    def __init__(self, module_name: str, attr: Optional[str] = None):
+        self._module_name = module_name
+        self._attr = attr
+        self._target = _UNRESOLVED
+
+    def _resolve(self) -> Any:
+        if self._target is _UNRESOLVED:
+            module = importlib.import_module(self._module_name)
+            self._target = getattr(module, self._attr) if self._attr else module
+        return self._target
+
+    def __getattr__(self, name: str):
+        return getattr(self._resolve(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+    def __repr__(self) -> str:
+        name = f"{self._module_name}.{self._attr}" if self._attr else self._module_name
+        state = "importé" if self._target is not _UNRESOLVED else "non importé"
+        return f"<lazy {name} ({state})>"
+
+def lazy(module_name: str, attr: Optional[str] = None) -> Any:
+    """Return a proxy importing module_name (and reading attr from it) on first use."""
+    return LazyObject(module_name, attr)
+
+class _TimedLoader:
+    """Loader wrapper measuring exec_module, the other attributes are those of the wrapped loader."""
+
+    def __init__(self, loader, profiler: "ImportProfiler"):
+        self._loader = loader
+        self._profiler = profiler
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._profiler._exec(self._loader, module)
+
+    def __getattr__(self, name: str):
+        return getattr(self._loader, name)
+
+class _TimedFinder(MetaPathFinder):
+    """First finder of sys.meta_path, asks the other finders and wraps the loader of the spec found."""
+
+    def __init__(self, profiler: "ImportProfiler"):
+        self._profiler = profiler
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimedLoader(spec.loader, self._profiler)
+                return spec
+        return None
+
+class ImportProfiler:
+    """Self and cumulative import time of every module imported while the profiler is running."""
+
+    def __init__(self):
+        self.records: list[tuple[str, float, float]] = []  # (module, self time, cumulative time) in seconds
+        self.start_time = time.perf_counter()
+        self.stop_time: Optional[float] = None
+        self._finder = _TimedFinder(self)
+        self._local = threading.local()
+
+    def start(self):
+        if self._finder not in sys.meta_path:
+            sys.meta_path.insert(0, self._finder)
+
+    def stop(self):
+        if self._finder in sys.meta_path:
+            sys.meta_path.remove(self._finder)
+        if self.stop_time is None:
+            self.stop_time = time.perf_counter()
+
+    def _exec(self, loader, module):
+        # Time of the nested imports is removed from the self time of the parent
+        stack = self._local.__dict__.setdefault("stack", [])
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            loader.exec_module(module)
+        finally:
+            cumulative = time.perf_counter() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += cumulative
+            self.records.append((module.__name__, cumulative - children, cumulative))
+
+    @property
+    def elapsed(self) -> float:
+        return (self.stop_time or time.perf_counter()) - self.start_time
+
+    def top(self, nb: int = 10) -> list[tuple[str, float, float]]:
+        """Top-level packages sorted by cumulative import time."""
+        packages: dict[str, list[float]] = {}
+        for name, self_time, _ in self.records:
+            totals = packages.setdefault(name.split(".")[0], [0.0, 0.0])
+            totals[0] += self_time
+        for name, _, cumulative in self.records:
+            if "." not in name and name in packages:
+                packages[name][1] = max(packages[name][1], cumulative)
+        return sorted(((name, s, c or s) for name, (s, c) in packages.items()), key=lambda r: -r[2])[:nb]
+
+    def report(self) -> str:
+        """Report in the format of python -X importtime (microseconds), modules in import order."""
+        lines = [
+            f"Profil des imports : {len(self.records)} modules, {sum(r[1] for r in self.records):.3f} s d'import, "
+            f"{self.elapsed:.3f} s jusqu'à l'arrêt du profil",
+            "import time: self [us] | cumulative | imported package",
+        ]
+        for name, self_time, cumulative in self.records:
+            lines.append(f"import time: {self_time * 1e6:>9.0f} | {cumulative * 1e6:>10.0f} | {name}")
+        return "\n".join(lines) + "\n"
+
+    def save(self, log_dir: str) -> str:
+        """Write the report in log_dir and return its path."""
+        os.makedirs(log_dir, exist_ok=True)
+        path = os.path.join(log_dir, f"import_profile_{time.strftime('%Y-%m-%d_%H-%M-%S')}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.report())
+        return path
+
+def start_profile_from_env() -> Optional[ImportProfiler]:
+    """Start an ImportProfiler if CAPSYS_IMPORT_PROFILE is set, to be called before the heavy imports."""
+    if not os.environ.get(IMPORT_PROFILE_ENV):
+        return None
+    profiler = ImportProfiler()
+    profiler.start()
+    return profiler
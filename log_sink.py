@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Écriture des logs du banc dans log_<date>.txt par un thread dédié.
+
+Le thread GUI ne fait que déposer les lignes dans une file. Le thread d'écriture garde le fichier
+ouvert, vide son buffer par taille ou toutes les flush_interval secondes, change de fichier à
+minuit et compresse en .gz les fichiers des jours précédents.
+"""
+
+import os, re, gzip, time, queue, shutil, atexit, threading
+from datetime import datetime
+from typing import Optional
+
+_LOG_FILE_PATTERN = re.compile(r"^log_(\d{4}-\d{2}-\d{2})\.txt$")
+_STOP = object()
+
+class LogSink:
+    """Buffered writer of the daily log file, fed through a queue by any thread."""
+
+    def __init__(self, log_dir: str, flush_interval: float = 1.0, flush_size: int = 64 * 1024):
+        self.log_dir = log_dir
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._queue: queue.Queue = queue.Queue()
+        self._file = None
+        self._date: Optional[str] = None
+        self._pending = 0  # Characters written since the last flush
+        self._last_flush = time.monotonic()
+        os.makedirs(log_dir, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="LogSink", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @property
+    def file_path(self) -> str:
+        """Path of the log file of the day."""
+        return os.path.join(self.log_dir, f"log_{datetime.now().strftime('%Y-%m-%d')}.txt")
+
+    def write(self, text: str):
+        """Queue text for the log file, never blocks on disk."""
+        self._queue.put((datetime.now().strftime("%Y-%m-%d"), text))
+
+    def close(self, timeout: float = 5.0):
+        """Write the remaining records and close the file."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def _run(self):
+        self._compress_old_files()
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._flush()
+                continue
+            if item is _STOP:
+                break
+            date, text = item
+            try:
+                if date != self._date:
+                    self._rotate(date)
+                self._file.write(text)
+                self._pending += len(text)
+                if self._pending >= self.flush_size or time.monotonic() - self._last_flush >= self.flush_interval:
+                    self._flush()
+            except Exception as e:
+                print(f"Erreur lors de l'écriture du log : {e}")
+        self._flush()
+        self._close_file()
+
+    def _flush(self):
+        if self._file is not None and self._pending:
+            try:
+                self._file.flush()
+            except Exception as e:
+                print(f"Erreur lors de l'écriture du log : {e}")
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def _close_file(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except Exception:
+                pass
+            self._file = None
+
+    def _rotate(self, date: str):
+        """Switch to the log file of the given day and compress the previous days."""
+        self._flush()
+        self._close_file()
+        rotated = self._date is not None
+        self._date = date
+        self._file = open(os.path.join(self.log_dir, f"log_{date}.txt"), "a", encoding="utf-8")
+        if rotated:
+            self._compress_old_files()
+
+    def _compress_old_files(self):
+        """Compress the log files of the previous days into log_<date>.txt.gz."""
+        today = datetime.now().strftime("%Y-%m-%d")
+        for name in os.listdir(self.log_dir):
+            match = _LOG_FILE_PATTERN.match(name)
+            if match is None or match.group(1) >= today or match.group(1) == self._date:
+                continue
+            path = os.path.join(self.log_dir, name)
+            try:
+                # Append so that a day already compressed once (e.g. file reopened after midnight) is kept
+                with open(path, "rb") as src, gzip.open(path + ".gz", "ab") as dst:
+                    shutil.copyfileobj(src, dst)
+                os.remove(path)
+            except OSError as e:
+                print(f"Erreur lors de la compression du log {name} : {e}")
@@ -1,56 +1,73 @@
 # -*- coding: utf-8 -*-
 
+from lazy_import import start_profile_from_env  # Custom
+import_profiler = start_profile_from_env()  # Started before the other imports when CAPSYS_IMPORT_PROFILE is set
+
 import sys
-import importlib.util
 import os
-from typing import List, Tuple, Callable, Optional
-from modules.capsys_mysql_command.capsys_mysql_command import (GenericDatabaseManager, DatabaseConfig) # Custom
-from PyQt6.QtGui import QIcon, QCloseEvent
+from typing import List, Tuple, Callable, Optional, Any
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from PyQt6.QtGui import QIcon, QCloseEvent, QTextCursor, QTextCharFormat, QColor
 from PyQt6.QtWidgets import (QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QTextEdit, QMessageBox, QCheckBox)
 from PyQt6.QtCore import Qt, QThread, pyqtSignal, QTimer
 from datetime import datetime
-import logging, ctypes, tempfile, json
-from modules.capsys_pdf_report.capsys_pdf_report import DeviceReport  # Custom
-from modules.capsys_wrapper_tm_t20iii.capsys_wrapper_tm_t20III import PrinterDC  # Custom
+import logging, ctypes, json
+from drivers import GenericDatabaseManager, DatabaseConfig, DeviceReport, PrinterDC, BradyBP12Printer  # Custom
 import configuration  # Custom
+from log_sink import LogSink  # Custom
+from step_registry import registry as step_registry  # Custom
+from step_scheduler import StepPlan  # Custom
+from cycle_prefetch import prepare_next_cycle, rollback_prepared_cycle  # Custom
+from slots import load_slot_settings, create_slot_config  # Custom
+from resource_arbiter import arbiter, RESOURCE_PRINTER  # Custom
+from simulators import simulation  # Custom
 
 # Global config object
 config = configuration.AppConfig()
 
+# Colors of the log area
+LOG_COLORS = {
+    "white": "#ffffff",
+    "yellow": "#ffff00",
+    "cyan": "#00ffff",
+    "blue": "#4da6ff",
+    "green": "#00ff00",
+    "orange": "#ffa500",
+    "red": "#ff4444",
+    "purple": "#ff00ff"
+}
+LOG_MAX_BLOCKS = 5000  # Lines kept in the log area, older ones are dropped (the full log is in the log file)
+LOG_RENDER_INTERVAL_MS = 50  # Messages received during this interval are rendered together
+
 # Call the SetCurrentProcessExplicitAppUserModelID function from shell32.dll
 # This sets a unique AppUserModelID for the current process to identify it in the taskbar, start menu, etc.
-ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID("my_unique_app_id")
+if os.name == "nt":
+    ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID("my_unique_app_id")
 
 class TestThread(QThread):
     """Thread to execute test steps in the background, emitting signals for UI updates and handling test logic."""
     update_step = pyqtSignal(int, str, bool, str)
     update_step_percentage = pyqtSignal(int, int)  # New signal for percentage updates
-    log_message = pyqtSignal(str, str)
+    log_message = pyqtSignal(object, str)  # message (str or dict), color
     finished = pyqtSignal()
     step_failed = pyqtSignal(str, str)
     request_user_input = pyqtSignal(str, str, object, int)  # title, message, callback, font_size
+    close_user_input = pyqtSignal()  # Close the user input dialog (timeout or test stopped)
 
-    def __init__(self, skipped_steps=None, generate_report=False):
+    def __init__(self, skipped_steps=None, generate_report=False, slot_config=None, slot_index=0):
         """Initialize the test thread and load test steps."""
         super().__init__()
         self.running = True
         self.skipped_steps = skipped_steps or set()
+        self.plan = StepPlan(step_registry.steps())  # Prerequisites and resources of the steps
         self.steps = self.load_steps()
         self.generate_report = generate_report
+        self.config = slot_config if slot_config is not None else config  # AppConfig of the slot tested by this thread
+        self.slot_index = slot_index
 
     def emit_log_message(self, message, color="white"):
-        """Emit a log message signal with the given message and color."""
-        # Si le message est un dict, le convertir en chaîne lisible
-        if isinstance(message, dict):
-            message = json.dumps(message, ensure_ascii=False, indent=2)
-        elif isinstance(message, str):
-            try:
-                # Si le message est une chaîne JSON, le charger puis le retransformer pour formatage
-                obj = json.loads(message)
-                if isinstance(obj, dict):
-                    message = json.dumps(obj, ensure_ascii=False, indent=2)
-            except json.JSONDecodeError:
-                pass
+        """Emit a log message signal with the given message and color, dicts are sent as is and formatted by the GUI."""
         self.log_message.emit(message, color)
 
     def emit_step_percentage(self, step_idx, percentage):
@@ -61,153 +78,70 @@ class TestThread(QThread):
         """Request text input from the user via a dialog box."""
         self.request_user_input.emit(title, message, callback, font_size)
 
+    def close_user_text_input(self):
+        """Close the user input dialog if it is still open."""
+        self.close_user_input.emit()
+
     def load_steps(self) -> List[Tuple[str, Callable, Callable]]:
-        """Dynamically load test step modules from the 'steps' directory and return a list of (name, run_step, get_info) tuples."""
-        steps_folder = os.path.join(os.path.dirname(__file__), "steps")
-        # Include the s01, s02, ... folders and the 'zz' folder
-        step_dirs = sorted(
-            d
-            for d in os.listdir(steps_folder)
-            if os.path.isdir(os.path.join(steps_folder, d))
-            and (d.startswith("s") and d[1:].isdigit() or d == "zz")
-        )
-
-        steps = []
-        final_step_file = None
-
-        for dir_name in step_dirs:
-            dir_path = os.path.join(steps_folder, dir_name)
-            py_files = sorted(f for f in os.listdir(dir_path) if f.endswith(".py"))
-            for filename in py_files:
-                if dir_name == "zz" and filename == "fin_du_test.py":
-                    final_step_file = (dir_path, filename)
-                    continue
-                module_name = f"{dir_name}_{filename[:-3]}"
-                filepath = os.path.join(dir_path, filename)
-                spec = importlib.util.spec_from_file_location(module_name, filepath)
-                module = importlib.util.module_from_spec(spec) # type: ignore[attr-defined]
-                spec.loader.exec_module(module)  # type: ignore[attr-defined]
-                if hasattr(module, "run_step"):
-                    info_func = getattr(module, "get_info", lambda: "Pas d'information disponible pour cette étape.")
-                    steps.append((module_name, module.run_step, info_func))
-
-        # Adds Fin du test.py to the end of the test
-        if final_step_file:
-            dir_path, filename = final_step_file
-            module_name = f"{filename[:-3]}"
-            filepath = os.path.join(dir_path, filename)
-            spec = importlib.util.spec_from_file_location(module_name, filepath)
-            module = importlib.util.module_from_spec(spec)  # type: ignore[attr-defined]
-            spec.loader.exec_module(module)  # type: ignore[attr-defined]
-            if hasattr(module, "run_step"):
-                info_func = getattr(module, "get_info", lambda: "Pas d'information disponible pour cette étape.")
-                steps.append((module_name, module.run_step, info_func))
-
-        return steps
+        """Return the test steps as (name, run_step, get_info) tuples, from the step registry (modules imported once, reloaded if modified)."""
+        return [(entry.name, entry.run_step, entry.get_info) for entry in self.plan.entries]
 
     def run(self):
-        """Main execution loop for running all test steps and handling results, errors, and report generation."""
+        """
+        Main execution loop: the steps whose prerequisites are finished run at the same time when they don't share
+        a resource (see step_scheduler), fin_du_test runs last. After a failure no other step is started.
+        """
+        config = self.config
         self.emit_log_message("=== DÉBUT DU TEST ===", "yellow")
         error_found = False
         failure_message = ""
-
-        idx = 0
-        while idx < len(self.steps):
-            step_name, step_func, _ = self.steps[idx]
-            
-            if not self.running:
-                error_found = True  # Mark test as NO if interrupted
-                break
-
-            # If an error occurs, only the final step is executed
-            if error_found and not "fin_du_test" in step_name:
-                idx += 1
-                continue
-
-            # Skip step if it's marked to be skipped
-            if idx in self.skipped_steps:
-                step_name_str: str = str(step_name)
-                self.emit_log_message(f"Étape sautée : {step_name_str.replace('s', '', 1).replace('_', ' ').capitalize()}", "orange")
-                self.update_step.emit(idx, "⏭️", 2, "Étape sautée par l'utilisateur")
-                idx += 1
-                continue
-
-            step_name_str: str = str(step_name)
-            self.emit_log_message(f"Étape : {step_name_str.replace('s', '', 1).replace('_', ' ').capitalize()}", "cyan")
-            self.update_step.emit(idx, "⏳", 2, "Étape en cours")
-
-            try:
-                    # Create percentage update function for this step
-                    update_percentage_func = lambda percentage: self.emit_step_percentage(idx, percentage)
-                    # Store test_thread reference in config for user input requests
-                    config.test_thread = self
-                    success, message = step_func(self.emit_log_message, config, update_percentage_func)
-                    if isinstance(message, dict):
-                        message = json.dumps(message, ensure_ascii=False, indent=2)
-            except (Exception) as e:  # If any bug in steps, we treat them as test passed NOK
-                success = 1
-                message = f"Exception : {e}"
-
-            # Vérification et conversion de message en str si nécessaire
-            if not isinstance(message, str):
-                try:
-                    message = str(message)
-                except Exception:
-                    message = "[Message non affichable]"
-
-            if success == 0:  # Test passed OK
-                self.emit_log_message(message, "green")
-            elif success == 1:  # Test passed NOK
-                if config.printer and config.arg.product_list:
-                    if config.arg.product_list.get("info") != "debug":
-                        try:
-                            msg_obj = json.loads(message) if isinstance(message, str) else message
-                        except json.JSONDecodeError:
-                            msg_obj = message
-                        # If dict, extract step_name and pass the rest as infos
-                        if isinstance(msg_obj, dict) and "step_name" in msg_obj:
-                            label = msg_obj["step_name"]
-                            infos = []
-                            # If 'infos' exists and is a list, only its elements are displayed
-                            if "infos" in msg_obj and isinstance(msg_obj["infos"], list):
-                                for v in msg_obj["infos"]:
-                                    infos.append({"type": "text", "content": str(v), "align": "l", "weight": 500})
-                            else:
-                                for k, v in msg_obj.items():
-                                    if k != "step_name":
-                                        infos.append({"type": "text", "content": f"{k} : {v}", "align": "l", "weight": 500})
-                        else:
-                            label = str(msg_obj)
-                            infos = None
-                        config.printer.custom_print_bdt(
-                            config.arg.operator,
-                            config.arg.product_list.get("info"),
-                            config.device_under_test_id,
-                            label,
-                            infos)
-                self.emit_log_message(message, "red")
-            else:  # Test passed with WARNING
-                self.emit_log_message(message, "yellow")
-
-            # Ensure message is always a string for update_step.emit
-            if isinstance(message, dict):
-                message_str = json.dumps(message, ensure_ascii=False, indent=2)
+        config.cycle_timer.start_cycle()
+        config.initialisation_step_name_id = None
+        # Store test_thread reference in config for user input requests
+        config.test_thread = self
+
+        final_idx = next((idx for idx, (step_name, _, _) in enumerate(self.steps) if step_name.startswith("fin_du_test")), None)
+        pending = [idx for idx in range(len(self.steps)) if idx != final_idx]
+        finished: set[int] = set()
+        running: dict[Any, int] = {}  # future -> step index
+
+        with ThreadPoolExecutor(max_workers=max(1, len(pending)), thread_name_prefix="step") as executor:
+            while pending or running:
+                if not self.running:
+                    error_found = True  # Mark test as NO if interrupted
+                if error_found:
+                    # If an error occurs, the running steps finish and only the final step is executed
+                    pending.clear()
+                for idx in self.plan.next_steps(pending, finished, set(running.values())):
+                    pending.remove(idx)
+                    # Skip step if it's marked to be skipped
+                    if idx in self.skipped_steps:
+                        self.skip_step(idx)
+                        finished.add(idx)
+                    else:
+                        running[executor.submit(self.execute_step, idx)] = idx
+                if not running:
+                    if pending and not self.plan.next_steps(pending, finished, set()):
+                        break  # Not reachable, a step only requires the steps before it
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    idx = running.pop(future)
+                    finished.add(idx)
+                    success, message_str = future.result()
+                    if success and not error_found:
+                        error_found = True
+                        failure_message = message_str
+
+        if not self.running:
+            error_found = True
+        elif final_idx is not None:
+            if final_idx in self.skipped_steps:
+                self.skip_step(final_idx)
             else:
-                message_str = str(message)
-            self.update_step.emit(idx, "✅" if success == 0 else "❌", success, message_str)
+                self.execute_step(final_idx)
 
-            if success and not step_name.startswith("fin_du_test"):
-                # Ensure message is always a string for step_failed.emit
-                if isinstance(message, dict):
-                    message_str = json.dumps(message, ensure_ascii=False, indent=2)
-                else:
-                    message_str = str(message)
-                self.step_failed.emit(step_name, message_str)
-                error_found = True
-                failure_message = message_str
-            
-            # Move to next step
-            idx += 1
+        self.save_cycle_timing()
 
         # Update of the overall result in the database
         if error_found or self.skipped_steps:
@@ -225,7 +159,7 @@ class TestThread(QThread):
                 report = DeviceReport(config.db, int(device_id), debug=config.arg.show_all_logs)  # type: ignore[attr-defined]
                 report.fetch_data()
                 report.generate_pdf_report(output_path)
-                if configuration.VERSION != "DEBUG":
+                if configuration.VERSION != "DEBUG" and os.name == "nt":
                     os.startfile(output_path)
             except Exception as e:
                 error_msg = f"Erreur lors de la génération du rapport ou de l'ouverture du PDF : {e}"
@@ -233,20 +167,138 @@ class TestThread(QThread):
 
         self.finished.emit()
 
+    def skip_step(self, idx: int):
+        """Report a step skipped by the operator."""
+        step_name_str: str = str(self.steps[idx][0])
+        self.emit_log_message(f"Étape sautée : {step_name_str.replace('s', '', 1).replace('_', ' ').capitalize()}", "orange")
+        self.update_step.emit(idx, "⏭️", 2, "Étape sautée par l'utilisateur")
+
+    def execute_step(self, idx: int) -> Tuple[int, str]:
+        """Run one step, from a worker thread of run() or from run() for fin_du_test, and return (success, message)."""
+        config = self.config
+        step_name, step_func, _ = self.steps[idx]
+        step_name_str: str = str(step_name)
+        self.emit_log_message(f"Étape : {step_name_str.replace('s', '', 1).replace('_', ' ').capitalize()}", "cyan")
+        self.update_step.emit(idx, "⏳", 2, "Étape en cours")
+
+        config.cycle_timer.start_step(step_name)
+        try:
+            # Create percentage update function for this step
+            update_percentage_func = lambda percentage: self.emit_step_percentage(idx, percentage)
+            success, message = step_func(self.emit_log_message, config, update_percentage_func)
+        except (Exception) as e:  # If any bug in steps, we treat them as test passed NOK
+            success = 1
+            message = f"Exception : {e}"
+
+        # Write the measurements queued during the step (write-behind sink)
+        try:
+            config.flush_values()
+        except Exception as e:
+            self.emit_log_message(f"Erreur lors de l'enregistrement des mesures, elles restent dans le journal local : {e}", "yellow")
+        config.cycle_timer.end_step(success)
+
+        # Vérification et conversion de message en str si nécessaire (les dict sont gardés pour l'affichage)
+        if not isinstance(message, (str, dict)):
+            try:
+                message = str(message)
+            except Exception:
+                message = "[Message non affichable]"
+
+        if success == 0:  # Test passed OK
+            self.emit_log_message(message, "green")
+        elif success == 1:  # Test passed NOK
+            if config.printer and config.arg.product_list:
+                if config.arg.product_list.get("info") != "debug":
+                    try:
+                        msg_obj = json.loads(message) if isinstance(message, str) else message
+                    except json.JSONDecodeError:
+                        msg_obj = message
+                    # If dict, extract step_name and pass the rest as infos
+                    if isinstance(msg_obj, dict) and "step_name" in msg_obj:
+                        label = msg_obj["step_name"]
+                        infos = []
+                        # If 'infos' exists and is a list, only its elements are displayed
+                        if "infos" in msg_obj and isinstance(msg_obj["infos"], list):
+                            for v in msg_obj["infos"]:
+                                infos.append({"type": "text", "content": str(v), "align": "l", "weight": 500})
+                        else:
+                            for k, v in msg_obj.items():
+                                if k != "step_name":
+                                    infos.append({"type": "text", "content": f"{k} : {v}", "align": "l", "weight": 500})
+                    else:
+                        label = str(msg_obj)
+                        infos = None
+                    with arbiter.use(RESOURCE_PRINTER):
+                        config.printer.custom_print_bdt(
+                            config.arg.operator,
+                            config.arg.product_list.get("info"),
+                            config.device_under_test_id,
+                            label,
+                            infos)
+            self.emit_log_message(message, "red")
+        else:  # Test passed with WARNING
+            self.emit_log_message(message, "yellow")
+
+        # Ensure message is always a string for update_step.emit
+        if isinstance(message, dict):
+            message_str = json.dumps(message, ensure_ascii=False, indent=2)
+        else:
+            message_str = str(message)
+        self.update_step.emit(idx, "✅" if success == 0 else "❌", success, message_str)
+
+        if success and not step_name.startswith("fin_du_test"):
+            self.step_failed.emit(step_name, message_str)
+        return success, message_str
+
+    def save_cycle_timing(self):
+        """Show the time spent per step and per phase, and save it in skvp_json under the key cycle_timing of the s01 step."""
+        config = self.config
+        self.emit_log_message({"step_name": "Temps de cycle", "infos": config.cycle_timer.summary()}, "blue")
+        if config.db is None or config.initialisation_step_name_id is None:
+            return
+        try:
+            config.save_value(config.initialisation_step_name_id, "cycle_timing", config.cycle_timer.to_dict())
+            config.flush_values()
+        except Exception as e:
+            self.emit_log_message(f"Erreur lors de l'enregistrement des temps de cycle : {e}", "yellow")
+
     def stop(self):
         """Request the thread to stop execution."""
         self.running = False
+        # Release a step waiting for the operator
+        if self.config.pending_user_input is not None:
+            self.config.pending_user_input.cancel()
+
 
+class PrefetchThread(QThread):
+    """Prepare the next board (bench context and DAQ check) while the operator swaps boards."""
+    log_message = pyqtSignal(object, str)
+
+    def __init__(self, step_name, slot_config, slot_index=0):
+        super().__init__()
+        self.step_name = step_name
+        self.config = slot_config
+        self.slot_index = slot_index
+
+    def run(self):
+        try:
+            prepared = prepare_next_cycle(self.config, self.step_name)
+            self.log_message.emit(f"Carte suivante préparée (contexte du banc {'inchangé' if prepared.reused else 'rechargé'}, DAQ vérifié).", "blue")
+        except Exception as e:
+            try:
+                rollback_prepared_cycle(self.config)
+            except Exception:
+                pass
+            self.log_message.emit(f"Préparation de la carte suivante impossible, elle sera faite au démarrage : {e}", "yellow")
 
 class MainWindow(QWidget):
     """Main application window for the CAPSYS DualCap Test Bench GUI."""
-    def __init__(self):
-        """Initialize the main window, set up UI, and prepare logging and test thread."""
+    def __init__(self, slot_configs=None):
+        """Initialize the main window, set up UI, and prepare logging and test threads (one per slot)."""
         super().__init__()
-        log_dir = os.path.join(tempfile.gettempdir(), "log_banc_de_test_capsys")
-        os.makedirs(log_dir, exist_ok=True)
-        today = datetime.now().strftime("%Y-%m-%d")
-        self.log_file_path = os.path.join(log_dir, f"log_{today}.txt")
+        self.slot_configs: list[configuration.AppConfig] = slot_configs or [config]
+        self.multi_slot = len(self.slot_configs) > 1
+        self.log_sink = LogSink(configuration.LOG_DIR)
         self.setWindowTitle(f"{config.arg.name} - Version : {config.arg.version} - Commit : {config.arg.hash_git} - Auteur : {config.arg.author}")
         self.setWindowIcon(QIcon(configuration.CURRENT_PATH + "\\assets\\logo-big.png"))
 
@@ -255,7 +307,13 @@ class MainWindow(QWidget):
         self.step_infos = []
         self.step_messages = {}
         self.skip_checkboxes = []
-        self.test_thread = TestThread()
+        self.user_input_dialogs: dict[int, Any] = {}  # slot index -> dialog waiting for the operator
+        self.prefetch_threads: dict[int, PrefetchThread] = {}  # slot index -> preparation of its next board
+        self.starts_after_prefetch: set[int] = set()  # Slots started while their preparation was running
+        self.cancels_after_prefetch: set[int] = set()  # Slots whose running preparation is dropped when it ends
+        self.log_batch: list[list[tuple[str, QTextCharFormat]]] = []  # Messages waiting for the next render
+        self.test_logs: list[list[str]] = [[] for _ in self.slot_configs]  # Plain text log of the current test of each slot, saved in the database
+        self.test_threads: dict[int, TestThread] = {}  # slot index -> test thread
 
         self.setup_ui()
 
@@ -286,17 +344,42 @@ class MainWindow(QWidget):
             QTimer.singleShot(0, self.set_fullscreen_mode)
 
         # Load the test steps and their info functions
-        self.step_infos = [info for _, _, info in self.test_thread.steps]
+        self.step_infos = [entry.get_info for entry in step_registry.steps()]
         
         # Log arguments only in complete mode (will be logged after mode is set)
         if not self.has_arguments:
             for arg in sys.argv:
                 self.append_log(arg)
         
-        config.printer = PrinterDC(configuration.PRINTER_NAME, debug=config.arg.show_all_logs)
-        if not config.printer.connected:
+        # The printer driver is loaded once the window is displayed
+        QTimer.singleShot(0, self.connect_printer)
+        if import_profiler is not None:
+            QTimer.singleShot(0, self.save_import_profile)
+
+    def connect_printer(self):
+        """Connect the receipt printer used for the failure tickets (shared by the slots)."""
+        printer = PrinterDC(configuration.PRINTER_NAME, debug=config.arg.show_all_logs)
+        # Simulated label printer for s07, the real one is not opened by the bench
+        brady_printer = BradyBP12Printer() if simulation is not None else None
+        for slot_config in self.slot_configs:
+            slot_config.printer = printer
+            if brady_printer is not None:
+                slot_config.brady_printer = brady_printer
+        if not printer.connected:
             self.append_log("Erreur de connexion à l'imprimante.", "yellow")
 
+    def save_import_profile(self):
+        """Stop the import profile once the window is displayed and save it in the log folder."""
+        import_profiler.stop()
+        try:
+            path = import_profiler.save(configuration.LOG_DIR)
+        except OSError as e:
+            self.append_log(f"Erreur lors de l'enregistrement du profil des imports : {e}", "yellow")
+            return
+        infos = [f"Fenêtre affichée {import_profiler.elapsed:.2f} s après le début des imports, rapport : {path}"]
+        infos += [f"{name} : {cumulative * 1000:.0f} ms" for name, _, cumulative in import_profiler.top(10)]
+        self.append_log({"step_name": "Profil des imports", "infos": infos}, "blue")
+
     def set_simple_mode_with_arguments(self):
         """Set simple mode when the script is executed with arguments."""
         if self.has_arguments:
@@ -312,15 +395,20 @@ class MainWindow(QWidget):
 
     def closeEvent(self, a0: QCloseEvent | None):
         """Clean up resources and close database connection when the window is closed."""
-        # Stop the test thread if it's running
-        if self.test_thread and self.test_thread.isRunning():
-            self.test_thread.quit()
-            self.test_thread.wait()
-        try:
-            # Call cleanup to release all resources (db, mcp_manager, daq_manager, serDut)
-            config.cleanup()
-        except Exception as e:
-            print(f"Erreur lors du cleanup : {e}")
+        # Stop the test threads that are running
+        for test_thread in self.test_threads.values():
+            if test_thread.isRunning():
+                test_thread.stop()
+                test_thread.quit()
+                test_thread.wait()
+        self.cancel_prefetch(wait=True)
+        # Call cleanup to release all resources (db, mcp_manager, daq_manager, serDut), the first slot owns the hardware session and is the last one
+        for slot_config in reversed(self.slot_configs):
+            try:
+                slot_config.cleanup()
+            except Exception as e:
+                print(f"Erreur lors du cleanup : {e}")
+        self.log_sink.close()
 
         if a0 is not None:
             a0.accept()
@@ -369,6 +457,23 @@ class MainWindow(QWidget):
         steps_layout = QVBoxLayout(steps_container)
         steps_layout.setContentsMargins(5, 5, 5, 5)
         
+        # Multi-slot bench: one status column per slot, each with its own start button
+        if self.multi_slot:
+            header_frame = QFrame()
+            header = QHBoxLayout(header_frame)
+            header.setContentsMargins(0, 2, 0, 2)
+            header.addSpacing(30)
+            header.addStretch(1)
+            for slot_idx, slot_config in enumerate(self.slot_configs):
+                slot_button = QPushButton(slot_config.slot.name)
+                slot_button.setToolTip(f"Démarrer le test de {slot_config.slot.name}")
+                slot_button.clicked.connect(lambda checked, idx=slot_idx: self.start_slot(idx))
+                slot_button.setFixedWidth(100)
+                slot_button.setStyleSheet("font-size: 12px;")
+                header.addWidget(slot_button, alignment=Qt.AlignmentFlag.AlignVCenter)
+            header.addSpacing(180)  # Skip checkbox, info and message buttons
+            steps_layout.addWidget(header_frame)
+
         # Create a horizontal layout for the steps
         self.steps = self.load_step_names()
         self.step_row_widgets = []  # Store row widgets for scrolling
@@ -388,12 +493,17 @@ class MainWindow(QWidget):
             label_step_name = QLabel(step_str.replace('_', ' ').capitalize())
             label_step_name.setStyleSheet("color: white; font-size: 14px;")
             row.addWidget(label_step_name, alignment=Qt.AlignmentFlag.AlignVCenter)
-
-            label_status = QLabel(f"{i + 1} ⏳")
-            label_status.setAlignment(Qt.AlignmentFlag.AlignCenter)
-            label_status.setFixedWidth(100)
-            label_status.setStyleSheet("font-size: 16px;")
-            row.addWidget(label_status, alignment=Qt.AlignmentFlag.AlignVCenter)
+            if self.multi_slot:
+                row.addStretch(1)  # Status columns aligned under the slot buttons
+
+            status_labels = []
+            for slot_idx in range(len(self.slot_configs)):
+                label_status = QLabel(f"{i + 1} ⏳")
+                label_status.setAlignment(Qt.AlignmentFlag.AlignCenter)
+                label_status.setFixedWidth(100)
+                label_status.setStyleSheet("font-size: 16px;")
+                row.addWidget(label_status, alignment=Qt.AlignmentFlag.AlignVCenter)
+                status_labels.append(label_status)
 
             # Add a skip checkbox for each step (except for initialisation and fin_du_test)
             if step.lower() not in ["initialisation", "fin_du_test"]:
@@ -425,11 +535,12 @@ class MainWindow(QWidget):
             message_button.setStyleSheet("font-size: 14px;")
             row.addWidget(message_button, alignment=Qt.AlignmentFlag.AlignVCenter)
             # Initialize the message as empty
-            self.step_messages[i] = "Lancer un test pour avoir des informations"
+            for slot_idx in range(len(self.slot_configs)):
+                self.step_messages[(slot_idx, i)] = "Lancer un test pour avoir des informations"
 
             steps_layout.addWidget(row_frame)
             self.step_row_widgets.append(row_frame)
-            self.steps_widgets.append((label_step_name, label_status))
+            self.steps_widgets.append((label_step_name, status_labels))
         
         # Set the steps container in the scroll area
         self.steps_scroll_area.setWidget(steps_container)
@@ -449,7 +560,13 @@ class MainWindow(QWidget):
         self.log_area.setStyleSheet("font-size: 12px; font-family: 'Consolas', monospace;")
         main_layout.addWidget(self.log_label)
         self.log_area.setMinimumHeight(300)
+        self.log_area.document().setMaximumBlockCount(LOG_MAX_BLOCKS)
         main_layout.addWidget(self.log_area, stretch=2)
+        self.log_formats = self.build_log_formats()
+        self.log_timer = QTimer(self)
+        self.log_timer.setSingleShot(True)
+        self.log_timer.setInterval(LOG_RENDER_INTERVAL_MS)
+        self.log_timer.timeout.connect(self.render_log_batch)
 
         # Create a button layout
         self.button_layout = QHBoxLayout()
@@ -458,6 +575,12 @@ class MainWindow(QWidget):
         self.generate_report_checkbox.setChecked(False)  # Par défaut décochée
         self.generate_report_checkbox.setStyleSheet("font-size: 12px;")
         self.button_layout.addWidget(self.generate_report_checkbox)
+        # Checkbox for the preparation of the next board at the end of a test
+        self.prefetch_checkbox = QCheckBox("Préparer la carte suivante")
+        self.prefetch_checkbox.setChecked(True)
+        self.prefetch_checkbox.setStyleSheet("font-size: 12px;")
+        self.prefetch_checkbox.toggled.connect(self.toggle_prefetch)
+        self.button_layout.addWidget(self.prefetch_checkbox)
         # Start button
         self.start_button = QPushButton("Démarrer le test")
         self.start_button.clicked.connect(self.start_test)
@@ -491,19 +614,43 @@ class MainWindow(QWidget):
         self.setLayout(main_layout)
 
     def show_step_message(self, idx):
-        """Show the stored message for the step at the given index in a dialog box."""
-        message = self.step_messages.get(idx, "Aucun message disponible.")  # Retrieves the stored message
+        """Show the stored message for the step at the given index (of every slot) in a dialog box."""
+        if self.multi_slot:
+            message = "\n\n".join(
+                f"{slot_config.slot.name} :\n{self.step_messages.get((slot_idx, idx), 'Aucun message disponible.')}"
+                for slot_idx, slot_config in enumerate(self.slot_configs)
+            )
+        else:
+            message = self.step_messages.get((0, idx), "Aucun message disponible.")  # Retrieves the stored message
         QMessageBox.information(self, f"Message Étape {idx + 1}", message)
 
+    def sender_slot(self) -> Optional[int]:
+        """Index of the slot whose thread emitted the signal being handled, None if not called by a slot thread."""
+        return getattr(self.sender(), "slot_index", None)
+
+    def slot_title(self, text: str, slot_idx: Optional[int]) -> str:
+        """Prefix a dialog title with the name of the slot on a multi-slot bench."""
+        if self.multi_slot and slot_idx is not None:
+            return f"{self.slot_configs[slot_idx].slot.name} - {text}"
+        return text
+
+    def slot_running(self, slot_idx: int) -> bool:
+        test_thread = self.test_threads.get(slot_idx)
+        return test_thread is not None and test_thread.isRunning()
+
+    def tests_running(self) -> bool:
+        return any(self.slot_running(slot_idx) for slot_idx in range(len(self.slot_configs)))
+
     def show_user_input_dialog(self, title, message, callback, font_size=14):
         """Display an input dialog to get text from the user and call the callback with the result."""
         from PyQt6.QtWidgets import QDialog, QVBoxLayout, QLabel, QLineEdit, QPushButton, QHBoxLayout
         from PyQt6.QtGui import QFont
         from PyQt6.QtCore import Qt
         
-        # Create a custom dialog
+        # Create a custom dialog, the slots waiting for the operator each have their own
+        slot_idx = self.sender_slot()
         dialog = QDialog(self)
-        dialog.setWindowTitle(title)
+        dialog.setWindowTitle(self.slot_title(title, slot_idx))
         dialog.setMinimumWidth(600)
         
         layout = QVBoxLayout()
@@ -546,14 +693,30 @@ class MainWindow(QWidget):
         
         dialog.setLayout(layout)
         
-        # Execute dialog
-        result = dialog.exec()
-        text = input_field.text()
-        
-        if result == QDialog.DialogCode.Accepted:
-            callback(text)
-        else:
-            callback(None)
+        # Show the dialog without a nested event loop: each slot's dialog answers on its own,
+        # the callback is called when the dialog is closed
+        dialog_key = slot_idx if slot_idx is not None else 0
+        self.user_input_dialogs[dialog_key] = dialog
+
+        def on_finished(result):
+            if self.user_input_dialogs.get(dialog_key) is dialog:
+                self.user_input_dialogs.pop(dialog_key, None)
+            if result == QDialog.DialogCode.Accepted.value:
+                callback(input_field.text())
+            else:
+                callback(None)
+
+        dialog.finished.connect(on_finished)
+        dialog.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
+        dialog.open()
+
+    def close_user_input_dialog(self):
+        """Close the user input dialog of the slot that stopped waiting for it (every dialog when the test is stopped)."""
+        slot_idx = self.sender_slot()
+        dialogs = list(self.user_input_dialogs.values()) if slot_idx is None else [self.user_input_dialogs.get(slot_idx)]
+        for dialog in dialogs:
+            if dialog is not None:
+                dialog.reject()
 
     def update_window_size(self):
         """Update window size based on current mode."""
@@ -631,21 +794,8 @@ class MainWindow(QWidget):
             self.update_steps_height()
 
     def load_step_names(self):
-        """Load and return the list of step names from the 'steps' directory."""
-        steps_folder = os.path.join(os.path.dirname(__file__), "steps")
-        step_dirs = sorted(
-            d
-            for d in os.listdir(steps_folder)
-            if os.path.isdir(os.path.join(steps_folder, d))
-            and (d.startswith("s") and d[1:].isdigit() or d == "zz")
-        )
-        step_names = []
-        for dir_name in step_dirs:
-            dir_path = os.path.join(steps_folder, dir_name)
-            py_files = sorted(f for f in os.listdir(dir_path) if f.endswith(".py"))
-            for filename in py_files:
-                step_names.append(f"{filename[:-3].capitalize()}")
-        return step_names
+        """Return the names of the steps shown in the step list, from the step registry."""
+        return [entry.display_name for entry in step_registry.steps()]
 
     def show_step_info(self, idx):
         """Show information about the step at the given index using its get_info function."""
@@ -723,13 +873,34 @@ class MainWindow(QWidget):
         dialog.exec()
 
     def start_test(self):
-        """Start the test sequence by launching the test thread and resetting the UI."""
-        if self.test_thread and self.test_thread.isRunning():
-            self.log_area.append("Un test est déjà en cours...")
+        """Start the test sequence on every slot that is not already testing a board."""
+        idle_slots = [slot_idx for slot_idx in range(len(self.slot_configs)) if not self.slot_running(slot_idx)]
+        if not idle_slots:
+            self.append_log("Un test est déjà en cours...")
             return
+        for slot_idx in idle_slots:
+            self.start_slot(slot_idx)
 
-        self.log_area.clear()
-        self.reset_steps()
+    def start_slot(self, slot_idx: int):
+        """Start the test sequence of one slot by launching its test thread and resetting its step column."""
+        if self.slot_running(slot_idx):
+            self.append_log("Un test est déjà en cours...", slot=slot_idx)
+            return
+        # The preparation of this board uses the database connection, the slot starts when it is finished
+        # (it may wait for the DAQ lock, the window must not freeze meanwhile)
+        prefetch_thread = self.prefetch_threads.get(slot_idx)
+        if prefetch_thread is not None and prefetch_thread.isRunning():
+            if slot_idx not in self.starts_after_prefetch:
+                self.starts_after_prefetch.add(slot_idx)
+                self.append_log("Démarrage dès la fin de la préparation de la carte...", "blue", slot_idx)
+            return
+
+        if not self.tests_running():
+            # The log area is shared by the slots, it is only cleared when no other board is being tested
+            self.log_batch.clear()
+            self.log_area.clear()
+        self.test_logs[slot_idx].clear()
+        self.reset_steps(slot_idx)
 
         # Get skipped steps from checkboxes (only consider actual QCheckBox objects)
         skipped_steps = set()
@@ -739,14 +910,16 @@ class MainWindow(QWidget):
                 skipped_steps.add(i)
 
         generate_report = self.generate_report_checkbox.isChecked()
-        self.test_thread = TestThread(skipped_steps, generate_report)
-        self.test_thread.update_step.connect(self.update_step_status)
-        self.test_thread.update_step_percentage.connect(self.update_step_percentage)
-        self.test_thread.log_message.connect(self.append_log)
-        self.test_thread.finished.connect(self.test_finished)
-        self.test_thread.step_failed.connect(self.handle_step_failure)
-        self.test_thread.request_user_input.connect(self.show_user_input_dialog)
-        self.test_thread.start()
+        test_thread = TestThread(skipped_steps, generate_report, self.slot_configs[slot_idx], slot_idx)
+        test_thread.update_step.connect(self.update_step_status)
+        test_thread.update_step_percentage.connect(self.update_step_percentage)
+        test_thread.log_message.connect(self.append_log)
+        test_thread.finished.connect(self.test_finished)
+        test_thread.step_failed.connect(self.handle_step_failure)
+        test_thread.request_user_input.connect(self.show_user_input_dialog)
+        test_thread.close_user_input.connect(self.close_user_input_dialog)
+        self.test_threads[slot_idx] = test_thread
+        test_thread.start()
 
     def handle_step_failure(self, step_name, message):
         """Display a critical error dialog when a test step fails."""
@@ -764,50 +937,57 @@ class MainWindow(QWidget):
             msg_to_show = "\n".join([str(v) for v in obj["infos"]])
         elif isinstance(obj, dict):
             msg_to_show = ", ".join([f"{k}: {v}" for k, v in obj.items()])
-        QMessageBox.critical(self, f"Erreur", f"L'étape '{step_name[3:]}' a échoué :\n{msg_to_show}")
+        QMessageBox.critical(self, self.slot_title("Erreur", self.sender_slot()), f"L'étape '{step_name[3:]}' a échoué :\n{msg_to_show}")
 
     def stop_test(self):
-        """Stop the test thread and run the cleanup step if necessary."""
-        if not (self.test_thread and self.test_thread.isRunning()):
+        """Stop the test threads of every slot and run the cleanup step if necessary."""
+        running_slots = [slot_idx for slot_idx in self.test_threads if self.slot_running(slot_idx)]
+        if not running_slots:
             self.append_log("Aucun test en cours à arrêter.", "yellow")
             return
-        self.test_thread.stop()  # Gentle request to stop
-        # Wait up to 5 seconds for the thread to terminate
-        finished = self.test_thread.wait(5000)
-        if not finished:
-            self.append_log("Arrêt forcé du thread de test après 5s...", "yellow")
-            self.test_thread.terminate()
-            self.test_thread.wait()
-        # Run the cleanup step Fin_du_test.py
-        try:
-            step_path = os.path.join(os.path.dirname(__file__), "steps", "zz", "Fin_du_test.py")
-            spec = importlib.util.spec_from_file_location("Fin_du_test", step_path)
-            if spec is not None and spec.loader is not None:
-                fin_du_test = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(fin_du_test)
-                if hasattr(fin_du_test, "run_step"):
-                    success, message = fin_du_test.run_step(self.append_log, config)
+        for slot_idx in running_slots:
+            self.test_threads[slot_idx].stop()  # Gentle request to stop (also releases a step waiting for the operator)
+        self.close_user_input_dialog()
+        for slot_idx in running_slots:
+            test_thread = self.test_threads[slot_idx]
+            log = partial(self.append_log, slot=slot_idx)
+            # Wait up to 5 seconds for the thread to terminate
+            finished = test_thread.wait(5000)
+            if not finished:
+                log("Arrêt forcé du thread de test après 5s...", "yellow")
+                test_thread.terminate()
+                test_thread.wait()
+            # Run the cleanup step Fin_du_test.py
+            try:
+                fin_du_test = step_registry.get("fin_du_test")
+                if fin_du_test is not None:
+                    success, message = fin_du_test.run_step(log, self.slot_configs[slot_idx])
                     color = "green" if success == 0 else ("yellow" if success == 2 else "red")
-                    self.append_log(f"[Fin_du_test] {message}", color)
+                    log(f"[Fin_du_test] {message}", color)
                 else:
-                    self.append_log("La fonction run_step n'a pas été trouvée dans Fin_du_test.py.", "red")
-            else:
-                self.append_log("Impossible de charger le module Fin_du_test.py.", "red")
-        except Exception as e:
-            self.append_log(f"Erreur lors de l'exécution de Fin_du_test.py : {e}", "red")
+                    log("La fonction run_step n'a pas été trouvée dans Fin_du_test.py.", "red")
+            except Exception as e:
+                log(f"Erreur lors de l'exécution de Fin_du_test.py : {e}", "red")
 
-    def reset_steps(self):
-        """Reset the step status indicators in the UI to their initial state."""
-        for idx, (label_step_name, label_status) in enumerate(self.steps_widgets):
+    def reset_steps(self, slot_idx=None):
+        """Reset the step status indicators of a slot (every slot by default) in the UI to their initial state."""
+        slot_indexes = range(len(self.slot_configs)) if slot_idx is None else [slot_idx]
+        for idx, (label_step_name, status_labels) in enumerate(self.steps_widgets):
             label_step_name.setStyleSheet("color: white; font-size: 14px;")
             step_number = idx + 1
-            label_status.setText(f"{step_number} ⏳")
-        # Reset global progress bar
-        self.global_progress_bar.setValue(0)
+            for i in slot_indexes:
+                status_labels[i].setText(f"{step_number} ⏳")
+                status_labels[i].setStyleSheet("font-size: 16px;")
+        # Reset global progress bar (steps of the slots still testing are kept)
+        self.update_global_progress()
 
     def update_step_status(self, idx, status, success, message="", percentage=None):
         """Update the status and color of a step in the UI and store its message."""
-        label_step_name, label_status = self.steps_widgets[idx]
+        slot_idx = self.sender_slot()
+        if slot_idx is None:
+            slot_idx = 0
+        label_step_name, status_labels = self.steps_widgets[idx]
+        label_status = status_labels[slot_idx]
         # Add step number to the left of the status, with optional percentage
         step_number = idx + 1
         if percentage is not None:
@@ -816,18 +996,23 @@ class MainWindow(QWidget):
             status_with_number = f"{step_number} {status}"
         label_status.setText(status_with_number)
         if success == 0:
-            label_step_name.setStyleSheet("color: green; font-size: 14px;")
+            color = "green"
         elif "Étape en cours" in message:
-            label_step_name.setStyleSheet("color: yellow; font-size: 14px;")
+            color = "yellow"
             # Scroll to the current step when it's in progress
             self.scroll_to_step(idx)
         elif "Étape sautée par l'utilisateur" in message:
-            label_step_name.setStyleSheet("color: orange; font-size: 14px;")
+            color = "orange"
+        else:
+            color = "red"
+        if self.multi_slot:
+            # The step name is shared by the slots, the color goes to the status of the slot
+            label_status.setStyleSheet(f"color: {color}; font-size: 16px;")
         else:
-            label_step_name.setStyleSheet("color: red; font-size: 14px;")
+            label_step_name.setStyleSheet(f"color: {color}; font-size: 14px;")
 
         # Store the step message
-        self.step_messages[idx] = message
+        self.step_messages[(slot_idx, idx)] = message
         # self.append_log(f"Message de l'étape {idx + 1} : {message}", "blue")
         
         # Update global progress bar
@@ -836,7 +1021,9 @@ class MainWindow(QWidget):
     def update_step_percentage(self, idx, percentage):
         """Update only the percentage of a step without changing its status."""
         if idx < len(self.steps_widgets):
-            label_step_name, label_status = self.steps_widgets[idx]
+            slot_idx = self.sender_slot()
+            label_step_name, status_labels = self.steps_widgets[idx]
+            label_status = status_labels[slot_idx if slot_idx is not None else 0]
             current_text = label_status.text()
             step_number = idx + 1
             
@@ -870,105 +1057,110 @@ class MainWindow(QWidget):
         if not self.steps_widgets:
             return
         
-        total_steps = len(self.steps_widgets)
+        total_steps = len(self.steps_widgets) * len(self.slot_configs)
         completed_steps = 0
         
-        # Count completed steps (both success and failed)
-        for _, label_status in self.steps_widgets:
-            status_text = label_status.text()
-            if "✅" in status_text or "❌" in status_text or "⏭️" in status_text:
-                completed_steps += 1
+        # Count completed steps (both success and failed) of every slot
+        for _, status_labels in self.steps_widgets:
+            for label_status in status_labels:
+                status_text = label_status.text()
+                if "✅" in status_text or "❌" in status_text or "⏭️" in status_text:
+                    completed_steps += 1
         
         # Calculate progress percentage
         progress_percentage = int((completed_steps / total_steps) * 100) if total_steps > 0 else 0
         self.global_progress_bar.setValue(progress_percentage)
 
-    def append_log(self, message, color="white"):
-        """Append a log message to the log area and save it to the log file."""
-        from PyQt6.QtGui import QTextCursor, QTextCharFormat, QColor, QFont
-
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-        cursor = self.log_area.textCursor()
-        cursor.movePosition(QTextCursor.MoveOperation.End)
-
-        # Format for the timestamp (always in gray)
+    def build_log_formats(self) -> dict:
+        """Build the text formats of the log area once: timestamp, then plain and dict messages for each color."""
+        formats = {}
         timestamp_format = QTextCharFormat()
         timestamp_format.setForeground(QColor("#888888"))
-        cursor.insertText(f"[{now}] ", timestamp_format)
-
-
-        color_map = {
-            "white": "#ffffff",
-            "yellow": "#ffff00",
-            "cyan": "#00ffff",
-            "blue": "#4da6ff",
-            "green": "#00ff00",
-            "orange": "#ffa500",
-            "red": "#ff4444",
-            "purple": "#ff00ff"
-        }
+        formats["timestamp"] = timestamp_format
+        for name, value in LOG_COLORS.items():
+            message_format = QTextCharFormat()
+            message_format.setForeground(QColor(value))
+            message_format.setFontPointSize(12)
+            formats[("text", name)] = message_format
+            dict_format = QTextCharFormat(message_format)
+            dict_format.setFontFamily("Consolas")
+            formats[("dict", name)] = dict_format
+        return formats
+
+    def append_log(self, message, color="white", slot=None):
+        """
+        Queue a log message for the log area (rendered by render_log_batch) and save it to the log file.
+        The message goes to the test log of the slot that sent it, or of every slot if it doesn't come from a slot.
+        """
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        if slot is None:
+            slot = self.sender_slot()
+        prefix = f"[{self.slot_configs[slot].slot.name}] " if self.multi_slot and slot is not None else ""
 
         # Custom display for dict with 'infos' key
-        if isinstance(message, str):
+        obj = None
+        if isinstance(message, dict):
+            obj = message
+        elif isinstance(message, str) and message.startswith("{"):
             try:
                 obj = json.loads(message)
-            except Exception:
+            except json.JSONDecodeError:
                 obj = None
-        elif isinstance(message, dict):
-            obj = message
-        else:
-            obj = None
 
         # Determine color for dict display
-        dict_color = color_map["green"] if color == "green" else (color_map["red"] if color == "red" else color_map["blue"])
+        dict_format = self.log_formats[("dict", color if color in ("green", "red") else "blue")]
 
         if isinstance(obj, dict) and "infos" in obj and isinstance(obj["infos"], list):
-            message_format = QTextCharFormat()
-            message_format.setForeground(QColor(dict_color))
-            message_format.setFontFamily("Consolas")
-            message_format.setFontPointSize(12)
-            for v in obj["infos"]:
-                cursor.insertText(f"{v}\n", message_format)
-            plain_message = f"[{now}] " + "\n".join([str(v) for v in obj["infos"]]) + "\n"
+            lines = [str(v) for v in obj["infos"]]
+            message_format = dict_format
         elif isinstance(obj, dict):
-            message_format = QTextCharFormat()
-            message_format.setForeground(QColor(dict_color))
-            message_format.setFontFamily("Consolas")
-            message_format.setFontPointSize(12)
-            for k, v in obj.items():
-                cursor.insertText(f"{k} : {v}\n", message_format)
-            plain_message = f"[{now}] " + "\n".join([f"{k} : {v}" for k, v in obj.items()]) + "\n"
+            lines = [f"{k} : {v}" for k, v in obj.items()]
+            message_format = dict_format
         else:
-            message_format = QTextCharFormat()
-            message_color = color_map.get(color, "#ffffff")
-            message_format.setForeground(QColor(message_color))
-            message_format.setFontPointSize(12)
-            cursor.insertText(f"{message}\n", message_format)
-            plain_message = f"[{now}] {message}\n"
-
+            lines = [str(message)]
+            message_format = self.log_formats.get(("text", color), self.log_formats[("text", "white")])
+        text = "\n".join(lines) + "\n"
+        plain_message = f"[{now}] {prefix}{text}"
+
+        self.log_batch.append([(f"[{now}] {prefix}", self.log_formats["timestamp"]), (text, message_format)])
+        if not self.log_timer.isActive():
+            self.log_timer.start()
+        for test_log in (self.test_logs if slot is None else [self.test_logs[slot]]):
+            test_log.append(plain_message)
+
+        # Saving to file (written by the log sink thread)
+        self.log_sink.write(plain_message)
+
+    def render_log_batch(self):
+        """Insert the queued log messages in one edit block and scroll once to the end."""
+        if not self.log_batch:
+            return
+        # Messages beyond the block limit would be dropped right after being inserted
+        batch = self.log_batch[-LOG_MAX_BLOCKS:]
+        self.log_batch = []
+        cursor = QTextCursor(self.log_area.document())
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.beginEditBlock()
+        for segments in batch:
+            for text, text_format in segments:
+                cursor.insertText(text, text_format)
+        cursor.endEditBlock()
         self.log_area.setTextCursor(cursor)
         self.log_area.ensureCursorVisible()
 
-        # Saving to file
-        try:
-            with open(self.log_file_path, "a", encoding="utf-8") as f:
-                f.write(plain_message)
-        except Exception as e:
-            print(f"Erreur lors de l'écriture du log : {e}")
-
     def test_finished(self):
-        """Handle the end of the test sequence, update the log, and store results in the database."""
-        from PyQt6.QtGui import QTextCursor, QTextCharFormat, QColor
-        
+        """Handle the end of the test sequence of a slot, update the log, and store results in the database."""
+        slot_idx = self.sender_slot()
+        if slot_idx is None:
+            slot_idx = 0
+        slot_config = self.slot_configs[slot_idx]
+        status_texts = [status_labels[slot_idx].text() for _, status_labels in self.steps_widgets]
         # Check if all steps are successful (contains ✅), considering percentage and step number
-        all_success = all("✅" in label_status.text() for _, label_status in self.steps_widgets)
+        all_success = all("✅" in text for text in status_texts)
         # Check if any step has an error (contains ❌)
-        any_error = any("❌" in label_status.text() for _, label_status in self.steps_widgets)
+        any_error = any("❌" in text for text in status_texts)
         # Check if any step was skipped (contains ⏭️)
-        any_skipped = any("⏭️" in label_status.text() for _, label_status in self.steps_widgets)
-
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        any_skipped = any("⏭️" in text for text in status_texts)
 
         if all_success and not any_skipped:
             color = "green"
@@ -980,34 +1172,73 @@ class MainWindow(QWidget):
             color = "yellow"
             message = "Test interrompu ou étape sautée"
 
-        # Add the final message with color formatting
-        cursor = self.log_area.textCursor()
-        cursor.movePosition(QTextCursor.MoveOperation.End)
+        # Add the final message and render it without waiting for the timer
+        self.append_log(message, color, slot_idx)
+        self.render_log_batch()
         
-        # Format for the timestamp
-        timestamp_format = QTextCharFormat()
-        timestamp_format.setForeground(QColor("#888888"))
-        cursor.insertText(f"[{now}] ", timestamp_format)
-        
-        # Format for the final message
-        message_format = QTextCharFormat()
-        color_map = {
-            "green": "#00ff00",
-            "red": "#ff4444",
-            "yellow": "#ffff00"
-        }
-        message_color = color_map.get(color, "#ffffff")
-        message_format.setForeground(QColor(message_color))
-        cursor.insertText(f"{message}\n\n", message_format)
-        
-        self.log_area.setTextCursor(cursor)
-        self.log_area.ensureCursorVisible()
-        
-        log_text = self.log_area.toPlainText()
+        log_text = "".join(self.test_logs[slot_idx])
         try:
-            config.db.create("log", {"device_under_test_id": config.device_under_test_id, "value": log_text})  # type: ignore[attr-defined]
+            slot_config.db.create("log", {"device_under_test_id": slot_config.device_under_test_id, "value": log_text})  # type: ignore[attr-defined]
         except Exception as e:
-            self.append_log(f"Erreur lors de l'enregistrement du log en BDD : {e}", "red")
+            self.append_log(f"Erreur lors de l'enregistrement du log en BDD : {e}", "red", slot_idx)
+
+        if self.prefetch_checkbox.isChecked():
+            self.start_prefetch(slot_idx)
+
+    def start_prefetch(self, slot_idx=0):
+        """Prepare the next board of a slot in the background while the operator swaps boards."""
+        slot_config = self.slot_configs[slot_idx]
+        prefetch_thread = self.prefetch_threads.get(slot_idx)
+        steps = step_registry.steps()
+        if slot_config.db is None or not steps or (prefetch_thread is not None and prefetch_thread.isRunning()):
+            return
+        first_step_name = os.path.splitext(os.path.basename(steps[0].path))[0]
+        prefetch_thread = PrefetchThread(first_step_name, slot_config, slot_idx)
+        prefetch_thread.log_message.connect(self.append_log)
+        prefetch_thread.finished.connect(self.prefetch_finished)
+        self.prefetch_threads[slot_idx] = prefetch_thread
+        prefetch_thread.start()
+
+    def prefetch_finished(self):
+        """Drop the preparation cancelled while it was running, then start the slot if it was started meanwhile."""
+        slot_idx = self.sender_slot()
+        if slot_idx is None:
+            return
+        if slot_idx in self.cancels_after_prefetch:
+            self.cancels_after_prefetch.discard(slot_idx)
+            self.drop_prefetch(slot_idx)
+        if slot_idx in self.starts_after_prefetch:
+            self.starts_after_prefetch.discard(slot_idx)
+            self.start_slot(slot_idx)
+
+    def cancel_prefetch(self, slot_idx=None, wait: bool = False):
+        """
+        Drop what was prepared for the next board of a slot (every slot by default). A running preparation
+        is dropped when it ends, unless wait is set (closing of the window).
+        """
+        slot_indexes = range(len(self.slot_configs)) if slot_idx is None else [slot_idx]
+        for i in slot_indexes:
+            prefetch_thread = self.prefetch_threads.get(i)
+            if prefetch_thread is not None and prefetch_thread.isRunning():
+                if not wait:
+                    self.cancels_after_prefetch.add(i)
+                    continue
+                prefetch_thread.wait()
+            self.drop_prefetch(i)
+
+    def drop_prefetch(self, slot_idx: int):
+        try:
+            if rollback_prepared_cycle(self.slot_configs[slot_idx]):
+                self.append_log("Préparation de la carte suivante annulée.", "yellow", slot_idx)
+        except Exception as e:
+            print(f"Erreur lors de l'annulation de la préparation : {e}")
+
+    def toggle_prefetch(self, checked):
+        """Drop the preparations of the slots not testing a board when the option is disabled."""
+        if not checked:
+            for slot_idx in range(len(self.slot_configs)):
+                if not self.slot_running(slot_idx):
+                    self.cancel_prefetch(slot_idx)
 
 
 def main():
@@ -1063,8 +1294,21 @@ def main():
         port=int(config.arg.port),
         database=config.arg.database,
     )
-    config.db = GenericDatabaseManager(config.db_config, debug=config.arg.show_all_logs)
+    # The steps running at the same time share the connection, each query is made under its lock
+    config.db = configuration.LockedDatabase(GenericDatabaseManager(config.db_config, debug=config.arg.show_all_logs))
     config.db.connect()
+
+    # Slots declared in the config of the product, each one tests its own board with its own AppConfig
+    slot_configs = [config]
+    try:
+        slot_settings = load_slot_settings(config)
+        if slot_settings:
+            config.slot = slot_settings[0]
+            slot_configs += [create_slot_config(config, settings) for settings in slot_settings[1:]]
+    except Exception as e:
+        print(f"Configuration des emplacements impossible, le banc teste une seule carte : {e}")
+        config.slot = None
+        slot_configs = [config]
     
     """Launch the GUI"""
     app = QApplication(sys.argv)
@@ -1093,7 +1337,7 @@ def main():
     app.setPalette(dark_palette)
     
 
-    window = MainWindow()
+    window = MainWindow(slot_configs)
     window.show()
     sys.exit(app.exec())
 
@@ -49,6 +49,33 @@ a = Analysis(
         
         # Configuration module
         'configuration',
+        'bench_context',
+        'hardware_session',
+        'i2c_waveform',
+        'measurement_specs',
+        'log_sink',
+        'step_timing',
+        'step_registry',
+        'lazy_import',
+        'drivers',
+        'cycle_prefetch',
+        'resource_arbiter',
+        'slots',
+        'step_scheduler',
+        'simulators',
+        'serial_protocol',
+        'serial_ports',
+        'stm32_programmer',
+
+        # Driver modules imported on first use by drivers.py (not seen by the static analysis)
+        'numpy',
+        'modules.capsys_mysql_command.capsys_mysql_command',
+        'modules.capsys_wrapper_tm_t20iii.capsys_wrapper_tm_t20III',
+        'modules.capsys_daq_manager.capsys_daq_manager',
+        'modules.capsys_mcp23017.capsys_mcp23017',
+        'modules.capsys_brady_manager.capsys_brady_manager',
+        'modules.capsys_mac_manager.capsys_mac_manager',
+        'modules.capsys_pdf_report.capsys_pdf_report',
         
         # Standard library modules used dynamically
         'importlib.util',
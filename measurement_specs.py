@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Table déclarative des mesures analogiques (voie, pont diviseur, min, max, unité) et moteur de verdict.
+
+La table est lue dans la clé "MEASUREMENTS" du fichier de config (config_IV90115) stocké en base,
+avec les valeurs historiques du banc par défaut. Toutes les mesures d'une étape sont évaluées
+d'un coup sur une seule acquisition et enregistrées en un seul lot.
+"""
+
+from dataclasses import dataclass
+from typing import Optional
+import configuration  # Custom
+from lazy_import import lazy  # Custom
+from step_registry import registry  # Custom
+
+np = lazy("numpy")  # Imported by the first evaluation
+
+@dataclass
+class MeasurementSpec:
+    """Limits of one analog measurement."""
+    key: str  # Key saved in skvp_float, e.g. "IVE1_V"
+    channel: configuration.DAQPin
+    divider: float  # Vout / Vin of the resistor divider in front of the DAQ input
+    min: float
+    max: float
+    unit: str = "V"
+    step: str = ""  # Name of the step file doing the measurement, e.g. "init_dut" (required in MEASUREMENTS)
+    label: str = ""
+
+@dataclass
+class Verdict:
+    """Evaluation of one MeasurementSpec on an acquisition."""
+    spec: MeasurementSpec
+    value: float
+    std: float
+    valid: bool
+
+    def describe(self) -> str:
+        spec = self.spec
+        return f"{spec.label or spec.key} mesuré : {self.value:.3f} {spec.unit} (écart-type {self.std:.3f} {spec.unit}), min={spec.min}{spec.unit}, max={spec.max}{spec.unit}"
+
+    def failure(self) -> str:
+        spec = self.spec
+        return f"{spec.label or spec.key} mesuré à {self.value:.3f} {spec.unit} hors des limites ({spec.min}-{spec.max} {spec.unit})."
+
+def divider_ratio(r1: float, r2: float) -> float:
+    """Vout / Vin of a divider with R1 on the high side and R2 to ground."""
+    return r2 / (r1 + r2)
+
+# R1 = 12k ohm, R2 = 5.6k ohm, Vout = Vin * (R2 / (R1 + R2))
+DEFAULT_SPECS = [
+    MeasurementSpec("IVE1_V", configuration.DAQPin.M_V_IVE1, divider_ratio(12, 5.6), 23.5, 25.5, "V", "init_dut", "IVE1"),
+    MeasurementSpec("IVE2_V", configuration.DAQPin.M_V_IVE2, divider_ratio(12, 5.6), 23.5, 25.5, "V", "init_dut", "IVE2"),
+    MeasurementSpec("IVF_V", configuration.DAQPin.M_V_IVF, divider_ratio(12, 5.6), 23.5, 25.5, "V", "init_dut", "IVF"),
+    MeasurementSpec("AT_V", configuration.DAQPin.M_V_AT, divider_ratio(12, 5.6), 23, 25.5, "V", "test", "AT"),
+]
+
+def load_specs(config_json: Optional[dict], step_names: Optional[set[str]] = None) -> list[MeasurementSpec]:
+    """
+    Read the "MEASUREMENTS" list of the config JSON, or return DEFAULT_SPECS if absent.
+
+    Each entry: {"key", "channel" (DAQPin name), "r1", "r2" (kohm) or "divider", "min", "max", "unit", "step", "label"}.
+    "step" is required and must be the name of a step file (step_names, the files of steps/ by default),
+    a measurement of no step would never be checked.
+
+    Raises:
+        ValueError: if an entry is invalid.
+    """
+    entries = (config_json or {}).get("MEASUREMENTS")
+    if not entries:
+        return list(DEFAULT_SPECS)
+    if step_names is None:
+        step_names = registry.file_names()
+    specs = []
+    for entry in entries:
+        try:
+            channel = configuration.DAQPin[entry["channel"]]
+            if "divider" in entry:
+                divider = float(entry["divider"])
+            else:
+                divider = divider_ratio(float(entry["r1"]), float(entry["r2"]))
+            specs.append(MeasurementSpec(
+                key=entry["key"],
+                channel=channel,
+                divider=divider,
+                min=float(entry["min"]),
+                max=float(entry["max"]),
+                unit=entry.get("unit", "V"),
+                step=entry["step"],
+                label=entry.get("label", ""),
+            ))
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Mesure invalide dans MEASUREMENTS : {entry} ({e})")
+        if specs[-1].step not in step_names:
+            raise ValueError(f"Mesure {specs[-1].key} de MEASUREMENTS : étape \"{specs[-1].step}\" inconnue.")
+    return specs
+
+def specs_for_step(specs: list[MeasurementSpec], step: str) -> list[MeasurementSpec]:
+    """Return the specs measured by the given step."""
+    return [spec for spec in specs if spec.step == step]
+
+def evaluate(specs: list[MeasurementSpec], stats: dict) -> list[Verdict]:
+    """Evaluate all the specs against one acquisition (dict DAQPin -> ChannelStats) at once."""
+    if not specs:
+        return []
+    dividers = np.array([spec.divider for spec in specs])
+    values = np.array([stats[spec.channel].mean for spec in specs]) / dividers
+    stds = np.array([stats[spec.channel].std for spec in specs]) / dividers
+    valid = (values >= np.array([spec.min for spec in specs])) & (values <= np.array([spec.max for spec in specs]))
+    return [Verdict(spec, float(values[i]), float(stds[i]), bool(valid[i])) for i, spec in enumerate(specs)]
+
+def save_verdicts(config: configuration.AppConfig, step_name_id: int, verdicts: list[Verdict]):
+    """Queue one skvp_float row per verdict, written together by the next flush of the measurement sink."""
+    for verdict in verdicts:
+        spec = verdict.spec
+        config.save_value(step_name_id, spec.key, verdict.value, spec.unit, spec.min, spec.max, valid=int(verdict.valid))
+
+if __name__ == "__main__":
+    """Check the reading of the MEASUREMENTS table (no DAQ or database needed)."""
+    steps = {"init_dut", "test"}
+    assert load_specs(None, steps) == DEFAULT_SPECS
+    specs = load_specs({"MEASUREMENTS": [
+        {"key": "IVE1_V", "channel": "M_V_IVE1", "r1": 12, "r2": 5.6, "min": 23.5, "max": 25.5, "step": "init_dut"},
+        {"key": "AT_V", "channel": "M_V_AT", "divider": 0.5, "min": 23, "max": 25.5, "step": "test", "label": "AT"},
+    ]}, steps)
+    assert abs(specs[0].divider - 5.6 / 17.6) < 1e-9 and specs[0].unit == "V"
+    assert [spec.key for spec in specs_for_step(specs, "test")] == ["AT_V"]
+    for entry in (
+        {"key": "AT_V", "channel": "M_V_AT", "divider": 0.5, "min": 23, "max": 25.5},  # No step
+        {"key": "AT_V", "channel": "M_V_AT", "divider": 0.5, "min": 23, "max": 25.5, "step": "tests"},  # Unknown step
+        {"key": "AT_V", "channel": "AI9", "divider": 0.5, "min": 23, "max": 25.5, "step": "test"},  # Unknown channel
+    ):
+        try:
+            load_specs({"MEASUREMENTS": [entry]}, steps)
+            raise AssertionError(f"invalid measurement accepted: {entry}")
+        except ValueError as e:
+            print(e)
+    print(f"load_specs OK : {len(specs)} mesures")
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+Arbitre des instruments partagés par les emplacements du banc.
+
+Chaque instrument unique (DAQ USB-6000 et bus I2C des MCP23017, imprimantes, fichier des adresses MAC,
+carte réseau) est un verrou nommé, réentrant pour le thread qui le détient. Plusieurs ressources
+demandées ensemble sont prises dans un ordre fixe pour que deux emplacements ne puissent pas s'interbloquer.
+"""
+
+import threading
+from contextlib import contextmanager
+from typing import Any
+
+RESOURCE_DAQ = "daq"  # USB-6000: analog inputs and the I2C bus driving the MCP23017
+RESOURCE_PRINTER = "printer"  # Receipt printer of the failure tickets and Brady label printer
+RESOURCE_MAC_FILE = "mac_file"  # Excel file of the MAC addresses, one assignment at a time
+RESOURCE_NETWORK = "network"  # Network card of the bench, the DUTs answer on the same IP
+
+class ResourceArbiter:
+    """Named reentrant locks of the shared instruments."""
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._locks: dict[str, Any] = {}  # name -> threading.RLock
+
+    def lock(self, name: str) -> Any:
+        """Return the lock of a resource, created on first use."""
+        with self._guard:
+            return self._locks.setdefault(name, threading.RLock())
+
+    @contextmanager
+    def use(self, *names: str):
+        """Hold the given resources for the block, taken in alphabetical order and released in reverse order."""
+        acquired = []
+        try:
+            for name in sorted(set(names)):
+                lock = self.lock(name)
+                lock.acquire()
+                acquired.append(lock)
+            yield
+        finally:
+            for lock in reversed(acquired):
+                lock.release()
+
+# Arbiter shared by every slot of the process
+arbiter = ResourceArbiter()
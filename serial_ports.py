@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Découverte du port série du DUT et pool des ports gardés ouverts d'une carte à la suivante.
+
+Le port peut être désigné par l'identité USB du périphérique plutôt que par son nom, qui peut changer
+(COMx sous Windows, /dev/ttyACMx sous Linux) quand le DUT se réénumère après la programmation :
+    "PORT_COM_DUT": {"port": "COM11", "vid": "0483", "pid": "5740"}
+    "SLOTS": [{"name": "Emplacement 1", "serial_number": "206A3495"}, ...]
+VID et PID sont en hexadécimal, le numéro de série distingue les emplacements. Sans VID/PID le port
+nommé est ouvert comme avant. Le port est attendu pendant un temps borné (réénumération).
+
+Le handle n'est gardé d'une carte à la suivante que lorsque le DUT n'est pas remis sous tension : s02 coupe
+l'alimentation et ferme le port à chaque programmation, la réutilisation ne sert donc que si la programmation
+est sautée. Le handle est réutilisé si le même périphérique est présent sous le même nom et si le port répond
+encore au driver (une carte retirée puis remplacée rend l'ancien handle inutilisable), sinon il est rouvert.
+"""
+
+import sys, glob, time, threading
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+from lazy_import import lazy  # Custom
+from simulators import simulation  # Custom
+
+serial_list_ports = lazy("serial.tools.list_ports")  # pyserial, imported on the first enumeration
+
+PORT_ENUMERATION_TIMEOUT_S = 10.0  # Maximum wait for the DUT port to appear (re-enumeration after the power cycle)
+PORT_POLL_INTERVAL_S = 0.2
+
+@dataclass(frozen=True)
+class PortInfo:
+    """Serial port present on the PC."""
+    device: str  # e.g. "COM11" or "/dev/ttyACM0"
+    vid: Optional[int] = None
+    pid: Optional[int] = None
+    serial_number: str = ""
+
+    def describe(self) -> str:
+        if self.vid is None:
+            return self.device
+        return f"{self.device} ({self.vid:04X}:{self.pid or 0:04X}{' ' + self.serial_number if self.serial_number else ''})"
+
+def _usb_id(value, name: str) -> Optional[int]:
+    if value in (None, ""):
+        return None
+    try:
+        return value if isinstance(value, int) else int(str(value), 16)
+    except ValueError:
+        raise ValueError(f"{name} USB invalide dans le fichier de config : {value}")
+
+@dataclass(frozen=True)
+class PortIdentity:
+    """Port of the DUT as declared in the config: a name, or a USB identity."""
+    port: str = ""
+    vid: Optional[int] = None
+    pid: Optional[int] = None
+    serial_number: str = ""
+
+    @property
+    def is_usb(self) -> bool:
+        return self.vid is not None
+
+    def matches(self, info: PortInfo) -> bool:
+        if not self.is_usb:
+            return info.device == self.port
+        return (
+            info.vid == self.vid
+            and (self.pid is None or info.pid == self.pid)
+            and (not self.serial_number or info.serial_number == self.serial_number)
+        )
+
+    def describe(self) -> str:
+        if not self.is_usb:
+            return self.port
+        return PortInfo(self.port or "USB", self.vid, self.pid, self.serial_number).describe()
+
+    @staticmethod
+    def from_config(item: Any, slot: Any = None) -> "PortIdentity":
+        """
+        Identity of the DUT port from the PORT_COM_DUT ConfigItem, the port and serial number of the slot take precedence.
+
+        Raises:
+            ValueError: if the VID or PID is not hexadecimal.
+        """
+        return PortIdentity(
+            port=getattr(slot, "port", "") or item.port,
+            vid=_usb_id(item.vid, "VID"),
+            pid=_usb_id(item.pid, "PID"),
+            serial_number=getattr(slot, "serial_number", "") or item.serial_number,
+        )
+
+def available_ports() -> list[PortInfo]:
+    """Serial ports present now: pyserial enumeration (COMx, /dev/ttyACMx, /dev/ttyUSBx) or the simulated DUTs."""
+    if simulation is not None:
+        return simulation.serial_ports()
+    ports = [PortInfo(p.device, p.vid, p.pid, p.serial_number or "") for p in serial_list_ports.comports()]
+    if sys.platform.startswith("linux"):
+        # CDC ports without USB information in sysfs are not listed by pyserial
+        listed = {port.device for port in ports}
+        ports += [PortInfo(device) for device in sorted(glob.glob("/dev/ttyACM*")) if device not in listed]
+    return ports
+
+def find_port(identity: PortIdentity, exclude: set = frozenset()) -> Optional[PortInfo]:
+    """Port of identity present now, None if absent. With several matches the named port is preferred."""
+    matches = [info for info in available_ports() if identity.matches(info) and info.device not in exclude]
+    named = [info for info in matches if info.device == identity.port]
+    return (named or matches or [None])[0]
+
+def port_key(slot: Any) -> int:
+    """Key of the port of a slot in the pool, 0 for the single board bench."""
+    return slot.index if slot is not None else 0
+
+def port_alive(handle: Any) -> bool:
+    """True if the handle is open and its port still answers to the driver: the input buffer of a removed USB device can't be reset."""
+    if handle is None or not handle.is_connected():
+        return False
+    try:
+        handle.protocol.flush_input()
+        return True
+    except (OSError, ValueError):  # serial.SerialException is an OSError
+        return False
+
+@dataclass
+class PooledPort:
+    info: PortInfo
+    identity: PortIdentity
+    handle: Any = None  # configuration.SerialUsbDut, None while it is being opened
+
+class PortPool:
+    """Open DUT ports of the slots, kept across boards while the device stays the same and is not power-cycled."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ports: dict[int, PooledPort] = {}
+
+    def acquire(self, key: int, identity: PortIdentity, open_port: Callable[[str], Any],
+                timeout: float = PORT_ENUMERATION_TIMEOUT_S) -> tuple[Any, PortInfo, bool]:
+        """
+        Handle of the DUT port of a slot: the handle of the previous board if the same device is still present
+        under the same name and the handle still works, else the port is polled for until timeout and opened with open_port(device).
+        Returns (handle, port, reused).
+
+        Raises:
+            ValueError: if no port matches identity before timeout.
+            OSError: error of the last opening (serial.SerialException) if the port can't be opened before timeout.
+        """
+        pooled = self._ports.get(key)
+        if pooled is not None:
+            if pooled.identity == identity and pooled.info in available_ports() and port_alive(pooled.handle):
+                return pooled.handle, pooled.info, True
+            self.close(key)
+        if not identity.is_usb and not identity.port:
+            raise ValueError("Aucun port série n'est configuré pour le DUT (PORT_COM_DUT).")
+
+        deadline = time.monotonic() + timeout
+        last_error: Optional[OSError] = None
+        while True:
+            info = self._reserve(key, identity)
+            if info is not None:
+                try:
+                    handle = open_port(info.device)
+                except OSError as e:  # The device is still enumerating, or the name is not listed and absent
+                    last_error = e
+                    self._release(key)
+                else:
+                    with self._lock:
+                        self._ports[key].handle = handle
+                    return handle, info, False
+            if time.monotonic() >= deadline:
+                if last_error is not None:
+                    raise last_error
+                raise ValueError(f"Port série du DUT {identity.describe()} introuvable après {timeout:.1f} s.")
+            time.sleep(PORT_POLL_INTERVAL_S)
+
+    def _reserve(self, key: int, identity: PortIdentity) -> Optional[PortInfo]:
+        """Find a port of identity not used by another slot and reserve it for key."""
+        with self._lock:
+            used = {pooled.info.device for other, pooled in self._ports.items() if other != key}
+            info = find_port(identity, used)
+            if info is None and not identity.is_usb and identity.port not in used:
+                info = PortInfo(identity.port)  # Port not listed (e.g. virtual port), opened anyway as before
+            if info is not None:
+                self._ports[key] = PooledPort(info, identity)
+            return info
+
+    def _release(self, key: int):
+        with self._lock:
+            self._ports.pop(key, None)
+
+    def close(self, key: int) -> bool:
+        """Close the port of a slot (end of the session, or the DUT is about to enumerate again), True if one was open."""
+        with self._lock:
+            pooled = self._ports.pop(key, None)
+        if pooled is None or pooled.handle is None:
+            return False
+        if pooled.handle.is_connected():
+            try:
+                pooled.handle.close()
+            except OSError:
+                pass  # Device already removed
+        return True
+
+    def close_all(self):
+        for key in list(self._ports):
+            self.close(key)
+
+# Pool shared by every slot of the process
+port_pool = PortPool()
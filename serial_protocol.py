@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+Protocole ligne à ligne du firmware du DUT, lu au fil de l'eau.
+
+Les réponses sont découpées en lignes dès leur arrivée : chaque ligne est passée à un callback,
+les lignes "TEST ... OK/NOK" sont analysées en TestLine et la lecture s'arrête au premier NOK
+sans attendre READY. Le tampon d'entrée est vidé explicitement avant chaque commande.
+SelfTestProgress compte les résultats OK reçus par rapport à la liste SELF_TESTS du fichier de config
+pour faire avancer le pourcentage de l'étape, et garde l'heure d'arrivée de chaque sous-test.
+"""
+
+import re, time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+from step_timing import PHASE_SERIAL, timed  # Custom
+
+READY = "READY"
+QUERY_IDLE_S = 0.1  # A query answer is complete when no byte arrived for this duration after its first line
+_IDLE_POLL_S = 0.005
+INFO_LINES = ("TEST EN COURS",)  # Lines starting with TEST that are not results
+_LINE_END = re.compile(r"\r\n|\n|\r")
+_TEST_LINE = re.compile(r"^(TEST\b.*?)\s+(\S+)$")
+
+@dataclass
+class TestLine:
+    """One result line of the self-test, e.g. "TEST RS485 OK"."""
+    name: str  # e.g. "TEST RS485"
+    status: str  # "OK", "NOK" or any other word sent by the firmware
+    raw: str
+    elapsed: float  # Seconds since the command was sent
+
+    @property
+    def ok(self) -> bool:
+        return self.status == "OK"
+
+def parse_test_line(line: str, elapsed: float = 0.0) -> Optional[TestLine]:
+    """Return the TestLine of a result line, None for the other lines."""
+    if not line.startswith("TEST") or line in INFO_LINES:
+        return None
+    match = _TEST_LINE.match(line)
+    if match is None:
+        return TestLine(line, "", line, elapsed)  # A result line without status is a failure
+    return TestLine(match.group(1), match.group(2), line, elapsed)
+
+@dataclass
+class StreamResult:
+    """Lines received after a command."""
+    command: str
+    lines: list[str] = field(default_factory=list)
+    tests: list[TestLine] = field(default_factory=list)
+    completed: bool = False  # Terminator line received
+    aborted: bool = False  # Stopped on the first failed test line
+    elapsed: float = 0.0
+
+    @property
+    def failed(self) -> list[TestLine]:
+        return [test for test in self.tests if not test.ok]
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.lines)
+
+class LineReader:
+    """Incremental decoder: bytes in, complete lines out (CR, LF or CRLF, empty lines dropped)."""
+
+    def __init__(self, encoding: str = "utf-8"):
+        self.encoding = encoding
+        self._partial = ""
+
+    def feed(self, data: bytes) -> list[str]:
+        text = self._partial + data.decode(self.encoding, errors="replace")
+        parts = _LINE_END.split(text)
+        self._partial = parts.pop()
+        return [part.strip() for part in parts if part.strip()]
+
+    @property
+    def partial(self) -> str:
+        """Text received after the last line end (a line not terminated yet)."""
+        return self._partial.strip()
+
+class SerialProtocol:
+    """
+    Commands and streamed answers over an open pyserial port (write, read, in_waiting, reset_input_buffer).
+    The time spent is added to the serial phase of the current step.
+    """
+
+    def __init__(self, port: Any, timer=None, encoding: str = "utf-8"):
+        self.port = port
+        self.timer = timer
+        self.encoding = encoding
+
+    def flush_input(self):
+        """Drop the bytes received and not read yet (answer of a previous command, boot messages)."""
+        if self.port is None:
+            raise ValueError("Le port série n'est pas ouvert.")
+        self.port.reset_input_buffer()
+        waiting = self.port.in_waiting
+        if waiting:
+            self.port.read(waiting)
+
+    def stream(self, command: str, until: Optional[str] = READY, timeout: float = 10.0,
+               on_line: Optional[Callable[[str, Optional[TestLine]], None]] = None,
+               abort_on_nok: bool = True, line_ending: str = "\n", idle: Optional[float] = None) -> StreamResult:
+        """
+        Send a command and read its answer line by line.
+
+        Args:
+            until: line ending the answer, also recognised before its line end is received.
+                None to stop after the first line, or after the idle gap if idle is given
+            timeout: maximum duration of the answer, the result is returned not completed after it
+            on_line: called for every line, with its TestLine for a result line
+            abort_on_nok: stop at the first failed result line
+            idle: with until None, the answer is complete when no byte arrived for idle seconds after a line
+        """
+        with timed(self.timer, PHASE_SERIAL):
+            self.flush_input()
+            result = StreamResult(command)
+            reader = LineReader(self.encoding)
+            start = time.perf_counter()
+            self.port.write((command + line_ending).encode(self.encoding))
+            last_data = start
+            while time.perf_counter() - start < timeout:
+                waiting = self.port.in_waiting
+                if idle is not None and not waiting and (result.lines or reader.partial):
+                    if time.perf_counter() - last_data >= idle:
+                        result.completed = until is None
+                        break
+                    time.sleep(_IDLE_POLL_S)
+                    continue
+                data = self.port.read(waiting or 1)
+                if not data:
+                    continue
+                last_data = time.perf_counter()
+                for line in reader.feed(data):
+                    elapsed = time.perf_counter() - start
+                    result.lines.append(line)
+                    test = parse_test_line(line, elapsed)
+                    if test is not None:
+                        result.tests.append(test)
+                    if on_line is not None:
+                        on_line(line, test)
+                    if (until is None and idle is None) or line == until:
+                        result.completed = True
+                    elif test is not None and not test.ok and abort_on_nok:
+                        result.aborted = True
+                    if result.completed or result.aborted:
+                        result.elapsed = elapsed
+                        return result
+                if until is not None and reader.partial == until:
+                    # Terminator sent without line end
+                    result.lines.append(until)
+                    if on_line is not None:
+                        on_line(until, None)
+                    result.completed = True
+                    result.elapsed = time.perf_counter() - start
+                    return result
+            if reader.partial:
+                result.lines.append(reader.partial)  # Last line received without line end
+            result.elapsed = time.perf_counter() - start
+            return result
+
+    def query(self, command: str, timeout: float = 1.0, line_ending: str = "\n", idle: float = QUERY_IDLE_S) -> str:
+        """
+        Send a command and return its whole answer (lines joined with "\n"), "" if nothing was received.
+        The answer ends after timeout, or once no byte arrived for idle seconds after its first line.
+        """
+        result = self.stream(command, until=None, timeout=timeout, abort_on_nok=False, line_ending=line_ending, idle=idle)
+        return result.text
+
+    def wait_for(self, line: str = READY, timeout: float = 10.0) -> bool:
+        """Read and drop lines until the given one (end of an aborted self-test), returns False on timeout."""
+        with timed(self.timer, PHASE_SERIAL):
+            reader = LineReader(self.encoding)
+            start = time.perf_counter()
+            while time.perf_counter() - start < timeout:
+                data = self.port.read(self.port.in_waiting or 1)
+                if data and (line in reader.feed(data) or reader.partial == line):
+                    return True
+            return False
+
+def load_self_tests(config_json: Optional[dict]) -> list[str]:
+    """
+    Read the "SELF_TESTS" list of the config JSON (names of the result lines, e.g. "TEST RS485"), [] if absent.
+
+    Raises:
+        ValueError: if the list is invalid.
+    """
+    names = (config_json or {}).get("SELF_TESTS") or []
+    if not isinstance(names, list) or not all(isinstance(name, str) and name.startswith("TEST") for name in names):
+        raise ValueError(f"Liste SELF_TESTS invalide dans le fichier de config : {names}")
+    return [name.strip() for name in names]
+
+class SelfTestProgress:
+    """
+    on_line callback of SerialProtocol.stream() for the self-test: each expected result received OK
+    moves update_percentage from start to end, each result is logged as soon as it arrives.
+    Without expected list the percentage only moves at the end.
+    """
+
+    def __init__(self, expected: list[str], update_percentage: Callable[[int], None] = lambda x: None,
+                 log: Optional[Callable[[str, str], None]] = None, start: int = 0, end: int = 100):
+        self.expected = list(expected)
+        self.update_percentage = update_percentage
+        self.log = log
+        self.start = start
+        self.end = end
+        self.received: list[TestLine] = []
+
+    def __call__(self, line: str, test: Optional[TestLine]):
+        if test is None:
+            return
+        self.received.append(test)
+        if self.log is not None:
+            self.log(f"{test.raw} ({test.elapsed:.2f} s)", "blue" if test.ok else "red")
+        if self.expected:
+            done = len({t.name for t in self.received if t.ok} & set(self.expected))
+            self.update_percentage(self.start + (self.end - self.start) * done // len(self.expected))
+
+    @property
+    def missing(self) -> list[str]:
+        """Expected results not received (self-test aborted or firmware without these tests)."""
+        names = {test.name for test in self.received}
+        return [name for name in self.expected if name not in names]
+
+    def timing(self) -> dict:
+        """Arrival time and duration of each sub-test, saved in skvp_json to find the slowest self-tests."""
+        tests = []
+        previous = 0.0
+        for test in self.received:
+            tests.append({"name": test.name, "status": test.status, "elapsed_s": round(test.elapsed, 3), "duration_s": round(test.elapsed - previous, 3)})
+            previous = test.elapsed
+        return {"total_s": round(previous, 3), "tests": tests, "missing": self.missing}
+
+if __name__ == "__main__":
+    """Check the line decoding and the result lines (no serial port needed)."""
+    reader = LineReader()
+    assert reader.feed(b"TEST EN COURS\r\nTEST RS") == ["TEST EN COURS"]
+    assert reader.partial == "TEST RS"
+    assert reader.feed(b"485 OK\rTEST LED NOK\n\r\nREA") == ["TEST RS485 OK", "TEST LED NOK"]
+    assert reader.feed(b"DY") == [] and reader.partial == READY
+    test = parse_test_line("TEST RS485 OK", 1.5)
+    assert test is not None and test.name == "TEST RS485" and test.ok and test.elapsed == 1.5
+    assert not parse_test_line("TEST LED NOK").ok
+    assert parse_test_line("TEST").status == ""  # A result line without status is a failure
+    assert parse_test_line("TEST EN COURS") is None and parse_test_line(READY) is None
+    percentages = []
+    progress = SelfTestProgress(["TEST RS485", "TEST LED"], percentages.append, end=80)
+    progress("TEST LED NOK", parse_test_line("TEST LED NOK"))
+    progress("TEST RS485 OK", parse_test_line("TEST RS485 OK"))
+    assert percentages == [0, 40] and progress.missing == []
+    print("LineReader, parse_test_line et SelfTestProgress OK")
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Exécution sans interface de la séquence de test sur les simulateurs des instruments (simulators.py).
+Les étapes sont lancées par TestThread.run() comme depuis la fenêtre, ce qui permet de mesurer
+le temps d'orchestration sous Linux, sans DAQ, relais, port série ni imprimantes. La base MySQL est requise.
+
+Exemples :
+    python simulate.py --cycles 10
+    python simulate.py --cycles 50 --simulation simulation.json --host 192.168.1.20
+"""
+
+import argparse
+import os
+import sys
+import time
+
+def main():
+    """Fonction principale avec gestion des arguments"""
+    parser = argparse.ArgumentParser(
+        description="Séquence de test du banc CAPSYS sur les instruments simulés, sans interface"
+    )
+    parser.add_argument("--cycles", type=int, default=1, help="Nombre de cartes testées à la suite (1 par défaut)")
+    parser.add_argument("--simulation", default="1", help="Fichier JSON des réglages des simulateurs, 1 pour les réglages par défaut")
+    parser.add_argument("--operator", help="Opérateur \"Prénom NOM\" (auteur du banc par défaut)")
+    parser.add_argument("--product-id", help="product_list_id testé (celui de configuration.py par défaut)")
+    parser.add_argument("--skip", type=int, nargs="*", default=[], help="Indices des étapes sautées")
+    parser.add_argument("--quiet", action="store_true", help="N'afficher que le résultat de chaque cycle")
+    parser.add_argument("--user", default="root")
+    parser.add_argument("--password", default="root")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", default="3306")
+    parser.add_argument("--database", default="capsys_db_bdt")
+    args = parser.parse_args()
+    if args.cycles < 1:
+        parser.error("--cycles doit être au moins 1")
+
+    # The simulators are selected when drivers.py is imported, the variable is set before the imports of the bench
+    os.environ["CAPSYS_SIMULATION"] = args.simulation
+    from PyQt6.QtCore import QCoreApplication, Qt
+    import configuration  # Custom
+    from drivers import GenericDatabaseManager, DatabaseConfig, PrinterDC, BradyBP12Printer  # Custom
+    from main import TestThread  # Custom
+    from simulators import simulation  # Custom
+
+    app = QCoreApplication(sys.argv)  # TestThread is a QObject, no display is needed
+    config = configuration.AppConfig()
+    if args.operator:
+        config.arg.operator = args.operator
+    config.arg.product_list_id = args.product_id or configuration.PRODUCT_LIST_ID_DEFAULT
+    config.db_config = DatabaseConfig(
+        user=args.user,
+        password=args.password,
+        host=args.host,
+        port=int(args.port),
+        database=args.database,
+    )
+    config.db = configuration.LockedDatabase(GenericDatabaseManager(config.db_config, debug=False))
+    config.db.connect()
+    config.printer = PrinterDC(configuration.PRINTER_NAME)
+    config.brady_printer = BradyBP12Printer()
+
+    def print_log(message, color="white"):
+        if args.quiet:
+            return
+        if isinstance(message, dict):
+            message = "\n".join([str(message.get("step_name", ""))] + [f"  {info}" for info in message.get("infos", [])])
+        print(f"[{color}] {message}")
+
+    def answer(title, message, callback, font_size=12):
+        # Operator questions are answered at once, e.g. "" to retry a failed test
+        print_log(f"{title} : {message} -> \"{simulation.settings.operator_answer}\"", "orange")
+        callback(simulation.settings.operator_answer)
+
+    durations = []
+    nb_ok = 0
+    for cycle in range(args.cycles):
+        test_thread = TestThread(set(args.skip), False, config)
+        failed = []
+        # The signals are emitted by the step threads, they are handled in the emitting thread without an event loop
+        direct = Qt.ConnectionType.DirectConnection
+        test_thread.log_message.connect(print_log, type=direct)
+        test_thread.request_user_input.connect(answer, type=direct)
+        test_thread.step_failed.connect(lambda step_name, message: failed.append(step_name), type=direct)
+        start = time.perf_counter()
+        test_thread.run()  # Run in this thread, the steps still run in the worker threads of TestThread
+        durations.append(time.perf_counter() - start)
+        nb_ok += not failed
+        print(f"Cycle {cycle + 1}/{args.cycles} : {'OK' if not failed else 'NOK (' + ', '.join(failed) + ')'} en {durations[-1]:.2f} s")
+
+    print(f"{nb_ok}/{args.cycles} carte(s) OK, durée moyenne {sum(durations) / len(durations):.2f} s, min {min(durations):.2f} s, max {max(durations):.2f} s")
+    print(f"{len(simulation.printed)} ticket(s) et étiquette(s) imprimé(s)")
+    config.cleanup()
+    app.quit()
+
+if __name__ == "__main__":
+    main()
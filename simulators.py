@@ -0,0 +1,520 @@
+# -*- coding: utf-8 -*-
+"""
+Simulateurs des instruments du banc : DAQ USB-6000, bus I2C et MCP23017, DUT sur port série,
+imprimante de tickets, imprimante Brady, fichier des adresses MAC, STM32_Programmer_CLI et ping.
+
+Ils sont activés en lançant le banc avec la variable d'environnement CAPSYS_SIMULATION :
+    CAPSYS_SIMULATION=1                      réglages par défaut
+    CAPSYS_SIMULATION=chemin/simulation.json  réglages du fichier, par exemple :
+    {
+        "seed": 1,
+        "latency": {"serial": 0.05, "dut_test": 2.0, "printer": 0.5},
+        "faults": {"serial": 0.01, "dut_test": 0.05},
+        "dut": {"tests": ["TEST RS485", "TEST ETHERNET"], "mac": "", "ports": 2, "programmed": 0.3},
+        "analog": {"M_V_AT": 7.6}
+    }
+Les latences sont en secondes, les défauts sont des probabilités par appel. drivers.py fournit alors
+les classes simulées sous les noms des pilotes, le banc tourne sous Linux sans matériel
+(voir simulate.py pour une exécution sans interface).
+Chaque DUT simulé a un port /dev/ttyACMx (VID/PID 0483:5740, numéro de série SIMDUT01, SIMDUT02...)
+trouvé par serial_ports.py, qui disparaît pendant la programmation de son port=usbN et revient sous un nouveau nom.
+"""
+
+import os, re, json, time, queue, random, threading, subprocess
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Optional
+from i2c_waveform import SimulatedI2CBackend, SimulatedMCP23017  # Custom
+from lazy_import import lazy  # Custom
+from serial_protocol import SerialProtocol  # Custom
+
+serial = lazy("serial")  # pyserial, only for the exception raised by a serial fault
+
+SIMULATION_ENV = "CAPSYS_SIMULATION"
+SIMULATED_DAQ = "SimDev1"
+
+# Latency (s) and fault probability of each simulated operation
+DEFAULT_LATENCY = {
+    "daq": 0.001,  # One DAQ call (DI read, multi-channel AI read)
+    "i2c": 0.0005,  # One I2C transaction
+    "serial": 0.02,  # One command/answer exchange with the DUT
+    "dut_test": 1.0,  # Self-test run by the firmware on "TEST"
+    "printer": 0.3,  # Ticket or label printed
+    "programmer": 2.0,  # One image flashed by STM32_Programmer_CLI
+    "enumeration": 0.5,  # USB port of the DUT absent after the programming
+    "read_back": 0.5,  # Flash read back by STM32_Programmer_CLI before the programming
+    "network": 0.05,  # One ping
+}
+FAULT_KINDS = ("daq", "i2c", "serial", "dut_test", "printer", "programmer", "network", "mac_file")
+DEFAULT_DUT_TESTS = ("TEST RS485", "TEST ETHERNET", "TEST ENTREES", "TEST SORTIES", "TEST EEPROM")
+DEFAULT_INPUT_VOLTAGE = 24.5 * 5.6 / (12 + 5.6)  # 24.5 V behind the 12k / 5.6k divider of the bench
+
+SIMULATED_USB_ID = (0x0483, 0x5740)  # STM32 virtual COM port
+
+MAC_PATTERN = re.compile(r'^([0-9A-Fa-f]{2}:){5}([0-9A-Fa-f]{2})$')
+
+@dataclass
+class SimulationSettings:
+    """Latencies, fault probabilities and scripted answers of the simulators."""
+    seed: Optional[int] = None
+    jitter: float = 0.1  # Latencies vary by +/- this fraction
+    latency: dict[str, float] = field(default_factory=lambda: dict(DEFAULT_LATENCY))
+    faults: dict[str, float] = field(default_factory=dict)
+    dut_tests: tuple = DEFAULT_DUT_TESTS  # Result lines sent by the firmware on "TEST"
+    dut_mac: str = ""  # MAC address already written in a new board, "" for a blank board
+    dut_programmed: float = 0.0  # Probability that a board already carries the last image of its probe (rework)
+    dut_ports: int = 4  # Simulated USB ports of DUTs, the one of port=usbN of the programmer is the Nth
+    analog: dict[str, float] = field(default_factory=dict)  # DAQPin name -> volts at the DAQ input
+    noise: float = 0.002  # Standard deviation of the analog samples (V)
+    operator_answer: str = ""  # Answer given by simulate.py to the operator questions
+
+    @staticmethod
+    def from_json(data: dict) -> "SimulationSettings":
+        """
+        Raises:
+            ValueError: if an entry is invalid.
+        """
+        settings = SimulationSettings()
+        try:
+            settings.seed = data.get("seed")
+            settings.jitter = float(data.get("jitter", settings.jitter))
+            settings.latency.update({k: float(v) for k, v in data.get("latency", {}).items()})
+            settings.faults = {k: float(v) for k, v in data.get("faults", {}).items()}
+            dut = data.get("dut", {})
+            settings.dut_tests = tuple(dut.get("tests", settings.dut_tests))
+            settings.dut_mac = dut.get("mac", settings.dut_mac)
+            settings.dut_ports = int(dut.get("ports", settings.dut_ports))
+            settings.dut_programmed = float(dut.get("programmed", settings.dut_programmed))
+            settings.analog = {k: float(v) for k, v in data.get("analog", {}).items()}
+            settings.noise = float(data.get("noise", settings.noise))
+            settings.operator_answer = str(data.get("operator_answer", settings.operator_answer))
+        except (AttributeError, TypeError, ValueError) as e:
+            raise ValueError(f"Réglages de simulation invalides : {e}")
+        unknown = set(settings.faults) - set(FAULT_KINDS)
+        if unknown:
+            raise ValueError(f"Défauts de simulation inconnus : {', '.join(sorted(unknown))}")
+        return settings
+
+class Simulation:
+    """Settings and shared state of the simulators: random generator, MAC counter, printed tickets and labels."""
+
+    def __init__(self, settings: SimulationSettings):
+        self.settings = settings
+        self._lock = threading.Lock()
+        self._random = random.Random(settings.seed)
+        self.next_mac = 1
+        self.printed: list[tuple[str, Any]] = []  # ("ticket" | "label", content)
+        # USB ports of the DUTs: index -> (device name, time from which it is present)
+        self._ports = {index: (f"/dev/ttyACM{index}", 0.0) for index in range(settings.dut_ports)}
+        self._next_acm = settings.dut_ports
+        self._images: dict[str, str] = {}  # Probe port -> last image written
+
+    def uniform(self, a: float, b: float) -> float:
+        with self._lock:
+            return self._random.uniform(a, b)
+
+    def gauss(self, mu: float, sigma: float) -> float:
+        with self._lock:
+            return self._random.gauss(mu, sigma)
+
+    def wait(self, kind: str):
+        """Sleep for the latency of an operation."""
+        latency = self.settings.latency.get(kind, 0.0)
+        if latency > 0:
+            time.sleep(latency * self.uniform(1 - self.settings.jitter, 1 + self.settings.jitter))
+
+    def fault(self, kind: str) -> bool:
+        """True if a fault is injected in this operation."""
+        probability = self.settings.faults.get(kind, 0.0)
+        return probability > 0 and self.uniform(0, 1) < probability
+
+    def assign_mac(self) -> tuple[str, int]:
+        """Next address of the simulated MAC file (locally administered range)."""
+        with self._lock:
+            row = self.next_mac
+            self.next_mac += 1
+        return f"02:00:00:00:{row >> 8 & 0xFF:02X}:{row & 0xFF:02X}", row
+
+    def record(self, kind: str, content: Any):
+        with self._lock:
+            self.printed.append((kind, content))
+
+    def serial_ports(self) -> list:
+        """serial_ports.PortInfo of the DUT ports present now."""
+        from serial_ports import PortInfo  # Custom, imported here as serial_ports imports this module
+        now = time.monotonic()
+        with self._lock:
+            return [
+                PortInfo(device, *SIMULATED_USB_ID, f"SIMDUT{index + 1:02d}")
+                for index, (device, present_from) in sorted(self._ports.items()) if present_from <= now
+            ]
+
+    def port_present(self, device: str) -> bool:
+        """False for a simulated /dev/ttyACMx port that is absent, other names (COM11) are always present."""
+        with self._lock:
+            ports = dict(self._ports.values())
+        if device.startswith("/dev/ttyACM"):
+            return ports.get(device, float("inf")) <= time.monotonic()
+        return True
+
+    def port_identity(self, index: int):
+        """serial_ports.PortIdentity of the DUT port of a slot, used when the config names a port of the bench PC."""
+        from serial_ports import PortIdentity  # Custom
+        return PortIdentity(vid=SIMULATED_USB_ID[0], pid=SIMULATED_USB_ID[1], serial_number=f"SIMDUT{index + 1:02d}")
+
+    def _set_port(self, index: int, device: str, present_from: float):
+        with self._lock:
+            self._ports[index] = (device, present_from)
+
+    def run_programmer(self, cmd: list[str], on_line=None) -> subprocess.CompletedProcess:
+        """
+        Result of a STM32_Programmer_CLI command, its output lines (progress bar included) are passed
+        to on_line while it runs. The USB port of the programmed DUT is absent while it is programmed
+        and comes back under a new name after the enumeration latency.
+        """
+        if "-u" in cmd:
+            return self._read_flash(cmd)
+        port = next((arg[len("port="):] for arg in cmd if arg.startswith("port=")), "")
+        if "-w" in cmd:
+            with self._lock:
+                self._images[port] = cmd[cmd.index("-w") + 1]
+        probe = re.search(r"port=usb(\d+)", " ".join(cmd))
+        index = int(probe.group(1)) - 1 if probe else -1
+        if not 0 <= index < self.settings.dut_ports:
+            index = -1
+        if index >= 0:
+            with self._lock:
+                device = f"/dev/ttyACM{self._next_acm}"
+                self._next_acm += 1
+            self._set_port(index, device, float("inf"))
+        fault = self.fault("programmer")
+        lines = [(0.0, "Error: No STM32 target found! (simulation)")] if fault else self._programmer_output()
+        stdout = "\n".join(line for _, line in lines) + "\n"
+        for delay, line in lines:
+            if delay > 0:
+                time.sleep(delay)
+            if on_line is not None:
+                on_line(line)
+        if index >= 0:
+            self._set_port(index, device, time.monotonic() + self.settings.latency.get("enumeration", 0.0))
+        return subprocess.CompletedProcess(cmd, 1 if fault else 0, stdout, "")
+
+    def _read_flash(self, cmd: list[str]) -> subprocess.CompletedProcess:
+        """
+        "-u address size file" commands: the flash of a new board is erased, or carries the last image
+        written by the probe with the probability dut.programmed of the settings (reworked board).
+        """
+        from stm32_programmer import parse_hex  # Custom, imported here as stm32_programmer imports this module
+        self.wait("read_back")
+        if self.fault("programmer"):
+            return subprocess.CompletedProcess(cmd, 1, "Error: No STM32 target found! (simulation)\n", "")
+        port = next((arg[len("port="):] for arg in cmd if arg.startswith("port=")), "")
+        with self._lock:
+            image = self._images.get(port)
+        flash = {}
+        if image is not None and self.uniform(0, 1) < self.settings.dut_programmed:
+            try:
+                flash = dict(parse_hex(image))
+            except (OSError, ValueError):
+                pass
+        for i, arg in enumerate(cmd):
+            if arg == "-u":
+                address, size, path = int(cmd[i + 1], 16), int(cmd[i + 2]), cmd[i + 3]
+                with open(path, "wb") as f:
+                    f.write(flash.get(address, b"\xff" * size)[:size])
+        return subprocess.CompletedProcess(cmd, 0, "Data uploaded successfully\n", "")
+
+    def _programmer_output(self) -> list[tuple[float, str]]:
+        """(delay, line) of a successful programming, the progress bar moves over the programmer latency."""
+        latency = self.settings.latency.get("programmer", 0.0) * self.uniform(1 - self.settings.jitter, 1 + self.settings.jitter)
+        lines = [(0.0, "ST-LINK SN  : SIM0001"), (0.0, "Memory Programming ..."), (latency * 0.2, "Download in Progress:")]
+        lines += [(latency * 0.08, f"{'#' * (percent // 5)} {percent}%") for percent in range(10, 101, 10)]
+        return lines + [(0.0, "File download complete"), (0.0, "Download verified successfully")]
+
+    def ping(self, ip: str) -> int:
+        """Exit code of a ping to the DUT."""
+        self.wait("network")
+        return 1 if self.fault("network") else 0
+
+def load_simulation() -> Optional[Simulation]:
+    """Simulation selected by CAPSYS_SIMULATION, None to use the instruments of the bench."""
+    value = os.environ.get(SIMULATION_ENV, "").strip()
+    if not value or value == "0":
+        return None
+    if value == "1":
+        return Simulation(SimulationSettings())
+    try:
+        with open(value, "r", encoding="utf-8") as f:
+            return Simulation(SimulationSettings.from_json(json.load(f)))
+    except (OSError, ValueError) as e:
+        raise ValueError(f"Fichier de simulation {value} illisible : {e}")
+
+# Simulation of the process, read once at startup
+simulation = load_simulation()
+
+class SimulatedDAQManager:
+    """DAQManager with one USB-6000, the tasks are only recorded."""
+
+    def __init__(self, debug: bool = False):
+        self.debug = debug
+        self.devices: list[str] = []
+        self.tasks: list[tuple[str, str]] = []
+
+    def _call(self):
+        simulation.wait("daq")
+        if simulation.fault("daq"):
+            raise OSError("Le DAQ ne répond pas (simulation).")
+
+    def list_available_devices(self) -> list[str]:
+        self._call()
+        return [SIMULATED_DAQ]
+
+    def add_device(self, device_name: str):
+        self.devices.append(device_name)
+
+    def remove_device(self, device_name: str):
+        if device_name in self.devices:
+            self.devices.remove(device_name)
+
+    def show_device_info(self, device_name: str) -> dict:
+        return {
+            "product_type": "USB-6000",
+            "serial_number": "SIM00001",
+            "calibration_date": datetime.now(),
+        }
+
+    def create_di_task(self, device_name: str, line: str):
+        self.tasks.append((device_name, line))
+
+    def create_do_task(self, device_name: str, line: str):
+        self.tasks.append((device_name, line))
+
+    def read_a_line(self, device_name: str, line: str) -> bool:
+        self._call()
+        return False
+
+    def close_all(self):
+        self.tasks.clear()
+
+class SimulatedAcquisition:
+    """AnalogAcquisition returning the voltages of the settings with gaussian noise."""
+
+    def __init__(self, channels):
+        self.channels = tuple(channels)
+
+    def acquire(self, nb_samples: int = 50) -> dict:
+        from hardware_session import ChannelStats  # Custom (hardware_session imports this module through drivers)
+
+        simulation.wait("daq")
+        if simulation.fault("daq"):
+            raise OSError("Lecture analogique impossible (simulation).")
+        stats = {}
+        for pin in self.channels:
+            level = simulation.settings.analog.get(pin.name, DEFAULT_INPUT_VOLTAGE)
+            samples = [simulation.gauss(level, simulation.settings.noise) for _ in range(nb_samples)]
+            mean = sum(samples) / nb_samples
+            std = (sum((s - mean) ** 2 for s in samples) / nb_samples) ** 0.5
+            stats[pin] = ChannelStats(mean, std, min(samples), max(samples), nb_samples)
+        return stats
+
+    def close(self):
+        pass
+
+class SimulatedI2CBus(SimulatedI2CBackend):
+    """Simulated MCP23017 behind the I2C frames of BufferedI2C, with latency and NACK injection."""
+
+    def __init__(self, addresses=range(0x20, 0x28)):
+        # Every address a MCP23017 can take, the relay banks of all the slots answer
+        super().__init__({addr: SimulatedMCP23017() for addr in addresses})
+
+    def transfer(self, frame) -> bool:
+        simulation.wait("i2c")
+        if simulation.fault("i2c"):
+            return False  # No ACK
+        return super().transfer(frame)
+
+class ScriptedDut:
+    """Firmware of a board: answers TEST, TEST MAC and TEST MAC=... like the real one."""
+
+    def __init__(self):
+        self.mac = simulation.settings.dut_mac
+
+    def answer(self, command: str) -> list[tuple[float, str]]:
+        """Lines sent back for a command, each one after a delay in seconds."""
+        command = command.strip()
+        if command == "TEST":
+            tests = simulation.settings.dut_tests
+            # The self-test duration is spread over the result lines
+            delay = simulation.settings.latency.get("dut_test", 0.0) / max(1, len(tests))
+            lines = [(0.0, "TEST EN COURS")]
+            for test in tests:
+                jitter = simulation.uniform(1 - simulation.settings.jitter, 1 + simulation.settings.jitter)
+                lines.append((delay * jitter, f"{test} {'NOK' if simulation.fault('dut_test') else 'OK'}"))
+            lines.append((0.0, "READY"))
+            return lines
+        if command == "TEST MAC":
+            return [(0.0, f"TEST MAC {self.mac}" if self.mac else "TEST MAC NON DEFINIE")]
+        if command.startswith("TEST MAC="):
+            mac = command[len("TEST MAC="):].strip()
+            if not MAC_PATTERN.match(mac):
+                return [(0.0, "TEST MAC NOK")]
+            self.mac = mac
+            return [(0.0, "TEST MAC OK")]
+        return [(0.0, "COMMANDE INCONNUE")]
+
+class SimulatedSerialPort:
+    """pyserial Serial connected to a ScriptedDut, the firmware answers line by line from its own thread."""
+
+    def __init__(self, port: str, timeout: float = 1.0):
+        self.port = port
+        self.timeout = timeout
+        self.is_open = True
+        self.dut = ScriptedDut()
+        self._received = ""  # Characters of the command being received by the firmware
+        self._output = bytearray()  # Bytes sent by the firmware, not read yet
+        self._cond = threading.Condition()
+        self._commands: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._firmware, name=f"dut-{port}", daemon=True)
+        self._thread.start()
+
+    @property
+    def in_waiting(self) -> int:
+        with self._cond:
+            return len(self._output)
+
+    def write(self, data: bytes) -> int:
+        if not self.is_open:
+            raise serial.SerialException("Port série fermé (simulation).")
+        self._received += data.decode("utf-8", errors="replace")
+        *commands, self._received = re.split(r"[\r\n]", self._received)
+        for command in commands:
+            if command.strip():
+                self._commands.put(command)
+        return len(data)
+
+    def read(self, size: int = 1) -> bytes:
+        """Wait up to timeout for at least one byte and return at most size bytes."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._output or not self.is_open, timeout=self.timeout)
+            data = bytes(self._output[:size])
+            del self._output[:size]
+            return data
+
+    def reset_input_buffer(self):
+        with self._cond:
+            self._output.clear()
+
+    def close(self):
+        self.is_open = False
+        self._commands.put(None)
+        with self._cond:
+            self._cond.notify_all()
+
+    def _firmware(self):
+        while True:
+            command = self._commands.get()
+            if command is None:
+                return
+            simulation.wait("serial")
+            if simulation.fault("serial"):
+                continue  # Command lost, the host reads nothing
+            for delay, line in self.dut.answer(command):
+                if delay > 0:
+                    time.sleep(delay)
+                if not self.is_open:
+                    return
+                with self._cond:
+                    self._output += (line + "\r\n").encode("utf-8")
+                    self._cond.notify_all()
+
+class SimulatedSerialUsbDut:
+    """configuration.SerialUsbDut on a SimulatedSerialPort, a new board is inserted at each opening of the port."""
+
+    def __init__(self, port=None, baudrate=115200, timeout=1, debug=False, timer=None):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.debug = debug
+        self.timer = timer
+        self.ser: Optional[SimulatedSerialPort] = None
+
+    @property
+    def protocol(self) -> SerialProtocol:
+        return SerialProtocol(self.ser, self.timer)
+
+    def open_with_port(self, port: str):
+        simulation.wait("serial")
+        if simulation.fault("serial") or not simulation.port_present(port):
+            raise serial.SerialException(f"Ouverture de {port} impossible (simulation).")
+        self.port = port
+        self.ser = SimulatedSerialPort(port, self.timeout)
+
+    def is_connected(self) -> bool:
+        return self.ser is not None and self.ser.is_open
+
+    def close(self):
+        if self.ser is not None:
+            self.ser.close()
+            self.ser = None
+
+    def get_valid(self, sn=None) -> bool:
+        return True
+
+    def send_command(self, command: str, expected_response: str = "", exact_match: bool = False, timeout: float = 0, read_until: str = "") -> str:
+        """Answer of a command (until read_until, or its first line), raises SerialException if it is not received."""
+        if not self.is_connected():
+            raise serial.SerialException("Port série fermé (simulation).")
+        result = self.protocol.stream(command, until=read_until or None, timeout=timeout or 10.0, abort_on_nok=False, line_ending="")
+        if not result.completed:
+            raise serial.SerialException(f"Pas de réponse à {command.strip()} (simulation).")
+        return result.text
+
+    def send_command_Cr(self, command: str, expected_response: str = "", exact_match: bool = False, timeout: float = 0, read_until: str = "") -> str:
+        return self.send_command(command + "\n", expected_response, exact_match, timeout, read_until)
+
+class SimulatedPrinterDC:
+    """Receipt printer of the failure tickets, the tickets are kept in simulation.printed."""
+
+    def __init__(self, printer_name: str = "", debug: bool = False):
+        self.printer_name = printer_name
+        self.debug = debug
+        self.connected = True
+
+    def custom_print_bdt(self, operator, info, device_under_test_id, label, infos=None):
+        simulation.wait("printer")
+        if simulation.fault("printer"):
+            raise OSError("Imprimante hors ligne (simulation).")
+        simulation.record("ticket", {"operator": operator, "device_under_test_id": device_under_test_id, "label": label, "infos": infos})
+
+class SimulatedBradyBP12Printer:
+    """Brady label printer, the labels are kept in simulation.printed."""
+
+    def __init__(self, *args, **kwargs):
+        self.connected = True
+
+    def print_label(self, messages, qrcode=None, nb_copies: int = 1):
+        simulation.wait("printer")
+        if simulation.fault("printer"):
+            raise OSError("Imprimante Brady hors ligne (simulation).")
+        simulation.record("label", {"messages": list(messages), "qrcode": qrcode, "nb_copies": nb_copies})
+
+class SimulatedMACManager:
+    """MACManager giving the next address of the simulation instead of reading the Excel file."""
+
+    def __init__(self, path: str = "", sheet_name: str = ""):
+        self.path = path
+        self.sheet_name = sheet_name
+
+    def open_file(self):
+        if simulation.fault("mac_file"):
+            raise OSError(f"Fichier {self.path} verrouillé (simulation).")
+
+    def assign_mac(self, product: str = "", delivery_date: str = "", bl: str = "") -> dict:
+        mac_address, row = simulation.assign_mac()
+        return {"mac_address": mac_address, "row": row}
+
+    def save(self):
+        pass
+
+    def close(self):
+        pass
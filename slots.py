@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Exécution multi-emplacements : plusieurs cartes sont testées en même temps sur le banc.
+
+Chaque emplacement a sa propre AppConfig (connexion BDD, device_under_test, port série du DUT,
+port USB du programmateur, MCP23017 de ses relais, journaux locaux) et son propre TestThread.
+La session matérielle et les imprimantes sont partagées, leur accès est sérialisé par resource_arbiter.
+
+Les emplacements sont déclarés dans la table SLOTS du fichier de config du produit :
+    "SLOTS": [
+        {"name": "Emplacement 1", "port": "COM11", "programmer_port": "usb1"},
+        {"name": "Emplacement 2", "port": "COM12", "programmer_port": "usb2", "mcp_addr": "0x21"}
+    ]
+Le port du DUT peut aussi être désigné par le numéro de série USB du périphérique ("serial_number"),
+avec le VID/PID de PORT_COM_DUT (voir serial_ports.py).
+Sans table SLOTS, le banc teste une seule carte comme avant.
+"""
+
+from dataclasses import dataclass
+from typing import Optional
+import configuration  # Custom
+from bench_context import load_bench_context  # Custom
+from drivers import GenericDatabaseManager  # Custom
+from hardware_session import HardwareSession  # Custom
+
+SLOTS_KEY = "SLOTS"
+
+@dataclass
+class SlotSettings:
+    """Instruments of one slot of the bench."""
+    index: int
+    name: str
+    port: str = ""  # Serial port of the DUT, empty to use PORT_COM_DUT of the config
+    serial_number: str = ""  # USB serial number of the DUT port, found with the VID/PID of PORT_COM_DUT
+    programmer_port: str = configuration.PROGRAMMER_PORT_DEFAULT  # STM32_Programmer_CLI port, e.g. "usb2"
+    mcp_addr: Optional[int] = None  # I2C address of the MCP23017 of the slot, None for the addresses of MCP23017Pin
+
+def parse_slots(config_json: dict) -> list[SlotSettings]:
+    """
+    Read the SLOTS table of the config JSON, [] if it is absent.
+
+    Raises:
+        ValueError: if an entry is invalid or two slots share an instrument.
+    """
+    entries = config_json.get(SLOTS_KEY) or []
+    if not isinstance(entries, list):
+        raise ValueError("La table SLOTS du fichier de config doit être une liste.")
+    slots = []
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            raise ValueError(f"L'emplacement {index + 1} de la table SLOTS est invalide.")
+        mcp_addr = entry.get("mcp_addr")
+        if isinstance(mcp_addr, str):
+            try:
+                mcp_addr = int(mcp_addr, 0)
+            except ValueError:
+                raise ValueError(f"Adresse MCP23017 invalide pour l'emplacement {index + 1} : {mcp_addr}")
+        slots.append(SlotSettings(
+            index=index,
+            name=entry.get("name") or f"Emplacement {index + 1}",
+            port=entry.get("port", ""),
+            serial_number=entry.get("serial_number", ""),
+            programmer_port=entry.get("programmer_port") or configuration.PROGRAMMER_PORT_DEFAULT,
+            mcp_addr=mcp_addr,
+        ))
+    for label, values in (
+        ("port série", [slot.port for slot in slots if slot.port]),
+        ("numéro de série USB", [slot.serial_number for slot in slots if slot.serial_number]),
+        ("port de programmation", [slot.programmer_port for slot in slots]),
+        ("MCP23017", [slot.mcp_addr for slot in slots]),
+    ):
+        if len(set(values)) != len(values):
+            raise ValueError(f"Plusieurs emplacements utilisent le même {label}.")
+    return slots
+
+def load_slot_settings(config: configuration.AppConfig) -> list[SlotSettings]:
+    """
+    Slots declared in the config JSON of config.arg.product_list_id, read at startup.
+    The context is not put in config.bench_context_cache, s01 still loads the config of each slot.
+
+    Raises:
+        ValueError: if the config can't be loaded or its SLOTS table is invalid.
+    """
+    operator = config.arg.operator.split()
+    if config.db is None or len(operator) < 2:
+        return []  # Reported by s01
+    context = load_bench_context(config.db, operator[1], config.arg.product_list_id)
+    return parse_slots(context.load_config_json())
+
+def create_slot_config(base: configuration.AppConfig, settings: SlotSettings) -> configuration.AppConfig:
+    """
+    AppConfig of an additional slot: the arguments, hardware session and printers are those of base,
+    the database connection, journals, serial port and relay bank are its own.
+    """
+    config = configuration.AppConfig(slot=settings)
+    config.arg = base.arg
+    config.db_config = base.db_config
+    config.printer = base.printer
+    config.brady_printer = base.brady_printer
+    # A single session owns the DAQ, it is created here so that the slots don't enumerate it each on their own
+    if base.hardware is None:
+        base.hardware = HardwareSession(debug=base.arg.show_all_logs)
+    config.hardware = base.hardware
+    if base.db_config is not None:
+        config.db = configuration.LockedDatabase(GenericDatabaseManager(base.db_config, debug=base.arg.show_all_logs))
+        config.db.connect()
+    return config
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Registre des étapes du dossier steps/ : les fichiers sont découverts et importés une seule fois
+par processus, un module n'est réimporté que si la date de modification de son fichier change.
+"""
+
+import os, threading, importlib.util
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+STEPS_FOLDER = os.path.join(os.path.dirname(__file__), "steps")
+FINAL_STEP = ("zz", "fin_du_test.py")
+DEFAULT_INFO = "Pas d'information disponible pour cette étape."
+
+@dataclass
+class StepEntry:
+    """A step file and its loaded module."""
+    name: str  # Module name used by TestThread, e.g. "s01_initialisation" or "fin_du_test"
+    path: str
+    mtime: float
+    module: Any
+
+    @property
+    def run_step(self) -> Optional[Callable]:
+        return getattr(self.module, "run_step", None)
+
+    @property
+    def get_info(self) -> Callable:
+        return getattr(self.module, "get_info", lambda: DEFAULT_INFO)
+
+    @property
+    def display_name(self) -> str:
+        """Name shown in the step list of the GUI, e.g. "Initialisation"."""
+        return os.path.splitext(os.path.basename(self.path))[0].capitalize()
+
+class StepRegistry:
+    """Cache of the step modules, ordered as executed (s01, s02, ... then zz/fin_du_test.py last)."""
+
+    def __init__(self, steps_folder: str = STEPS_FOLDER):
+        self.steps_folder = steps_folder
+        self._lock = threading.Lock()
+        self._entries: dict[str, StepEntry] = {}  # path -> entry
+        self._files: list[tuple[str, str]] = []  # (module name, path) in execution order
+        self._dirs_mtime: Optional[tuple] = None
+        self.nb_imports = 0
+
+    def steps(self) -> list[StepEntry]:
+        """Return the steps defining run_step, importing only new or modified files."""
+        with self._lock:
+            self._discover()
+            entries = []
+            for name, path in self._files:
+                entry = self._load(name, path)
+                if entry.run_step is not None:
+                    entries.append(entry)
+            return entries
+
+    def file_names(self) -> set[str]:
+        """Names of the step files without extension (the step_name saved by the steps, e.g. "init_dut"), without importing them."""
+        with self._lock:
+            self._discover()
+            return {os.path.splitext(os.path.basename(path))[0] for _, path in self._files}
+
+    def get(self, name: str) -> Optional[StepEntry]:
+        """Return the step with the given module name, e.g. "fin_du_test"."""
+        for entry in self.steps():
+            if entry.name == name:
+                return entry
+        return None
+
+    def _step_dirs(self) -> list[str]:
+        # Include the s01, s02, ... folders and the 'zz' folder
+        return sorted(
+            d
+            for d in os.listdir(self.steps_folder)
+            if os.path.isdir(os.path.join(self.steps_folder, d))
+            and (d.startswith("s") and d[1:].isdigit() or d == "zz")
+        )
+
+    def _discover(self):
+        """Walk steps/ again only if a step folder was added, removed or had files added or removed."""
+        step_dirs = self._step_dirs()
+        dirs_mtime = (os.stat(self.steps_folder).st_mtime,) + tuple(
+            (d, os.stat(os.path.join(self.steps_folder, d)).st_mtime) for d in step_dirs
+        )
+        if dirs_mtime == self._dirs_mtime:
+            return
+        files = []
+        final_step = None
+        for dir_name in step_dirs:
+            dir_path = os.path.join(self.steps_folder, dir_name)
+            for filename in sorted(f for f in os.listdir(dir_path) if f.endswith(".py")):
+                if (dir_name, filename) == FINAL_STEP:
+                    final_step = (filename[:-3], os.path.join(dir_path, filename))
+                    continue
+                files.append((f"{dir_name}_{filename[:-3]}", os.path.join(dir_path, filename)))
+        # Fin du test is always executed last
+        if final_step:
+            files.append(final_step)
+        self._files = files
+        self._dirs_mtime = dirs_mtime
+        paths = {path for _, path in files}
+        self._entries = {path: entry for path, entry in self._entries.items() if path in paths}
+
+    def _load(self, name: str, path: str) -> StepEntry:
+        mtime = os.stat(path).st_mtime
+        entry = self._entries.get(path)
+        if entry is not None and entry.mtime == mtime:
+            return entry
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)  # type: ignore[arg-type]
+        spec.loader.exec_module(module)  # type: ignore[union-attr]
+        self.nb_imports += 1
+        entry = StepEntry(name, path, mtime, module)
+        self._entries[path] = entry
+        return entry
+
+# Registry shared by TestThread and MainWindow
+registry = StepRegistry()
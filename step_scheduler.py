@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Ordonnancement des étapes d'un test d'après les ressources et les prérequis qu'elles déclarent.
+
+Une étape peut déclarer au niveau du module :
+    RESOURCES = (RESOURCE_DB, RESOURCE_SERIAL)  # Instruments utilisés par l'étape
+    REQUIRES = ("s03",)  # Étapes qui doivent être terminées avant elle (nom du dossier ou nom complet)
+Deux étapes dont les prérequis sont terminés s'exécutent en même temps si elles n'utilisent
+pas la même ressource exclusive. Une étape sans déclaration attend toutes les étapes
+précédentes et s'exécute seule, comme avant.
+"""
+
+from typing import Optional
+from resource_arbiter import RESOURCE_DAQ, RESOURCE_NETWORK, RESOURCE_PRINTER  # Custom, declared by the steps with the ones below
+from step_registry import StepEntry  # Custom
+
+RESOURCE_DB = "db"  # Database connection of the slot, each query is serialised by configuration.LockedDatabase
+RESOURCE_MCP = "mcp"  # Relays of the slot (MCP23017)
+RESOURCE_SERIAL = "serial"  # Serial port of the DUT and STM32 programmer
+
+# Resources that several steps can use at the same time
+SHARED_RESOURCES = {RESOURCE_DB}
+
+class StepPlan:
+    """Prerequisites and exclusive resources of the steps of a test, in execution order."""
+
+    def __init__(self, entries: list[StepEntry]):
+        """
+        Raises:
+            ValueError: if a step requires a step that doesn't come before it.
+        """
+        self.entries = entries
+        self.resources: list[Optional[frozenset]] = []  # None: runs alone
+        self.requires: list[set[int]] = []
+        for idx, entry in enumerate(entries):
+            resources = getattr(entry.module, "RESOURCES", None)
+            requires = getattr(entry.module, "REQUIRES", None)
+            if resources is None or requires is None:
+                # Step without declaration: after all the previous steps, alone
+                self.resources.append(None)
+                self.requires.append(set(range(idx)))
+                continue
+            self.resources.append(frozenset(resources) - SHARED_RESOURCES)
+            self.requires.append(self._resolve(idx, requires))
+
+    def _resolve(self, idx: int, requires) -> set[int]:
+        resolved = set()
+        for name in requires:
+            matches = {
+                i for i, entry in enumerate(self.entries[:idx])
+                if entry.name == name or entry.name.startswith(name + "_")
+            }
+            if not matches:
+                raise ValueError(f"L'étape {self.entries[idx].name} dépend de l'étape {name} qui ne la précède pas.")
+            resolved |= matches
+        return resolved
+
+    def conflicts(self, idx: int, running: set[int]) -> bool:
+        """True if the step can't start while the running steps use their resources."""
+        if not running:
+            return False
+        if self.resources[idx] is None:
+            return True
+        for other in running:
+            other_resources = self.resources[other]
+            if other_resources is None or self.resources[idx] & other_resources:
+                return True
+        return False
+
+    def next_steps(self, pending: list[int], finished: set[int], running: set[int]) -> list[int]:
+        """Pending steps that can start now, in execution order."""
+        started = []
+        for idx in pending:
+            if not self.requires[idx] <= finished:
+                continue
+            if self.conflicts(idx, running | set(started)):
+                continue
+            started.append(idx)
+        return started
+
+if __name__ == "__main__":
+    """Check the plan of a few declared and undeclared steps (no step file needed)."""
+    from types import SimpleNamespace
+
+    def entry(name: str, **declaration) -> StepEntry:
+        return StepEntry(name, "", 0.0, SimpleNamespace(**declaration))
+
+    plan = StepPlan([
+        entry("s01_initialisation"),
+        entry("s02_programmation", RESOURCES=(RESOURCE_DB, RESOURCE_SERIAL), REQUIRES=("s01",)),
+        entry("s03_init_dut", RESOURCES=(RESOURCE_DB, RESOURCE_DAQ, RESOURCE_MCP), REQUIRES=("s01",)),
+        entry("s04_test", RESOURCES=(RESOURCE_DB, RESOURCE_SERIAL), REQUIRES=("s03",)),
+        entry("s05_ethernet"),
+    ])
+    assert plan.next_steps([0, 1, 2, 3, 4], set(), set()) == [0]
+    assert plan.next_steps([1, 2, 3, 4], {0}, set()) == [1, 2]  # The database is shared, no other resource in common
+    assert plan.next_steps([3, 4], {0, 2}, {1}) == []  # s04 waits for the serial port used by s02
+    assert plan.next_steps([3, 4], {0, 1, 2}, set()) == [3]  # Undeclared s05 waits for every previous step
+    assert plan.next_steps([4], {0, 1, 2, 3}, set()) == [4]
+    try:
+        StepPlan([entry("s04_test", RESOURCES=(), REQUIRES=("s03",))])
+        raise AssertionError("missing prerequisite accepted")
+    except ValueError as e:
+        print(e)
+    print("StepPlan OK")
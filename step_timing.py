@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Chronométrage d'un cycle de test : durée de chaque étape et, dans les étapes, des phases nommées
+(base de données, lecture DAQ, relais, commande série, sous-processus, attente opérateur).
+
+Le temps d'attente opérateur est séparé du temps machine. Le résultat est enregistré dans skvp_json
+(une ligne par device_under_test) et résumé dans le log de l'interface. Les étapes qui tournent en même
+temps sont chronométrées chacune dans son thread ; les temps du cycle sont calculés sur la réunion des
+intervalles des étapes, pour que le temps commun ne soit compté qu'une fois.
+"""
+
+import time, threading
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from typing import Optional
+
+# Phases measured inside the steps
+PHASE_DB = "db"
+PHASE_DAQ = "daq"
+PHASE_RELAY = "relay"
+PHASE_SERIAL = "serial"
+PHASE_SUBPROCESS = "subprocess"
+PHASE_OPERATOR = "operator"
+
+PHASE_LABELS = {
+    PHASE_DB: "BDD",
+    PHASE_DAQ: "DAQ",
+    PHASE_RELAY: "relais",
+    PHASE_SERIAL: "série",
+    PHASE_SUBPROCESS: "sous-processus",
+    PHASE_OPERATOR: "opérateur",
+}
+
+@dataclass
+class StepTiming:
+    """Duration of one step and of its phases, in seconds."""
+    name: str
+    duration: float = 0.0
+    status: Optional[int] = None
+    phases: dict[str, float] = field(default_factory=dict)
+    start: float = 0.0  # perf_counter() at the start of the step
+    operator_intervals: list[tuple[float, float]] = field(default_factory=list)  # (start, end) of the operator phases
+
+    @property
+    def end(self) -> float:
+        return self.start + self.duration
+
+    @property
+    def operator(self) -> float:
+        return self.phases.get(PHASE_OPERATOR, 0.0)
+
+    @property
+    def machine(self) -> float:
+        return self.duration - self.operator
+
+    def to_dict(self) -> dict:
+        other = self.duration - sum(self.phases.values())
+        return {
+            "name": self.name,
+            "status": self.status,
+            "duration_s": round(self.duration, 4),
+            "machine_s": round(self.machine, 4),
+            "operator_s": round(self.operator, 4),
+            "phases_s": {name: round(value, 4) for name, value in self.phases.items()},
+            "other_s": round(max(other, 0.0), 4),
+        }
+
+# Timer of the step running in each thread, see current_timer()
+_thread = threading.local()
+
+def union_duration(intervals) -> float:
+    """Length of the union of the (start, end) intervals, overlapping time counted once."""
+    total = 0.0
+    current_start = current_end = None
+    for start, end in sorted(intervals):
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                total += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    if current_end is not None:
+        total += current_end - current_start
+    return total
+
+def current_timer() -> Optional["CycleTimer"]:
+    """CycleTimer whose step is running in the current thread, None outside of a step."""
+    return getattr(_thread, "timer", None)
+
+class CycleTimer:
+    """
+    Timing of the steps of one test cycle, filled by TestThread.run and by the phases of the steps.
+    The current step and the phase depth are kept per thread, so that steps running at the same time each get their phases.
+    """
+
+    def __init__(self):
+        self.steps: list[StepTiming] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._cycle_start = time.perf_counter()
+
+    def start_cycle(self):
+        """Forget the previous cycle."""
+        with self._lock:
+            self.steps = []
+        self._local = threading.local()
+        self._cycle_start = time.perf_counter()
+
+    def start_step(self, name: str) -> StepTiming:
+        """Start timing a step in the current thread."""
+        step = StepTiming(name, start=time.perf_counter())
+        self._local.current = step
+        self._local.depth = 0
+        _thread.timer = self
+        return step
+
+    def end_step(self, status: Optional[int] = None) -> Optional[StepTiming]:
+        """End the step of the current thread."""
+        step = getattr(self._local, "current", None)
+        if step is None:
+            return None
+        step.duration = time.perf_counter() - step.start
+        step.status = status
+        with self._lock:
+            self.steps.append(step)
+        self._local.current = None
+        if current_timer() is self:
+            _thread.timer = None
+        return step
+
+    @contextmanager
+    def phase(self, name: str):
+        """Add the time spent in the block to the given phase of the current step (nested phases count for the outer one only)."""
+        step = getattr(self._local, "current", None)
+        depth = getattr(self._local, "depth", 0)
+        self._local.depth = depth + 1
+        if step is None or depth:
+            try:
+                yield
+            finally:
+                self._local.depth -= 1
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._local.depth -= 1
+            end = time.perf_counter()
+            step.phases[name] = step.phases.get(name, 0.0) + end - start
+            if name == PHASE_OPERATOR:
+                step.operator_intervals.append((start, end))
+
+    @property
+    def total(self) -> float:
+        return time.perf_counter() - self._cycle_start
+
+    def split(self) -> tuple[float, float, float]:
+        """
+        (steps, machine, operator) time of the cycle, from the union of the intervals of the steps
+        and of their operator phases: the time of the steps running at the same time is counted once.
+        """
+        steps_duration = union_duration((step.start, step.end) for step in self.steps)
+        operator = union_duration(interval for step in self.steps for interval in step.operator_intervals)
+        return steps_duration, steps_duration - operator, operator
+
+    def to_dict(self) -> dict:
+        """Timing of the cycle as saved in skvp_json."""
+        steps_duration, machine, operator = self.split()
+        return {
+            "total_s": round(self.total, 4),
+            "steps_s": round(steps_duration, 4),
+            "machine_s": round(machine, 4),
+            "operator_s": round(operator, 4),
+            "steps": [step.to_dict() for step in sorted(self.steps, key=lambda step: step.start)],
+        }
+
+    def summary(self) -> list[str]:
+        """One line per step with the main phases, then the machine / operator split."""
+        lines = []
+        for step in sorted(self.steps, key=lambda step: step.start):
+            phases = ", ".join(
+                f"{PHASE_LABELS.get(name, name)} {value:.2f} s"
+                for name, value in sorted(step.phases.items(), key=lambda kv: -kv[1])
+                if value >= 0.01
+            )
+            lines.append(f"{step.name} : {step.duration:.2f} s" + (f" ({phases})" if phases else ""))
+        _, machine, operator = self.split()
+        lines.append(f"Temps machine : {machine:.2f} s, attente opérateur : {operator:.2f} s, cycle : {self.total:.2f} s")
+        return lines
+
+def timed(timer: Optional[CycleTimer], name: str):
+    """Phase context of the timer, or a no-op context for objects used without a timer (scripts run directly)."""
+    return timer.phase(name) if timer is not None else nullcontext()
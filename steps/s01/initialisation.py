@@ -1,16 +1,24 @@
 # -*- coding: utf-8 -*-
-import sys, os, json, time
+import sys, os, json
 if __name__ == "__main__":
     BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
     if BASE_DIR not in sys.path:
         sys.path.insert(0, BASE_DIR)
-from datetime import datetime, timedelta
+from datetime import datetime
 import configuration  # Custom
-from modules.capsys_mysql_command.capsys_mysql_command import (GenericDatabaseManager, DatabaseConfig, Operator) # Custom
-from modules.capsys_daq_manager.capsys_daq_manager import DAQManager  # Custom
-from modules.capsys_mcp23017.capsys_mcp23017 import BitBangI2C, MCP23017Manager  # Custom
-from modules.capsys_brady_manager.capsys_brady_manager import BradyBP12Printer  # Custom
-from configuration import VERSION, get_project_path
+from drivers import GenericDatabaseManager, DatabaseConfig  # Custom
+from drivers import BradyBP12Printer  # Custom
+from configuration import VERSION
+from bench_context import get_bench_context  # Custom
+from cycle_prefetch import take_prepared_cycle  # Custom
+from hardware_session import HardwareSession, slot_mcp_addr  # Custom
+from measurement_specs import load_specs  # Custom
+from serial_protocol import load_self_tests  # Custom
+from step_timing import PHASE_DB, PHASE_DAQ, PHASE_RELAY  # Custom
+from step_scheduler import RESOURCE_DB, RESOURCE_DAQ, RESOURCE_MCP  # Custom
+
+RESOURCES = (RESOURCE_DB, RESOURCE_DAQ, RESOURCE_MCP)
+REQUIRES = ()
 
 def get_info():
     return "Cette étape crée device_under_test."
@@ -24,102 +32,47 @@ def init_database_and_checks(log, config: configuration.AppConfig, update_percen
     if not isinstance(config.arg.operator, str) or len(config.arg.operator.split()) < 2:
         return (1, "Le champ 'operator' doit contenir au moins un prénom et un nom.")
 
-    # Retrieve operator from database
-    operators = config.db.get_by_column("operator", "name", config.arg.operator.split()[1])
-    if not operators:
-        return 1, f"Aucun opérateur {config.arg.operator.split()[1]} trouvé dans la base de données."
-    operator = Operator(**operators[0])
-    operator_id = operator.id
-
     if config.arg.product_list_id != configuration.PRODUCT_LIST_ID_DEFAULT:
         return_msg = f"Le product_list_id spécifié ({config.arg.product_list_id}) ne correspond pas au product_list_id par défaut ({configuration.PRODUCT_LIST_ID_DEFAULT})."
         return (1, return_msg)
-    
-    # Retrieve product_list from database
-    config.arg.product_list = config.db.get_by_id("product_list", config.arg.product_list_id)
-    if not config.arg.product_list:
-        return 1, "Aucun produit trouvé dans la base de données."
-
-    # Retrieve bench_composition from database
-    bench_composition_id = config.arg.product_list.get("bench_composition_id")
-    bench_composition_raw = config.db.get_by_column("bench_composition", "bench_composition_id", bench_composition_id)
-    bench_composition = bench_composition_raw if bench_composition_raw else []
-    if not bench_composition:
-        return (1, "Problème lors de la récupération de la composition du banc dans la base de données.")
-
-    # Retrieve all externals devices from database
-    external_devices = []
-    for external_device in bench_composition:
-        external_device_data = config.db.get_by_id("external_device", external_device["external_device_id"])
-        if external_device_data:
-            external_devices.append(external_device_data)
-    if not external_devices:
-        return (1, "Problème lors de la récupération des périphériques externes dans la base de données.")
-
-    # Retrieve script from database
-    script_data = config.db.get_by_column("script", "product_list_id", config.arg.product_list_id)
-    for script in script_data:
-        if script.get("valid") == 0:
-            script_data.remove(script)
-    if not script_data:
-        return (1, "Problème lors de la récupération du script dans la base de données.")
-    # Remove the "file" key if it exists because it's too large to store in the database
-    if "file" in script_data[0]:
-        del script_data[0]["file"]
-    script = script_data
-
-    # Retrieve parameters_group from database
-    parameters_group_id = config.arg.product_list.get("parameters_group_id")
-    parameters_group_raw = config.db.get_by_column("parameters_group", "parameters_group_id", parameters_group_id)
-    parameters_group = parameters_group_raw if parameters_group_raw else []
-    if not parameters_group:
-        return (1, "Problème lors de la récupération des groupes de paramètres dans la base de données.")
 
-    # Retrieve all parameters from database
-    parameters = []
-    for group in parameters_group:
-        parameters_data = config.db.get_by_id("parameters", group["parameters_id"])
-        if parameters_data:
-            parameters.append(parameters_data)
-    if not parameters:
-        return (1, "Problème lors de la récupération des paramètres dans la base de données.")
+    step_name = os.path.splitext(os.path.basename(__file__))[0]
+    operator_name = config.arg.operator.split()[1]
 
-    # Retrieve and save config.json from database
-    # config.json is used to store values used during the test
-    data_str = None
-    id = None
-    for parameter in parameters:
-        config_json_name = configuration.CONFIG_JSON_NAME
-        if parameter.get("name") == config_json_name:
-            data_str = parameter.get("file")
-            id = parameter.get("id")
-            txt = f"Le fichier de config utilisé correspond à la ligne id={id} de la table parameters"
-            log(txt, "blue")
-    if data_str == None:
-        return (1, "Le fichier config n'est pas présent dans la ddb.")
-    
-    # Write and read config.json file with proper exception handling
-    config_path = get_project_path("config.json")
-    configJson = {}
+    # Retrieve operator, product_list, bench_composition, external devices, script and parameters from database
+    # They don't change within an OF, so they are kept in a session cache revalidated with a fingerprint query.
+    # They may already have been loaded while the operator was swapping boards.
     try:
-        # Write the config file
-        with open(config_path, "wb") as f:
-            f.write(data_str)
-        
-        # Read the config file immediately after writing
-        with open(config_path, 'r', encoding='utf-8') as json_file:
-            configJson = json.load(json_file)
-    except Exception as e:
-        # Clean up the file if it was created but reading failed
+        with config.cycle_timer.phase(PHASE_DB):
+            prepared = take_prepared_cycle(config, operator_name, step_name)
+            if prepared is not None:
+                context, reused = prepared.context, prepared.reused
+            else:
+                context, reused = get_bench_context(config, operator_name)
+    except ValueError as e:
+        return 1, str(e)
+    operator_id = context.operator_id
+    config.arg.product_list = context.product_list
+    config.arg.external_devices = context.external_devices
+    config.arg.script = context.script
+    config.arg.parameters_group = context.parameters_group
+
+    # The config JSON is stored in the parameters table, it is parsed once per bench context
+    config_parameter = context.config_parameter()
+    id = config_parameter.get("id") if config_parameter else None
+    if reused:
+        log(f"Contexte du banc inchangé en base, réutilisation du cache (config id={id}).", "blue")
+    else:
+        log(f"Le fichier de config utilisé correspond à la ligne id={id} de la table parameters", "blue")
+        # Initialize configItems attributes from the config JSON mapping pins and keys from config.json in ddb
+        config.configItems.init_config_items(context.config_json)
         try:
-            if os.path.exists(config_path):
-                os.remove(config_path)
-        except Exception as cleanup_error:
-            log(f"Problème lors du nettoyage du fichier config : {cleanup_error}", "yellow")
-        return 1, f"Problème lors de la création/lecture de config.json : {e}"
-
-    # Initialize configItems attributes from the config JSON mapping pins and keys from config.json in ddb
-    config.configItems.init_config_items(configJson)
+            config.measurement_specs = load_specs(context.config_json)
+            config.self_tests = load_self_tests(context.config_json)
+        except ValueError as e:
+            config.bench_context_cache.pop(str(config.arg.product_list_id), None)
+            return 1, str(e)
+        log(f"{len(config.measurement_specs)} mesure(s) analogique(s) configurée(s).", "blue")
 
     # Create device_under_test
     device_under_test_data = {
@@ -134,26 +87,19 @@ def init_database_and_checks(log, config: configuration.AppConfig, update_percen
         "failure_label": "",
         "name": config.arg.name
     }
-    config.device_under_test_id = config.db.create("device_under_test", device_under_test_data)
+    with config.cycle_timer.phase(PHASE_DB):
+        config.device_under_test_id = config.db.create("device_under_test", device_under_test_data)
 
     log(f"Device Under Test créé avec l'ID {config.device_under_test_id}.", "purple")
 
     step_name_id = config.db.create("step_name",
-        {"device_under_test_id": config.device_under_test_id, "step_name": os.path.splitext(os.path.basename(__file__))[0]}
+        {"device_under_test_id": config.device_under_test_id, "step_name": step_name}
     )
 
     # Create the data dictionary to be inserted into skvp_json
-    data = {
-        "device_under_test_id": config.device_under_test_id,
-        "operator": operator.to_dict() if hasattr(operator, 'to_dict') else vars(operator),
-        "product_list": config.arg.product_list,  # already a dictionary
-        "bench_composition": bench_composition,  # already a list of dictionaries
-        "external_devices": external_devices,   # already a list of dictionaries
-        "script": script,                       # already a dictionary
-        "parameters_group": parameters_group,   # already a list of dictionaries
-        "parameters": parameters,               # already a list of dictionaries
-    }
+    data = {"device_under_test_id": config.device_under_test_id, **context.to_dict()}
 
+    config.initialisation_step_name_id = step_name_id
     config.save_value(step_name_id, "VERSION", VERSION)
     config.save_value(step_name_id, "data_used_for_test", json.dumps(data, indent=4, ensure_ascii=False, default=str))
     config.save_value(step_name_id, "id_fichier_config", id)
@@ -165,53 +111,12 @@ def connect_daq(config: configuration.AppConfig, step_name_id):
     if not hasattr(config, "db") or config.db is None:
         return 1, "Erreur : config.db n'est pas initialisé."
 
-    # Initialize DAQManager
-    daq_manager_local = DAQManager(debug=config.arg.show_all_logs)
-
-    # List all available DAQ devices
-    available_devices = daq_manager_local.list_available_devices()
-    if not available_devices:
-        return 1, "Aucun appareil NI détecté."
-
-    # Check if USB-6000 is present
-    for device_name in available_devices:
-        daq_manager_local.add_device(device_name)
-        device_info = daq_manager_local.show_device_info(device_name)
-        if device_info and device_info.get("product_type") == "USB-6000":
-            config.daq_port = device_name
-            break
-        else:
-            daq_manager_local.remove_device(device_name)
-    if config.daq_port is None:
-        return 1, "Aucun appareil USB-6000 détecté."
-
-    config.daq_manager = daq_manager_local
-    config.daq_manager.close_all()  # If any task are left in the daq, we remove them
-
-    # Check calibration date (allow if missing)
-    device_info = config.daq_manager.show_device_info(config.daq_port)
-    if not device_info:
-        return (1, f"Impossible de lire les informations du périphérique {config.daq_port}.")
-    product_type = device_info.get("product_type")
-    serial_number = device_info.get("serial_number")
-    calibration_date = device_info.get("calibration_date")
-
-    status_code = 0  # Default status: OK
-    if calibration_date is not None:
-        current_date = datetime.now()
-        if current_date > calibration_date + timedelta(days=1095):
-            status_code = 2  # Calibration expired
-
-    # Create tasks for the whole test
-    config.daq_manager.create_do_task(config.daq_port, configuration.DAQPin.I2C_SDA_OUT.value)
-    config.daq_manager.create_di_task(config.daq_port, configuration.DAQPin.I2C_SDA_IN.value)
-    config.daq_manager.create_do_task(config.daq_port, configuration.DAQPin.I2C_SCL.value)
-    config.daq_manager.create_ai_task(config.daq_port, configuration.DAQPin.M_V_IVE1.value)
-    config.daq_manager.create_ai_task(config.daq_port, configuration.DAQPin.M_V_IVE2.value)
-    config.daq_manager.create_ai_task(config.daq_port, configuration.DAQPin.M_V_IVF.value)
-    config.daq_manager.create_ai_task(config.daq_port, configuration.DAQPin.M_V_AT.value)
-
-    return_msg = f"Config DAQ : Port : {config.daq_port} ; Model : {product_type} ; SN : {serial_number} ; Calibration : {calibration_date}"
+    # The hardware session is kept open between boards, the DAQ is only enumerated again if it stops answering
+    if config.hardware is None:
+        config.hardware = HardwareSession(debug=config.arg.show_all_logs)
+    with config.cycle_timer.phase(PHASE_DAQ):
+        status_code, return_msg = config.hardware.connect_daq()
+    config.hardware.attach(config)
     return status_code, return_msg
 
 def init_mcp23017(config: configuration.AppConfig, step_name_id):
@@ -219,30 +124,14 @@ def init_mcp23017(config: configuration.AppConfig, step_name_id):
     if not hasattr(config, "db") or config.db is None:
         return 1, "Erreur : config.db n'est pas initialisé."
 
-    if config.daq_port == None or config.daq_manager == None:
+    if config.hardware is None or config.daq_port == None or config.daq_manager == None:
         return 1, "NOK"
 
-    # Create a single I2C interface that will be shared by both MCP23017 devices
-    i2c_interface = BitBangI2C(
-        sda_out_device=config.daq_port,
-        sda_out_line=configuration.DAQPin.I2C_SDA_OUT.value,
-        sda_in_device=config.daq_port,
-        sda_in_line=configuration.DAQPin.I2C_SDA_IN.value,
-        scl_device=config.daq_port,
-        scl_line=configuration.DAQPin.I2C_SCL.value,
-        daq_manager=config.daq_manager,
-        debug=config.arg.show_all_logs,
-    )
-
-    # Create MCP controller - everything is automatic!
-    config.mcp_manager = MCP23017Manager(i2c_interface, configuration.MCP23017Pin, debug=config.arg.show_all_logs)
-
-    return_msg = f"Config MCP23017 : SDA out sur {configuration.DAQPin.I2C_SDA_OUT.value}, SDA in sur {configuration.DAQPin.I2C_SDA_IN.value}, SCL sur {configuration.DAQPin.I2C_SCL.value}."
-    config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_AUTOMATIC_BTL, True)
-    config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_AUTOMATIC_24V, True)
-    config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_AUTOMATIC_GND_IVE1_IVE2_IVF, True)
-    time.sleep(1)
-    return 0, return_msg
+    # Reuse the MCP23017 of the session (relay reset only), recreated if the reset fails
+    with config.cycle_timer.phase(PHASE_RELAY):
+        status_code, return_msg = config.hardware.init_mcp23017(slot_mcp_addr(config))
+    config.hardware.attach(config)
+    return status_code, return_msg
 
 def run_step(log, config: configuration.AppConfig, update_percentage=lambda x: None):
     step_name = os.path.splitext(os.path.basename(__file__))[0]
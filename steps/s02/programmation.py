@@ -1,12 +1,20 @@
 # -*- coding: utf-8 -*-
 
-import sys, os, subprocess, time
+import sys, os, time
 if __name__ == "__main__":
     BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
     if BASE_DIR not in sys.path:
         sys.path.insert(0, BASE_DIR)
 import configuration  # Custom
-from modules.capsys_mysql_command.capsys_mysql_command import (GenericDatabaseManager, DatabaseConfig) # Custom
+from drivers import GenericDatabaseManager, DatabaseConfig  # Custom
+from step_timing import PHASE_RELAY, PHASE_SUBPROCESS  # Custom
+from simulators import simulation  # Custom
+from serial_ports import port_pool, port_key  # Custom
+from stm32_programmer import ProgrammerJob, program_all, image_digest, flash_sha256, PROGRAMMER_TIMEOUT_S  # Custom
+from step_scheduler import RESOURCE_DB, RESOURCE_MCP, RESOURCE_SERIAL  # Custom
+
+RESOURCES = (RESOURCE_DB, RESOURCE_MCP, RESOURCE_SERIAL)
+REQUIRES = ("s01",)
 
 def get_info():
     return "Cette étape vient programmer le DUT."
@@ -25,13 +33,20 @@ def run_step(log, config: configuration.AppConfig, update_percentage=lambda x: N
         return_msg["infos"].append("Le gestionnaire MCP n'est pas initialisé.")
         return 1, return_msg
     
-    config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_24V, False)
-    config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_BTL, True)
-    config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_AUTOMATIC_BTL, True)
-    config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_AUTOMATIC_24V, True)
-    config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_24V, True)
-    config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_VCC_USB, True)
-    time.sleep(1)
+    # EN_24V is written alone first to keep the power cycle of the DUT
+    with config.cycle_timer.phase(PHASE_RELAY):
+        config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_24V, False)
+        config.mcp_manager.write_pins({
+            configuration.MCP23017Pin.EN_BTL: True,
+            configuration.MCP23017Pin.EN_AUTOMATIC_BTL: True,
+            configuration.MCP23017Pin.EN_AUTOMATIC_24V: True,
+            configuration.MCP23017Pin.EN_24V: True,
+            configuration.MCP23017Pin.EN_VCC_USB: True,
+        })
+        time.sleep(1)
+    # The DUT was powered off, its USB port enumerates again: the handle of the previous board is closed
+    # and s03 waits for the port to come back
+    port_pool.close(port_key(config.slot))
 
     # If debug, skip programming
     # TODO
@@ -40,6 +55,7 @@ def run_step(log, config: configuration.AppConfig, update_percentage=lambda x: N
         return 0, return_msg
     else:
         path_soft = config.µc_path
+        # "port" selects another probe of the fixture, the images of different probes are written at the same time
         binaries = [
             {"path": path_soft, "log_key": "Application"},
         ]
@@ -47,49 +63,71 @@ def run_step(log, config: configuration.AppConfig, update_percentage=lambda x: N
         path_stm32 = config.configItems.stm32_cube_programmer.path
         programmer_dir = getattr(config, 'stm32_programmer_dir', path_stm32)
         programmer_cli = os.path.join(programmer_dir, "STM32_Programmer_CLI.exe")
-        if not os.path.exists(programmer_cli):
+        if simulation is None and not os.path.exists(programmer_cli):
             return 1, f"STM32CubeProgrammer not found at {programmer_cli}."
         
-        total_binaries = len(binaries)
-        for idx, binary in enumerate(binaries):
-            percentage = int((idx / total_binaries) * 100)
-            update_percentage(percentage)
-            if not os.path.exists(binary["path"]):
+        # Each slot has its own ST-LINK, the slots are programmed at the same time
+        programmer_port = config.slot.programmer_port if config.slot is not None else configuration.PROGRAMMER_PORT_DEFAULT
+        jobs = []
+        for binary in binaries:
+            if simulation is None and not os.path.exists(binary["path"]):
                 return 1, f"File not found: {binary['path']}"
-            
-            cmd = [
-                programmer_cli,
-                "-c", f"port=usb1",
-                "-w", binary["path"]
-            ]
-            log(f"Commande subprocess: {' '.join(cmd)}", "blue")
-            
-            result = subprocess.run(
-                cmd,
-                check=False,
-                # stdout=subprocess.DEVNULL,
-                # stderr=subprocess.DEVNULL,
-            )
-            msg = f"Programmation de {binary['path']} - returncode={result.returncode}"
-            log(msg, "blue")
-            config.db.create(
-                "skvp_char", {
-                    "step_name_id": step_name_id,
-                    "val_char": msg
-                }
-            )
-            if result.returncode != 0:
-                return_msg["infos"].append(f"Code de retour : {result.returncode}")
-                return_msg["infos"].append(f"Pensez à vérifier l'état du port COM et le câblage.")
-                return 1, return_msg
+            jobs.append(ProgrammerJob(programmer_cli, binary.get("port", programmer_port), binary["path"], binary["log_key"]))
+            log(f"Commande subprocess: {' '.join(jobs[-1].cmd)}", "blue")
+
+        # A board that already carries the image (rework) is not written again: the flash is read back
+        # over the address ranges of the .hex and compared with the file, hashed once per session
+        to_write = []
+        for job in jobs:
+            try:
+                digest = image_digest(job.image, config.image_digests) if os.path.exists(job.image) else None
+            except (OSError, ValueError) as e:
+                log(f"Empreinte de {job.image} impossible, l'image est écrite : {e}", "yellow")
+                digest = None
+            if digest is None:
+                to_write.append(job)
+                continue
+            with config.cycle_timer.phase(PHASE_SUBPROCESS):
+                flash, read_result = flash_sha256(job, digest)
+            config.save_value(step_name_id, f"image_sha256_{job.label}", digest.sha256)
+            config.save_value(step_name_id, f"flash_sha256_{job.label}", flash or f"Relecture impossible, returncode={read_result.returncode}")
+            if flash == digest.sha256:
+                msg = f"Programmation {job.label} ({job.port}) ignorée : image déjà présente"
+                log(msg, "blue")
+                config.save_value(step_name_id, f"programmer_{job.label}", msg)
+            else:
+                to_write.append(job)
+
+        def cli_line(line: str):
+            if config.arg.show_all_logs:
+                log(line, "white")
+
+        # The CLI progress moves the step from 0 to 90 %, the power cycle takes the rest
+        with config.cycle_timer.phase(PHASE_SUBPROCESS):
+            results = program_all(to_write, PROGRAMMER_TIMEOUT_S, lambda percent: update_percentage(percent * 90 // 100), cli_line)
+        for result in results:
+            log(result.describe(), "blue" if result.ok else "red")
+            config.save_value(step_name_id, f"programmer_{result.job.label}", result.describe())
+            config.save_value(step_name_id, f"programmer_{result.job.label}_output", result.to_dict())
+        failed = [result for result in results if not result.ok]
+        if failed or len(results) < len(to_write):
+            for result in failed:
+                return_msg["infos"].append(result.describe())
+                return_msg["infos"].extend((result.stderr or result.stdout)[-3:])
+            return_msg["infos"].append(f"Pensez à vérifier l'état du port COM et le câblage.")
+            return 1, return_msg
         
-        time.sleep(1)
-        config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_VCC_USB, False)
-        config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_24V, False)
-        config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_BTL, False)
-        config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_AUTOMATIC_BTL, True)
-        config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_AUTOMATIC_24V, True)
-        time.sleep(1)
+        with config.cycle_timer.phase(PHASE_RELAY):
+            time.sleep(1)
+            config.mcp_manager.write_pins({
+                configuration.MCP23017Pin.EN_VCC_USB: False,
+                configuration.MCP23017Pin.EN_24V: False,
+                configuration.MCP23017Pin.EN_BTL: False,
+                configuration.MCP23017Pin.EN_AUTOMATIC_BTL: True,
+                configuration.MCP23017Pin.EN_AUTOMATIC_24V: True,
+            })
+            time.sleep(1)
+        update_percentage(100)
 
         return_msg["infos"].append("Étape OK")
         return 0, return_msg
@@ -6,7 +6,16 @@ if __name__ == "__main__":
     if BASE_DIR not in sys.path:
         sys.path.insert(0, BASE_DIR)
 import configuration  # Custom
-from modules.capsys_mysql_command.capsys_mysql_command import (GenericDatabaseManager, DatabaseConfig) # Custom
+from drivers import GenericDatabaseManager, DatabaseConfig  # Custom
+from measurement_specs import specs_for_step, evaluate, save_verdicts  # Custom
+from step_timing import PHASE_SERIAL  # Custom
+from serial_ports import PortIdentity, port_pool, port_key  # Custom
+from simulators import simulation  # Custom
+from resource_arbiter import arbiter, RESOURCE_DAQ  # Custom
+from step_scheduler import RESOURCE_DB, RESOURCE_MCP, RESOURCE_SERIAL  # Custom
+
+RESOURCES = (RESOURCE_DB, RESOURCE_DAQ, RESOURCE_MCP, RESOURCE_SERIAL)
+REQUIRES = ("s02",)
 
 def get_info():
     return "Cette étape teste les seuils de fonctionnement du radar."
@@ -24,59 +33,70 @@ def run_step(log, config: configuration.AppConfig, update_percentage=lambda x: N
     if config.mcp_manager is None:
         return_msg["infos"].append("Le gestionnaire MCP n'est pas initialisé.")
         return 1, return_msg
-    if config.daq_manager is None or config.daq_port is None:
+    if config.hardware is None or config.daq_manager is None or config.daq_port is None:
         return_msg["infos"].append("Le gestionnaire DAQ n'est pas initialisé.")
         return 1, return_msg
     
-    config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_BTL, False)
-    config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_GND_IVE1_IVE2_IVF_2, False)
-    config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_AUTOMATIC_24V, True)
-    config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_AUTOMATIC_BTL, True)
-    config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_24V, True)
+    config.mcp_manager.write_pins({
+        configuration.MCP23017Pin.EN_BTL: False,
+        configuration.MCP23017Pin.EN_GND_IVE1_IVE2_IVF_2: False,
+        configuration.MCP23017Pin.EN_AUTOMATIC_24V: True,
+        configuration.MCP23017Pin.EN_AUTOMATIC_BTL: True,
+        configuration.MCP23017Pin.EN_24V: True,
+    })
 
-    if configuration.HASH_GIT == "DEBUG":
+    # The port is found by its USB identity if the config gives one, its name can change at each enumeration
+    try:
+        identity = PortIdentity.from_config(config.configItems.dut, config.slot)
+    except ValueError as e:
+        return_msg["infos"].append(str(e))
+        return 1, return_msg
+    if simulation is not None and not identity.is_usb:
+        identity = simulation.port_identity(port_key(config.slot))  # The simulated DUTs are on /dev/ttyACMx
+    elif not identity.is_usb and not (config.slot is not None and config.slot.port) and configuration.HASH_GIT == "DEBUG":
         log(f"DEBUG mode: Using COM11 for serial communication.", "yellow")
-        port = "COM11" # PC TGE
+        identity = PortIdentity(port="COM11") # PC TGE
+
+    def open_port(device: str):
+        dut = configuration.SerialUsbDut(port=device, timer=config.cycle_timer)
+        dut.open_with_port(device)
+        return dut
+
+    start = time.perf_counter()
+    try:
+        with config.cycle_timer.phase(PHASE_SERIAL):
+            config.serDut, port, reused = port_pool.acquire(port_key(config.slot), identity, open_port)
+    except (ValueError, OSError) as e:
+        return_msg["infos"].append(f"Ouverture du port série du DUT impossible : {e}")
+        return 1, return_msg
+    if reused:
+        log(f"Port {port.describe()} déjà ouvert, réutilisé", "blue")
     else:
-        port = config.configItems.dut.port
-    
-    config.serDut = configuration.SerialUsbDut(port=port)
-    config.serDut.open_with_port(port)
-    log(f"Port {port} ouvert avec succès", "blue")
+        log(f"Port {port.describe()} ouvert avec succès en {time.perf_counter() - start:.1f} s", "blue")
+    config.save_value(step_name_id, "dut_port", port.describe())
 
     test_ok = 0
-    # R1 = 12k ohm, R2 = 5.6k ohm, Vout = Vin * (R2 / (R1 + R2))
-    mult = 5.6/(5.6+12)
-    min = 23.5
-    max = 25.5
-    unit = "V"
-    config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_GND_IVE1_IVE2_IVF_2, True)
-    time.sleep(0.5)  # Wait for voltages to stabilize
-    meas_ive1 = config.daq_manager.read_a_line(config.daq_port, configuration.DAQPin.M_V_IVE1.value) / mult
-    log(f"Ive1 mesuré : {meas_ive1:.3f} V, min={min}{unit}, max={max}{unit}", "blue")
-    id_skvp_ive1 = config.save_value(step_name_id, "IVE1_V", meas_ive1, unit, min, max)
-    if (meas_ive1 < min) or (meas_ive1 > max):
-        return_msg["infos"].append(f"IVE1 mesuré à {meas_ive1:.3f} V hors des limites ({min}-{max} {unit}).")
-        test_ok = 1
-    else:
-        config.db.update_by_id("skvp_float", id_skvp_ive1, {"valid": 1})
-    meas_ive2 = config.daq_manager.read_a_line(config.daq_port, configuration.DAQPin.M_V_IVE2.value) / mult
-    log(f"Ive2 mesuré : {meas_ive2:.3f} V, min={min}{unit}, max={max}{unit}", "blue")
-    id_skvp_ive2 = config.save_value(step_name_id, "IVE2_V", meas_ive2, unit, min, max)
-    if (meas_ive2 < min) or (meas_ive2 > max):
-        return_msg["infos"].append(f"IVE2 mesuré à {meas_ive2:.3f} V hors des limites ({min}-{max} {unit}).")
-        test_ok = 1
-    else:
-        config.db.update_by_id("skvp_float", id_skvp_ive2, {"valid": 1})
-    meas_ivf = config.daq_manager.read_a_line(config.daq_port, configuration.DAQPin.M_V_IVF.value) / mult
-    log(f"Ivf mesuré : {meas_ivf:.3f} V, min={min}{unit}, max={max}{unit}", "blue")
-    id_skvp_ivf = config.save_value(step_name_id, "IVF_V", meas_ivf, unit, min, max)
-    if (meas_ivf < min) or (meas_ivf > max):
-        return_msg["infos"].append(f"IVF mesuré à {meas_ivf:.3f} V hors des limites ({min}-{max} {unit}).")
-        test_ok = 1
-    else:
-        config.db.update_by_id("skvp_float", id_skvp_ivf, {"valid": 1})
-    config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_GND_IVE1_IVE2_IVF_2, False)
+    # Limits, dividers and channels are declared in the MEASUREMENTS table of the config file
+    specs = specs_for_step(config.measurement_specs, step_name)
+    if not specs:
+        return_msg["infos"].append(f"Aucune mesure analogique n'est configurée pour l'étape {step_name} (MEASUREMENTS).")
+        return 1, return_msg
+    # The analog inputs are connected to this board while EN_GND_IVE1_IVE2_IVF_2 is on, the other slots wait for the DAQ
+    with arbiter.use(RESOURCE_DAQ):
+        config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_GND_IVE1_IVE2_IVF_2, True)
+        # Wait for voltages to stabilize (0.5 s max) then evaluate all the channels on the last acquisition,
+        # acquired together (one multi-channel AI read, averaged over the samples)
+        settle = config.hardware.wait_settled(tuple(spec.channel for spec in specs), max_wait=0.5)
+        config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_GND_IVE1_IVE2_IVF_2, False)
+    log(f"Tensions {'stabilisées' if settle.settled else 'non stabilisées'} après {settle.elapsed * 1000:.0f} ms", "blue" if settle.settled else "yellow")
+    config.save_value(step_name_id, "IVE_IVF_settle_time_s", settle.elapsed, "s")
+    verdicts = evaluate(specs, settle.stats)
+    for verdict in verdicts:
+        log(verdict.describe(), "blue")
+        if not verdict.valid:
+            return_msg["infos"].append(verdict.failure())
+            test_ok = 1
+    save_verdicts(config, step_name_id, verdicts)
     
     if test_ok == 0:
         return_msg["infos"].append("Étape OK")
@@ -6,7 +6,18 @@ if __name__ == "__main__":
     if BASE_DIR not in sys.path:
         sys.path.insert(0, BASE_DIR)
 import configuration  # Custom
-from modules.capsys_mysql_command.capsys_mysql_command import (GenericDatabaseManager, DatabaseConfig) # Custom
+from drivers import GenericDatabaseManager, DatabaseConfig  # Custom
+from measurement_specs import specs_for_step, evaluate, save_verdicts  # Custom
+from step_timing import PHASE_RELAY  # Custom
+from serial_protocol import READY, SelfTestProgress  # Custom
+from resource_arbiter import arbiter, RESOURCE_DAQ  # Custom
+from step_scheduler import RESOURCE_DB, RESOURCE_MCP, RESOURCE_SERIAL  # Custom
+
+RESOURCES = (RESOURCE_DB, RESOURCE_DAQ, RESOURCE_MCP, RESOURCE_SERIAL)
+REQUIRES = ("s03",)
+
+TEST_TIMEOUT_S = 30  # Maximum duration of the self-test of the firmware
+SELF_TEST_PERCENTAGE = 80  # Share of the step taken by the self-test, the AT measurement follows
 
 def get_info():
     return "Cette étape teste les seuils de fonctionnement du radar."
@@ -28,54 +39,61 @@ def run_step(log, config: configuration.AppConfig, update_percentage=lambda x: N
     if config.mcp_manager is None:
         return_msg["infos"].append("Le gestionnaire MCP n'est pas initialisé.")
         return 1, return_msg
-    if config.daq_manager is None or config.daq_port is None:
+    if config.hardware is None or config.daq_manager is None or config.daq_port is None:
         return_msg["infos"].append("Le gestionnaire DAQ n'est pas initialisé.")
         return 1, return_msg
+    # Limits, dividers and channels are declared in the MEASUREMENTS table of the config file
+    specs = specs_for_step(config.measurement_specs, step_name)
+    if not specs:
+        return_msg["infos"].append(f"Aucune mesure analogique n'est configurée pour l'étape {step_name} (MEASUREMENTS).")
+        return 1, return_msg
     
-    config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_BTL, False)
-    config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_GND_IVE1_IVE2_IVF_2, False)
-    config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_AUTOMATIC_24V, True)
-    config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_AUTOMATIC_BTL, True)
-    config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_24V, True)
+    config.mcp_manager.write_pins({
+        configuration.MCP23017Pin.EN_BTL: False,
+        configuration.MCP23017Pin.EN_GND_IVE1_IVE2_IVF_2: False,
+        configuration.MCP23017Pin.EN_AUTOMATIC_24V: True,
+        configuration.MCP23017Pin.EN_AUTOMATIC_BTL: True,
+        configuration.MCP23017Pin.EN_24V: True,
+    })
 
     # Retry mechanism for serial communication and testing
     max_retries = 3
     retry_count = 0
     test_success = False
 
-    time.sleep(1)  # Small delay before starting the test loop
+    with config.cycle_timer.phase(PHASE_RELAY):
+        time.sleep(1)  # Small delay before starting the test loop
     
     while not test_success and retry_count < max_retries:        
         if retry_count > 0:
             log(f"Tentative {retry_count + 1}/{max_retries}", "yellow")
 
         try:
-            # Envoi de la commande "TEST"
+            # Envoi de la commande "TEST", les lignes de résultat sont lues au fil de l'eau
+            # et la lecture s'arrête au premier test échoué sans attendre READY
             command = "TEST"
-            answer = config.serDut.send_command_Cr(command, read_until="READY")
-            log(f"{command.strip()} envoyé, {answer} reçu", "blue")
-
-            response_lines = answer.strip().splitlines()
-
-            # Vérification que toutes les lignes de test se terminent par "OK"
-            # On ignore "TEST EN COURS" qui est juste un message d'information
-            test_failed = False
-            failed_tests = []
-            for line in response_lines:
-                # Ignorer les lignes qui ne sont pas des résultats de test
-                if line in ["TEST EN COURS", "READY"]:
-                    continue
-                # Vérifier que les lignes de test se terminent par "OK" et PAS par "NOK"
-                if line.startswith("TEST"):
-                    if not line.endswith("OK"):
-                        failed_tests.append(line)
-                        test_failed = True
+            progress = SelfTestProgress(config.self_tests, update_percentage, log, start=0, end=SELF_TEST_PERCENTAGE)
+            result = config.serDut.protocol.stream(command, until=READY, timeout=TEST_TIMEOUT_S, on_line=progress)
+            log(f"{command} envoyé, {len(result.tests)} résultat(s) reçu(s) en {result.elapsed:.1f} s", "blue")
+            config.save_value(step_name_id, "self_test_timing", {"attempt": retry_count + 1, **progress.timing()})
+            if not result.completed and not result.aborted:
+                raise serial.SerialException(f"READY non reçu après {result.elapsed:.1f} s")
+
+            # "TEST EN COURS" is not a result, every other TEST line must end with OK
+            failed_tests = [test.raw for test in result.failed]
+            if not failed_tests and progress.missing:
+                # READY received without every result of SELF_TESTS: the firmware skipped a sub-test
+                failed_tests = [f"{name} non reçu" for name in progress.missing]
+            test_failed = bool(failed_tests)
             
             if test_failed:
                 log(f"Tests échoués: {', '.join(failed_tests)}", "red")
                 retry_count += 1
                 
                 if retry_count < max_retries:
+                    if result.aborted:
+                        # The firmware finishes its self-test before the next TEST
+                        config.serDut.protocol.wait_for(READY, timeout=TEST_TIMEOUT_S)
                     retry_msg = configuration.request_user_input(
                         config,
                         "Tests échoués",
@@ -92,6 +110,10 @@ def run_step(log, config: configuration.AppConfig, update_percentage=lambda x: N
             else:
                 # Si on arrive ici, le test est réussi
                 test_success = True
+                if not config.self_tests:
+                    # Without SELF_TESTS in the config file, the next boards are tracked against this complete run
+                    config.self_tests = [test.name for test in result.tests]
+                update_percentage(SELF_TEST_PERCENTAGE)
                 
         except serial.SerialException as e:
             log(f"Erreur de communication: {e}", "red")
@@ -109,12 +131,6 @@ def run_step(log, config: configuration.AppConfig, update_percentage=lambda x: N
             else:
                 return_msg["infos"].append(f"Erreur de communication: {e}")
                 return 1, return_msg
-
-    # R1 = 12k ohm, R2 = 5.6k ohm, Vout = Vin * (R2 / (R1 + R2))
-    mult = 5.6/(5.6+12)
-    min = 23
-    max = 25.5
-    unit = "V"
     
     # Retry mechanism for AT voltage measurement
     max_retries_at = 3
@@ -125,35 +141,37 @@ def run_step(log, config: configuration.AppConfig, update_percentage=lambda x: N
         if retry_count_at > 0:
             log(f"Tentative de mesure AT {retry_count_at + 1}/{max_retries_at}", "yellow")
         
-        config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_GND_IVE1_IVE2_IVF_2, True)
-        time.sleep(0.2)  # Wait for voltages to stabilize
-        meas_at = config.daq_manager.read_a_line(config.daq_port, configuration.DAQPin.M_V_AT.value) / mult
-        log(f"AT mesuré : {meas_at:.3f} V, min={min}{unit}, max={max}{unit}", "blue")
-        id_skvp_at = config.save_value(step_name_id, "AT_V", meas_at, unit, min, max)
+        # The analog inputs are connected to this board while EN_GND_IVE1_IVE2_IVF_2 is on, the other slots wait for the DAQ
+        with arbiter.use(RESOURCE_DAQ):
+            config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_GND_IVE1_IVE2_IVF_2, True)
+            # Wait for voltages to stabilize (0.2 s max)
+            settle = config.hardware.wait_settled(tuple(spec.channel for spec in specs), max_wait=0.2)
+            config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_GND_IVE1_IVE2_IVF_2, False)
+        log(f"Tension AT {'stabilisée' if settle.settled else 'non stabilisée'} après {settle.elapsed * 1000:.0f} ms", "blue" if settle.settled else "yellow")
+        config.save_value(step_name_id, "AT_settle_time_s", settle.elapsed, "s")
+        verdicts = evaluate(specs, settle.stats)
+        for verdict in verdicts:
+            log(verdict.describe(), "blue")
+        save_verdicts(config, step_name_id, verdicts)
+        failures = [verdict.failure() for verdict in verdicts if not verdict.valid]
         
-        if (meas_at < min) or (meas_at > max):
-            config.db.update_by_id("skvp_float", id_skvp_at, {"valid": 0})
+        if failures:
             retry_count_at += 1
             
             if retry_count_at < max_retries_at:
                 retry_msg = configuration.request_user_input(
                     config,
                     "Mesure AT hors limites",
-                    f"AT mesuré à {meas_at:.3f} V hors des limites ({min}-{max} {unit}).\nTentative {retry_count_at}/{max_retries_at}.\nVoulez-vous réessayer ? (Appuyez sur Entrée pour continuer ou Annuler)"
+                    "\n".join(failures) + f"\nTentative {retry_count_at}/{max_retries_at}.\nVoulez-vous réessayer ? (Appuyez sur Entrée pour continuer ou Annuler)"
                 )
                 if retry_msg is None:
-                    config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_GND_IVE1_IVE2_IVF_2, False)
-                    return_msg["infos"].append(f"AT mesuré à {meas_at:.3f} V hors des limites ({min}-{max} {unit}).")
+                    return_msg["infos"].extend(failures)
                     return 1, return_msg
             else:
-                config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_GND_IVE1_IVE2_IVF_2, False)
-                return_msg["infos"].append(f"AT mesuré à {meas_at:.3f} V hors des limites ({min}-{max} {unit}).")
+                return_msg["infos"].extend(failures)
                 return 1, return_msg
         else:
-            config.db.update_by_id("skvp_float", id_skvp_at, {"valid": 1})
             at_measurement_success = True
-    
-    config.mcp_manager.digital_write(configuration.MCP23017Pin.EN_GND_IVE1_IVE2_IVF_2, False)   
 
     chaser = configuration.request_user_input(
         config,
@@ -170,6 +188,7 @@ def run_step(log, config: configuration.AppConfig, update_percentage=lambda x: N
     # TODO Mesure la tension des 3 leds rouges et verte AT pour supprimer le imput
     # TODO Mettre des charges sur les sorties des leds rouges (voit VSE) et mesurer le courant
     
+    update_percentage(100)
     return_msg["infos"].append("Étape OK")
     return 0, return_msg
 
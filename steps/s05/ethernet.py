@@ -6,7 +6,15 @@ if __name__ == "__main__":
     if BASE_DIR not in sys.path:
         sys.path.insert(0, BASE_DIR)
 import configuration  # Custom
-from modules.capsys_mysql_command.capsys_mysql_command import (GenericDatabaseManager, DatabaseConfig) # Custom
+from drivers import GenericDatabaseManager, DatabaseConfig  # Custom
+from step_timing import PHASE_SUBPROCESS  # Custom
+from simulators import simulation  # Custom
+from resource_arbiter import arbiter, RESOURCE_NETWORK  # Custom
+from step_scheduler import RESOURCE_DB  # Custom
+
+# Pings the DUT once s04 has set its supply, while s06 uses the serial port
+RESOURCES = (RESOURCE_DB, RESOURCE_NETWORK)
+REQUIRES = ("s04",)
 
 def get_info():
     return "Cette étape teste les seuils de fonctionnement du radar."
@@ -34,7 +42,14 @@ def run_step(log, config: configuration.AppConfig, update_percentage=lambda x: N
             # Tenter une connexion socket pour vérifier la connectivité
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             sock.settimeout(10)
-            result = os.system(f"ping -n 2 {dut_ip} > nul")
+            # The DUTs of all the slots answer on the same IP, one ping at a time
+            with config.cycle_timer.phase(PHASE_SUBPROCESS), arbiter.use(RESOURCE_NETWORK):
+                if simulation is not None:
+                    result = simulation.ping(dut_ip)
+                elif os.name == "nt":
+                    result = os.system(f"ping -n 2 {dut_ip} > nul")
+                else:
+                    result = os.system(f"ping -c 2 {dut_ip} > /dev/null")
             
             sock.close()
             
@@ -6,8 +6,13 @@ if __name__ == "__main__":
     if BASE_DIR not in sys.path:
         sys.path.insert(0, BASE_DIR)
 import configuration  # Custom
-from modules.capsys_mysql_command.capsys_mysql_command import (GenericDatabaseManager, DatabaseConfig) # Custom
-from modules.capsys_mac_manager.capsys_mac_manager import MACManager # Custom
+from drivers import GenericDatabaseManager, DatabaseConfig  # Custom
+from drivers import MACManager  # Custom
+from resource_arbiter import arbiter, RESOURCE_MAC_FILE  # Custom
+from step_scheduler import RESOURCE_DB, RESOURCE_SERIAL  # Custom
+
+RESOURCES = (RESOURCE_DB, RESOURCE_SERIAL)
+REQUIRES = ("s04",)
 
 def get_info():
     return "Cette étape teste les seuils de fonctionnement du radar."
@@ -29,9 +34,8 @@ def run_step(log, config: configuration.AppConfig, update_percentage=lambda x: N
 
     mac_pattern = re.compile(r'^([0-9A-Fa-f]{2}:){5}([0-9A-Fa-f]{2})$')
     
-    config.serDut.send_command("TEST MAC\r", timeout=1.0) # Initial flush
-    # Vérification si une adresse MAC existe déjà sur le DUT
-    response = config.serDut.send_command("TEST MAC\r", timeout=1.0)
+    # Vérification si une adresse MAC existe déjà sur le DUT (le tampon d'entrée est vidé avant la commande)
+    response = config.serDut.protocol.query("TEST MAC", timeout=1.0, line_ending="\r")
     
     # Si une adresse MAC valide existe déjà, on l'utilise
     existing_mac = None
@@ -47,7 +51,11 @@ def run_step(log, config: configuration.AppConfig, update_percentage=lambda x: N
         return 0, return_msg
     
     log("Aucune adresse MAC détectée sur le DUT, assignation d'une nouvelle adresse.", "blue")
-    
+    # The Excel file is held from the assignment to the save, two slots can't get the same address
+    with arbiter.use(RESOURCE_MAC_FILE):
+        return assign_mac_address(log, config, step_name_id, return_msg, mac_pattern)
+
+def assign_mac_address(log, config: configuration.AppConfig, step_name_id, return_msg, mac_pattern):
     path = config.configItems.mac_adress_file.path
     mac_address = ""
     manager = None
@@ -92,7 +100,7 @@ def run_step(log, config: configuration.AppConfig, update_percentage=lambda x: N
         return 1, return_msg
     
     # Configuration de l'adresse MAC sur le DUT
-    response = config.serDut.send_command_Cr(f"TEST MAC={mac_address['mac_address']}", timeout=1.0)
+    response = config.serDut.protocol.query(f"TEST MAC={mac_address['mac_address']}", timeout=1.0)
     if "OK" not in response:
         if manager:
             manager.close()
@@ -100,7 +108,7 @@ def run_step(log, config: configuration.AppConfig, update_percentage=lambda x: N
         return 1, return_msg
 
     # Vérification de l'adresse MAC sur le DUT
-    response = config.serDut.send_command("TEST MAC\r", timeout=1.0)
+    response = config.serDut.protocol.query("TEST MAC", timeout=1.0, line_ending="\r")
     if mac_address['mac_address'] not in response:
         if manager:
             manager.close()
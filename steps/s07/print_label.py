@@ -6,7 +6,13 @@ if __name__ == "__main__":
     if BASE_DIR not in sys.path:
         sys.path.insert(0, BASE_DIR)
 import configuration  # Custom
-from modules.capsys_mysql_command.capsys_mysql_command import (GenericDatabaseManager, DatabaseConfig) # Custom
+from drivers import GenericDatabaseManager, DatabaseConfig  # Custom
+from resource_arbiter import arbiter, RESOURCE_PRINTER  # Custom
+from step_scheduler import RESOURCE_DB  # Custom
+
+# The label is printed only once every test step passed
+RESOURCES = (RESOURCE_DB, RESOURCE_PRINTER)
+REQUIRES = ("s04", "s05", "s06")
 
 def get_info():
     return "Cette étape teste les seuils de fonctionnement du radar."
@@ -27,7 +33,8 @@ def run_step(log, config: configuration.AppConfig, update_percentage=lambda x: N
     
     date = datetime.datetime.now().strftime("%Y-%m-%d")
     messages = ["CAPSYS", date, f"ID: {config.device_under_test_id}", config.arg.article + config.arg.indice, configuration.HASH_GIT]
-    config.brady_printer.print_label(messages, qrcode=config.device_under_test_id, nb_copies=1)
+    with arbiter.use(RESOURCE_PRINTER):
+        config.brady_printer.print_label(messages, qrcode=config.device_under_test_id, nb_copies=1)
     jsonMessages = json.dumps(messages, ensure_ascii=False)
     config.save_value(step_name_id, "label_printed", jsonMessages, valid=1)
 
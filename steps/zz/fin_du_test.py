@@ -5,7 +5,7 @@ if __name__ == "__main__":
     if BASE_DIR not in sys.path:
         sys.path.insert(0, BASE_DIR)
 import configuration  # Custom
-from modules.capsys_mysql_command.capsys_mysql_command import (GenericDatabaseManager, DatabaseConfig) # Custom
+from drivers import GenericDatabaseManager, DatabaseConfig  # Custom
 from configuration import get_project_path
 
 def get_info():
@@ -22,38 +22,37 @@ def run_step(log, config: configuration.AppConfig, update_percentage=lambda x: N
     config.db.create("step_name", {"device_under_test_id": config.device_under_test_id, "step_name": step_name})
     success = 0
 
-    # delete config.json file
+    # Write the measurements still queued in the write-behind sink
+    try:
+        nb_rows = config.flush_values()
+        log(f"{nb_rows} mesure(s) enregistrée(s) en base.", "blue")
+    except Exception as e:
+        log(f"Erreur lors de l'enregistrement des mesures, elles restent dans le journal local : {e}", "yellow")
+        success = 2
+
+    # config.json is now parsed in memory by the initialisation, only remove a file left by an older version
     config_file_path = get_project_path("config.json")
     if os.path.exists(config_file_path):
         os.remove(config_file_path)
-        log("Fichier config.json supprimé.", "blue")
-    else:
-        log("Problème lors de la suppression du fichier config.json.", "yellow")
-        success = 2
+        log("Ancien fichier config.json supprimé.", "blue")
         
-    # Close serial port if open
-    if hasattr(config, 'serDut') and config.serDut is not None and config.serDut.is_connected():
-        try:
-            config.serDut.close()
-            log("Port série fermé.", "blue")
-        except Exception as e:
-            log(f"Erreur lors de la fermeture du port série : {e}", "yellow")
-            success = 2
+    # The serial port stays in the pool, it is closed by AppConfig.cleanup() or when s02 powers off the DUT
+    # for the programming: it is only reused by the next board when the programming is skipped
+    if hasattr(config, 'serDut') and config.serDut is not None:
+        config.serDut = None
+        log("Port série laissé ouvert (réutilisé si la programmation de la carte suivante est sautée).", "blue")
 
     # Close mcp23017
     if config.mcp_manager is None:
         success = 2
         log("Le MCP23017 n'avait pas été initialisé.", "yellow")
     else:
-        for pin in configuration.MCP23017Pin:
-            config.mcp_manager.digital_write(pin, False)
+        config.mcp_manager.write_pins({pin: False for pin in configuration.MCP23017Pin})
         log("Le MCP23017 a été réinitialisé.", "blue")
     
-    # Close daq
+    # The DAQ stays open in the hardware session for the next board, it is closed by AppConfig.cleanup()
     if config.daq_port == None or config.daq_manager == None:
         return 2, "Le DAQ n'avait pas été initialisé."
-    else:
-        pass
 
     if success == 0:
         return_msg["infos"].append("Nettoyage effectué avec succès.")
@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""
+Programmation des images du DUT avec STM32_Programmer_CLI.
+
+La commande est lancée sans bloquer l'étape : sa sortie est lue au fil de l'eau (la barre de progression
+est réécrite avec des CR), le pourcentage affiché par le CLI fait avancer celui de l'étape, stdout et
+stderr sont gardés pour la base et la commande est arrêtée après un temps maximum.
+Les images de sondes différentes (port=usb1, port=usb2...) sont programmées en même temps,
+celles d'une même sonde l'une après l'autre.
+
+Avant l'écriture d'un .hex, la flash de la cible est relue (-u) sur les plages d'adresses de l'image :
+si son empreinte SHA-256 est celle du fichier, la carte porte déjà l'image et l'écriture est sautée.
+"""
+
+import os, re, time, hashlib, tempfile, threading, subprocess
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+from serial_protocol import LineReader  # Custom
+from simulators import simulation  # Custom
+
+PROGRAMMER_TIMEOUT_S = 120  # Maximum duration of one image (erase, write and verify)
+READ_BACK_TIMEOUT_S = 60  # Maximum duration of the read back of the flash
+OUTPUT_MAX_LINES = 200  # Lines of output kept for the database, the last ones
+_PROGRESS = re.compile(r"(\d{1,3})\s*%\s*$")
+
+@dataclass
+class ProgrammerJob:
+    """One image written by one probe."""
+    cli: str  # Path of STM32_Programmer_CLI
+    port: str  # Probe, e.g. "usb1"
+    image: str  # .hex, .bin or .elf file
+    label: str = ""  # e.g. "Application", used in the logs and the database keys
+    commands: Optional[list[str]] = None  # CLI commands after the connection, "-w image" by default
+
+    @property
+    def cmd(self) -> list[str]:
+        return [self.cli, "-c", f"port={self.port}"] + (self.commands or ["-w", self.image])
+
+@dataclass
+class ProgrammerResult:
+    """Output and return code of one programming."""
+    job: ProgrammerJob
+    returncode: Optional[int] = None  # None if the command was stopped by the timeout or couldn't start
+    stdout: list[str] = field(default_factory=list)
+    stderr: list[str] = field(default_factory=list)
+    percent: int = 0  # Last percentage shown by the CLI
+    elapsed: float = 0.0
+    timed_out: bool = False
+    error: str = ""  # Command that couldn't be started
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0
+
+    def describe(self) -> str:
+        if self.error:
+            return f"Programmation {self.job.label} ({self.job.port}) impossible : {self.error}"
+        if self.timed_out:
+            return f"Programmation {self.job.label} ({self.job.port}) arrêtée après {self.elapsed:.0f} s"
+        return f"Programmation {self.job.label} ({self.job.port}) - returncode={self.returncode} en {self.elapsed:.1f} s"
+
+    def to_dict(self) -> dict:
+        """Summary saved in skvp_json, without the progress bar lines."""
+        return {
+            "cmd": " ".join(self.job.cmd),
+            "port": self.job.port,
+            "returncode": self.returncode,
+            "elapsed_s": round(self.elapsed, 3),
+            "timed_out": self.timed_out,
+            "error": self.error,
+            "stdout": [line for line in self.stdout if not _PROGRESS.search(line)][-OUTPUT_MAX_LINES:],
+            "stderr": self.stderr[-OUTPUT_MAX_LINES:],
+        }
+
+def parse_progress(line: str) -> Optional[int]:
+    """Percentage of a progress bar line of the CLI (e.g. "  ██████████ 45%"), None for the other lines."""
+    match = _PROGRESS.search(line)
+    if match is None:
+        return None
+    return min(int(match.group(1)), 100)
+
+def _read_lines(stream, on_line: Callable[[str], None]):
+    """Read a pipe until it is closed, every line (CR or LF terminated) is passed to on_line."""
+    reader = LineReader()
+    while True:
+        data = stream.read1(4096)
+        if not data:
+            break
+        for line in reader.feed(data):
+            on_line(line)
+    for line in reader.feed(b"\n"):
+        on_line(line)
+
+def run_job(job: ProgrammerJob, timeout: float = PROGRAMMER_TIMEOUT_S,
+            on_progress: Callable[[int], None] = lambda x: None,
+            on_line: Optional[Callable[[str], None]] = None) -> ProgrammerResult:
+    """Run the CLI of a job, its progress is passed to on_progress (0 to 100) while it runs."""
+    result = ProgrammerResult(job)
+
+    def stdout_line(line: str):
+        result.stdout.append(line)
+        percent = parse_progress(line)
+        if percent is not None:
+            if percent != result.percent:
+                result.percent = percent
+                on_progress(percent)
+        elif on_line is not None:
+            on_line(line)
+
+    start = time.perf_counter()
+    if simulation is not None:
+        completed = simulation.run_programmer(job.cmd, stdout_line)
+        result.returncode = completed.returncode
+        result.stderr = completed.stderr.splitlines()
+        result.elapsed = time.perf_counter() - start
+        return result
+    try:
+        process = subprocess.Popen(
+            job.cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            creationflags=subprocess.CREATE_NO_WINDOW if os.name == "nt" else 0,
+        )
+    except OSError as e:
+        result.error = str(e)
+        return result
+    readers = [
+        threading.Thread(target=_read_lines, args=(process.stdout, stdout_line), daemon=True),
+        threading.Thread(target=_read_lines, args=(process.stderr, result.stderr.append), daemon=True),
+    ]
+    for reader in readers:
+        reader.start()
+    try:
+        result.returncode = process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+        result.timed_out = True
+    for reader in readers:
+        reader.join()
+    result.elapsed = time.perf_counter() - start
+    return result
+
+def program_all(jobs: list[ProgrammerJob], timeout: float = PROGRAMMER_TIMEOUT_S,
+                on_progress: Callable[[int], None] = lambda x: None,
+                on_line: Optional[Callable[[str], None]] = None) -> list[ProgrammerResult]:
+    """
+    Program the jobs, one thread per probe: the probes work at the same time, the images of a probe
+    are written in order and the next ones are not written after a failure.
+    on_progress receives the overall percentage. The results are returned in the order of jobs,
+    the jobs not run after a failure of their probe have no result.
+    """
+    percents = [0] * len(jobs)
+    results: list[Optional[ProgrammerResult]] = [None] * len(jobs)
+    lock = threading.Lock()
+
+    def job_progress(idx: int, percent: int):
+        with lock:
+            percents[idx] = percent
+            overall = sum(percents) // len(jobs)
+        on_progress(overall)
+
+    def run_probe(indexes: list[int]):
+        for idx in indexes:
+            results[idx] = run_job(jobs[idx], timeout, lambda percent, idx=idx: job_progress(idx, percent), on_line)
+            if not results[idx].ok:
+                return
+            job_progress(idx, 100)
+
+    probes: dict[str, list[int]] = {}
+    for idx, job in enumerate(jobs):
+        probes.setdefault(job.port, []).append(idx)
+    with ThreadPoolExecutor(max_workers=max(len(probes), 1), thread_name_prefix="stm32") as executor:
+        for future in [executor.submit(run_probe, indexes) for indexes in probes.values()]:
+            future.result()
+    return [result for result in results if result is not None]
+
+@dataclass
+class ImageDigest:
+    """Address ranges and SHA-256 of the data of a .hex image."""
+    path: str
+    segments: list[tuple[int, int]]  # (address, size) of the contiguous data
+    sha256: str
+
+def parse_hex(path: str) -> list[tuple[int, bytes]]:
+    """
+    Contiguous data segments (address, data) of an Intel HEX file.
+
+    Raises:
+        OSError: if the file can't be read.
+        ValueError: if a record is invalid.
+    """
+    segments: list[tuple[int, bytearray]] = []
+    base = 0
+    with open(path, "r", encoding="ascii") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                if not line.startswith(":"):
+                    raise ValueError
+                record = bytes.fromhex(line[1:])
+                size, address, kind = record[0], int.from_bytes(record[1:3], "big"), record[3]
+                if len(record) != size + 5 or sum(record) & 0xFF:
+                    raise ValueError
+            except ValueError:
+                raise ValueError(f"Ligne {number} invalide dans le fichier {path}.")
+            data = record[4:4 + size]
+            if kind == 0x00:
+                address += base
+                if segments and segments[-1][0] + len(segments[-1][1]) == address:
+                    segments[-1][1].extend(data)
+                else:
+                    segments.append((address, bytearray(data)))
+            elif kind == 0x01:
+                break
+            elif kind == 0x02:
+                base = int.from_bytes(data, "big") << 4
+            elif kind == 0x04:
+                base = int.from_bytes(data, "big") << 16
+    return [(address, bytes(data)) for address, data in segments]
+
+def segments_sha256(segments: list[tuple[int, bytes]]) -> str:
+    """SHA-256 of the data and addresses of segments, the same for the file and the read back flash."""
+    digest = hashlib.sha256()
+    for address, data in sorted(segments):
+        digest.update(address.to_bytes(4, "big"))
+        digest.update(len(data).to_bytes(4, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+def image_digest(path: str, cache: dict) -> Optional[ImageDigest]:
+    """
+    Digest of a .hex image, computed once per session: cache (AppConfig.image_digests) is keyed
+    by the path, size and modification date of the file. None for the other formats.
+
+    Raises:
+        OSError: if the file can't be read.
+        ValueError: if the file is not a valid Intel HEX file.
+    """
+    if not path.lower().endswith(".hex"):
+        return None
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+    if key not in cache:
+        segments = parse_hex(path)
+        cache[key] = ImageDigest(path, [(address, len(data)) for address, data in segments], segments_sha256(segments))
+    return cache[key]
+
+def flash_sha256(job: ProgrammerJob, digest: ImageDigest, timeout: float = READ_BACK_TIMEOUT_S) -> tuple[Optional[str], ProgrammerResult]:
+    """SHA-256 of the flash of the target of job over the segments of digest (read back with -u), None if it couldn't be read."""
+    with tempfile.TemporaryDirectory(prefix="stm32_read_") as folder:
+        files = [os.path.join(folder, f"{address:08X}.bin") for address, _ in digest.segments]
+        commands = []
+        for (address, size), path in zip(digest.segments, files):
+            commands += ["-u", f"0x{address:08X}", str(size), path]
+        result = run_job(ProgrammerJob(job.cli, job.port, job.image, job.label, commands), timeout)
+        if not result.ok:
+            return None, result
+        try:
+            segments = []
+            for (address, _), path in zip(digest.segments, files):
+                with open(path, "rb") as f:
+                    segments.append((address, f.read()))
+        except OSError:
+            return None, result
+        return segments_sha256(segments), result
+
+if __name__ == "__main__":
+    """Check the parsing of the CLI output and of a generated Intel HEX file (no probe needed)."""
+
+    def record(address: int, kind: int, data: bytes) -> str:
+        body = bytes([len(data), address >> 8, address & 0xFF, kind]) + data
+        return ":" + (body + bytes([-sum(body) & 0xFF])).hex().upper()
+
+    lines = [
+        record(0x0000, 0x04, bytes([0x08, 0x00])),  # Base address 0x08000000
+        record(0x0000, 0x00, bytes(range(16))),
+        record(0x0010, 0x00, bytes(range(16, 20))),  # Contiguous: same segment
+        record(0x0100, 0x00, b"\xAA\x55"),  # Gap: new segment
+        record(0x0000, 0x01, b""),
+    ]
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "image.hex")
+        with open(path, "w", encoding="ascii") as f:
+            f.write("\n".join(lines) + "\n")
+        segments = parse_hex(path)
+        assert segments == [(0x08000000, bytes(range(20))), (0x08000100, b"\xAA\x55")], segments
+        assert segments_sha256(segments) == segments_sha256(list(reversed(segments)))
+        with open(path, "w", encoding="ascii") as f:
+            f.write(lines[1][:-2] + "00\n")  # Wrong checksum
+        try:
+            parse_hex(path)
+            raise AssertionError("invalid checksum accepted")
+        except ValueError as e:
+            print(e)
+    assert parse_progress("  ██████████ 45%") == 45 and parse_progress("  ██████████ 100 %") == 100
+    assert parse_progress("Erasing memory") is None and parse_progress("Erasing 120%") == 100
+    print(f"parse_progress et parse_hex OK : {len(segments)} segments")